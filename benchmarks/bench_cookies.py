@@ -0,0 +1,93 @@
+"""
+Measures loading and saving the IdP's cookies from each cookie store.
+
+Usage::
+
+    python benchmarks/bench_cookies.py [--iterations N]
+
+Jars are built with the IdP's session cookies and more and more
+cookies for other domains. The lwp store reads and writes every
+cookie, while the sqlite store only reads and replaces those of the
+IdP contacted.
+"""
+import argparse
+import json
+import sys
+
+from http.cookiejar import Cookie, LWPCookieJar
+from os import path
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)),
+                             '..', 'src'))
+
+from awscli_login.cookies import cookie_jar  # noqa: E402
+
+URL = 'https://idp.example.com/idp/profile/SAML2/SOAP/ECP'
+SIZES = [0, 100, 10000]
+
+
+def cookie(domain: str, name: str) -> Cookie:
+    return Cookie(0, name, 'x' * 64, None, False, domain, False, False,
+                  '/', True, True, None, True, None, None, {})
+
+
+def build(filename: str, others: int) -> None:
+    """ Writes a jar with the IdP's cookies and others for other hosts. """
+    jar = LWPCookieJar(filename)
+    jar.set_cookie(cookie('idp.example.com', 'shib_idp_session'))
+    jar.set_cookie(cookie('idp.example.com', 'JSESSIONID'))
+    for i in range(others):
+        jar.set_cookie(cookie('host%d.example.org' % i, 'session'))
+    jar.save(ignore_discard=True)
+
+
+def timeit(func, iterations: int) -> float:
+    """ Returns the median time of a call in milliseconds. """
+    func()  # Warm up
+
+    times = []
+    for _ in range(iterations):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+
+    return median(times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    results = {}
+    with TemporaryDirectory() as tmp:
+        for others in SIZES:
+            results[others] = {}
+            base = path.join(tmp, 'user%d' % others)
+            build(base + '.txt', others)
+
+            for store in ('.txt', '.db'):
+                def load():
+                    jar = cookie_jar(base + store, URL)
+                    jar.load(ignore_discard=True)
+                    return jar
+
+                jar = load()  # Migrates the text jar
+
+                def save():
+                    jar.save(ignore_discard=True)
+
+                name = 'lwp' if store == '.txt' else 'sqlite'
+                results[others][name + '_load_ms'] = round(
+                    timeit(load, args.iterations), 3)
+                results[others][name + '_save_ms'] = round(
+                    timeit(save, args.iterations), 3)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
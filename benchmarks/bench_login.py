@@ -0,0 +1,232 @@
+"""
+Measures the phases of aws login and of a refresh cycle against a
+local TLS stub IdP and a stubbed STS.
+
+Usage::
+
+    python benchmarks/bench_login.py [--iterations N] [--output FILE]
+
+The phases timed are:
+
+- profile: loading the login profile from ~/.aws-login/config.
+- authn_request: generating the ECP AuthnRequest.
+- idp_post: posting the AuthnRequest to the IdP over a kept-alive
+  connection, including checking the response for success.
+- parse_soap_response: extracting the assertion and roles.
+- assume_role_with_saml: one STS call through botocore, answered by
+  a Stubber so no request leaves the machine.
+- save_credentials: writing ~/.aws/credentials.
+- refresh: a whole refresh cycle as the supervisor runs it.
+
+The cold import time of the plugin and of the login command are
+measured in fresh interpreters with -X importtime. Results are
+written as JSON so they may be compared between releases.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from datetime import datetime, timedelta, timezone
+from http.cookiejar import LWPCookieJar
+from os import path
+from statistics import median, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List
+
+SRC = path.join(path.dirname(path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from botocore.session import Session  # noqa: E402
+from botocore.stub import Stubber  # noqa: E402
+
+from awscli_login import sts  # noqa: E402
+from awscli_login.config import Profile  # noqa: E402
+from awscli_login.saml import (  # noqa: E402
+    authn_request,
+    parse_soap_response,
+    refresh,
+    saml_login,
+)
+from awscli_login.transport import close_all  # noqa: E402
+from awscli_login.util import save_credentials  # noqa: E402
+from tests.stub_idp import CA, SAML_SUCCESS, StubIdP  # noqa: E402
+from tests.test_plugin import parse_importtime  # noqa: E402
+
+NAME = 'bench'
+REGION = 'us-east-1'
+IMPORTS = ['awscli_login', 'awscli_login.__main__']
+
+CONFIG = """
+[%s]
+ecp_endpoint_url = %s
+username = user
+"""
+
+
+def version() -> str:
+    """ Returns the commit benchmarked. """
+    proc = subprocess.run(
+        ['git', 'describe', '--always', '--dirty'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+        cwd=SRC,
+    )
+    return proc.stdout.strip() or 'unknown'
+
+
+def stats(times: List[float]) -> Dict[str, float]:
+    """ Summarizes a list of times in seconds as milliseconds. """
+    ms = sorted(t * 1000 for t in times)
+    p90 = quantiles(ms, n=10)[-1] if len(ms) > 1 else ms[0]
+
+    return {
+        'median_ms': round(median(ms), 3),
+        'p90_ms': round(p90, 3),
+        'min_ms': round(ms[0], 3),
+    }
+
+
+def timeit(func: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """ Times a call after warming it up. """
+    func()
+
+    times = []
+    for _ in range(iterations):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+
+    return stats(times)
+
+
+def import_times(iterations: int) -> Dict[str, Dict[str, float]]:
+    """ Measures the cold import time of each module in IMPORTS. """
+    env = dict(os.environ, PYTHONPATH=SRC)
+    results = {}
+
+    for module in IMPORTS:
+        times = []
+        for _ in range(iterations):
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c',
+                 'import ' + module],
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                env=env,
+                check=True,
+            )
+            parsed = parse_importtime(proc.stderr)
+            times.append(sum(us for name, us in parsed.items()
+                             if name.split('.')[0] == 'awscli_login') / 1e6)
+        results[module] = stats(times)
+
+    return results
+
+
+def stub_sts(client, count: int) -> Stubber:
+    """ Queues count AssumeRoleWithSAML responses on a client. """
+    creds = {
+        'AccessKeyId': 'ASIAEXAMPLEEXAMPLE',
+        'SecretAccessKey': 'secret',
+        'SessionToken': 'token',
+        'Expiration': datetime.now(timezone.utc) + timedelta(hours=1),
+    }
+    stub = Stubber(client)
+    for _ in range(count):
+        stub.add_response('assume_role_with_saml', {'Credentials': creds})
+
+    stub.activate()
+
+    return stub
+
+
+def phases(idp: StubIdP, home: str, iterations: int) \
+           -> Dict[str, Dict[str, float]]:
+    """ Times each phase of a login and of a refresh. """
+    session = Session(profile=NAME)
+    profile = Profile(session, None)
+    jar = LWPCookieJar(path.join(home, 'cookies.txt'))
+    jar.save()
+
+    saml, roles = parse_soap_response(SAML_SUCCESS)
+    role = roles[0]
+    client = sts.get_client(REGION)
+    stub = stub_sts(client, 2 * (iterations + 1) + 1)
+
+    def assume():
+        return client.assume_role_with_saml(
+            RoleArn=role[1],
+            PrincipalArn=role[0],
+            SAMLAssertion=saml,
+        )
+
+    token = assume()
+
+    def cycle():
+        refresh(profile.ecp_endpoint_url, jar.filename)
+        save_credentials(session, assume())
+
+    results = {
+        'profile': timeit(lambda: Profile(session, None), iterations),
+        'authn_request': timeit(authn_request, iterations),
+        'idp_post': timeit(lambda: saml_login(idp.url, jar), iterations),
+        'parse_soap_response': timeit(
+            lambda: parse_soap_response(SAML_SUCCESS), iterations),
+        'assume_role_with_saml': timeit(assume, iterations),
+        'save_credentials': timeit(
+            lambda: save_credentials(session, token), iterations),
+        'refresh': timeit(cycle, iterations),
+    }
+    stub.deactivate()
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--imports', type=int, default=5,
+                        help='fresh interpreters per import measured')
+    parser.add_argument('--output', help='file to write, default stdout')
+    args = parser.parse_args()
+
+    idp = StubIdP().start()
+
+    with TemporaryDirectory() as home:
+        os.environ.update({
+            'HOME': home,
+            'AWS_CONFIG_FILE': path.join(home, 'config'),
+            'AWS_SHARED_CREDENTIALS_FILE': path.join(home, 'credentials'),
+            'REQUESTS_CA_BUNDLE': CA,
+        })
+        os.makedirs(path.join(home, '.aws-login'))
+        with open(path.join(home, '.aws-login', 'config'), 'w') as f:
+            f.write(CONFIG % (NAME, idp.url))
+
+        results = {
+            'version': version(),
+            'python': platform.python_version(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'iterations': args.iterations,
+            'phases': phases(idp, home, args.iterations),
+            'imports': import_times(args.imports),
+        }
+
+        close_all()
+        idp.stop()
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
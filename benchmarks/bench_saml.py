@@ -0,0 +1,137 @@
+"""
+Measures parsing an IdP's SAML response in one pass against parsing
+it twice and re-serializing the Response element, as saml_login and
+parse_soap_response used to do.
+
+Usage::
+
+    python benchmarks/bench_saml.py [--iterations N]
+
+Responses are built from tests/data/success.xml with more and more
+role attribute values, as large signed responses from IdPs granting
+many roles have. The parts of a parse are also timed on their own:
+
+- fromstring/parse_xml: lxml's default parser against the hardened
+  parser used for IdP responses.
+- elementpath/xpath: the queries for the status, assertion and roles
+  as ElementPath strings against precompiled XPath objects.
+"""
+import argparse
+import json
+import sys
+
+from base64 import b64encode
+from os import path
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)),
+                             '..', 'src'))
+
+import lxml.etree as ET  # noqa: E402
+
+from awscli_login.saml import (  # noqa: E402
+    SAML_SUCCESS,
+    _ASSERTION,
+    _RESPONSE,
+    _ROLES,
+    _STATUS,
+    ns,
+    parse_role_arns,
+    parse_saml_response,
+    parse_xml,
+)
+from tests.stub_idp import SAML_SUCCESS as RESPONSE  # noqa: E402
+
+SIZES = [10, 1000, 10000]
+
+ROLE = (b'<saml2:AttributeValue xmlns:xsi="http://www.w3.org/2001/'
+        b'XMLSchema-instance" xsi:type="xsd:string">arn:aws:iam::'
+        b'%012d:saml-provider/idp,arn:aws:iam::%012d:role/Role%d'
+        b'</saml2:AttributeValue>')
+ANCHOR = b'role/TestShibAdmin</saml2:AttributeValue>'
+
+
+def response(roles: int) -> bytes:
+    """ Returns a successful response granting roles roles. """
+    extra = b''.join(ROLE % (i, i, i) for i in range(1, roles))
+    return RESPONSE.replace(ANCHOR, ANCHOR + extra)
+
+
+def two_pass(soap: bytes) -> None:
+    """ The former pipeline: check the status, then parse again. """
+    xml = ET.fromstring(soap)
+    elem = xml.find('S:Body/saml2p:Response/saml2p:Status' +
+                    '/saml2p:StatusCode' +
+                    '[@Value="' + SAML_SUCCESS + '"]', ns)
+    assert elem is not None
+
+    body = ET.fromstring(soap)
+    resp = body.find('S:Body/saml2p:Response', ns)
+    roles = resp.findall("saml2:Assertion/" +
+                         "saml2:AttributeStatement/saml2:Attribute[@Name=" +
+                         "'https://aws.amazon.com/SAML/Attributes/Role']/" +
+                         "saml2:AttributeValue", ns)
+    b64encode(ET.tostring(resp)).decode("us-ascii"), parse_role_arns(roles)
+
+
+def one_pass(soap: bytes) -> None:
+    assert parse_saml_response(soap).succeeded
+
+
+def elementpath(root) -> None:
+    resp = root.find('S:Body/saml2p:Response', ns)
+    resp.find('saml2p:Status/saml2p:StatusCode', ns).get('Value')
+    resp.find('saml2:Assertion', ns).findall(
+        "saml2:AttributeStatement/saml2:Attribute" +
+        "[@Name='https://aws.amazon.com/SAML/" +
+        "Attributes/Role']/saml2:AttributeValue", ns)
+
+
+def xpath(root) -> None:
+    resp = _RESPONSE(root)[0]
+    _STATUS(resp)
+    _ROLES(_ASSERTION(resp)[0])
+
+
+def timeit(func, arg, iterations: int) -> float:
+    """ Returns the median time of a call in milliseconds. """
+    func(arg)  # Warm up
+
+    times = []
+    for _ in range(iterations):
+        start = perf_counter()
+        func(arg)
+        times.append(perf_counter() - start)
+
+    return median(times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    results = {}
+    for roles in SIZES:
+        soap = response(roles)
+        root = parse_xml(soap)
+        cases = [
+            ('two_pass', two_pass, soap),
+            ('one_pass', one_pass, soap),
+            ('fromstring', ET.fromstring, soap),
+            ('parse_xml', parse_xml, soap),
+            ('elementpath', elementpath, root),
+            ('xpath', xpath, root),
+        ]
+
+        results[roles] = {'bytes': len(soap)}
+        for name, func, arg in cases:
+            ms = timeit(func, arg, args.iterations)
+            results[roles][name + '_ms'] = round(ms, 3)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
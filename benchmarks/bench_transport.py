@@ -0,0 +1,93 @@
+"""
+Measures the cost of IdP round trips with and without the pooled
+transport, against a local TLS stub IdP.
+
+Usage::
+
+    python benchmarks/bench_transport.py [--iterations N]
+
+Three cases are timed:
+
+- cold: a new requests.Session and connection for every call, as
+  saml_login used to do (DNS + TCP + full TLS handshake each time).
+- resumed: the pooled transport after the IdP dropped the idle
+  connection (TCP + abbreviated TLS handshake).
+- pooled: the pooled transport over a kept-alive connection.
+"""
+import argparse
+import json
+import os
+import sys
+
+from os import path
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)),
+                             '..', 'src'))
+
+import requests  # noqa: E402
+
+from awscli_login.transport import close_all, get_transport  # noqa: E402
+from tests.stub_idp import CA, StubIdP  # noqa: E402
+
+BODY = b'<S:Envelope/>'
+
+
+def cold(url: str) -> None:
+    s = requests.Session()
+    s.post(url, data=BODY).raise_for_status()
+    s.close()
+
+
+def pooled(url: str) -> None:
+    s = get_transport(url).mount(requests.Session())
+    s.post(url, data=BODY).raise_for_status()
+
+
+def resumed(idp: StubIdP):
+    def call(url: str) -> None:
+        idp.drop_connections()
+        pooled(url)
+    return call
+
+
+def timeit(func, url: str, iterations: int) -> float:
+    """ Returns the median time of a call in milliseconds. """
+    func(url)  # Warm up
+
+    times = []
+    for _ in range(iterations):
+        start = perf_counter()
+        func(url)
+        times.append(perf_counter() - start)
+
+    return median(times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ['REQUESTS_CA_BUNDLE'] = CA
+    idp = StubIdP().start()
+
+    results = {}
+    for name, func in [('cold', cold), ('resumed', resumed(idp)),
+                       ('pooled', pooled)]:
+        close_all()
+        before = (idp.connections, idp.handshakes, idp.resumed)
+        results[name] = {
+            'median_ms': round(timeit(func, idp.url, args.iterations), 3),
+            'connections': idp.connections - before[0],
+            'handshakes': idp.handshakes - before[1],
+            'resumed': idp.resumed - before[2],
+        }
+
+    idp.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,12 @@ setup(
             'sphinx-autodoc-typehints',
         ],
     },
+    entry_points={
+        'console_scripts': [
+            'aws-login-credential-process='
+            'awscli_login.credential_process:main',
+        ],
+    },
     test_suite="tests",
     project_urls={
         'Bug Reports':
@@ -3,99 +3,243 @@ import logging
 import traceback
 
 from argparse import Namespace
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from os import listdir, path
+from time import sleep, time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-import boto3
-
+from botocore.exceptions import ClientError
 from botocore.session import Session
-from daemoniker import Daemonizer, SignalHandler1
+from daemoniker import Daemonizer
 from daemoniker import send, SIGINT, SIGTERM, SIGABRT
 
+from awscli_login import (
+    assertion,
+    cache,
+    idp_session,
+    roles,
+    sts,
+    supervisor,
+)
 from awscli_login.config import (
     Profile,
     ERROR_NONE,
     ERROR_UNKNOWN,
 )
-from awscli_login.exceptions import AlreadyLoggedOut, AWSCLILogin
+from awscli_login.const import CONFIG_DIR
+from awscli_login.exceptions import (
+    AlreadyLoggedIn,
+    AlreadyLoggedOut,
+    AWSCLILogin,
+    SupervisorError,
+)
 from awscli_login.logger import (
     configConsoleLogger,
     configFileLogger,
 )
+from awscli_login.roles import (
+    assume_roles,
+    map_roles,
+    parse_role_profiles,
+    primary,
+)
 from awscli_login.saml import (
+    SamlResponse,
     authenticate,
     refresh,
 )
+from awscli_login.selector import parse_account_aliases
+from awscli_login.server import (
+    LOCALHOST,
+    new_token,
+    save_token,
+)
+from awscli_login.supervisor import Registration, Supervisor
+from awscli_login.transport import close_all
 from awscli_login.util import (
+    clear_credentials,
+    get_credentials_file,
     get_selection,
-    nap,
     remove_credentials,
     save_credentials,
 )
 from awscli_login.typing import Role
 
+LOGOUT_TIMEOUT = 5  # in seconds
+LOGOUT_WORKERS = 8
+
 logger = logging.getLogger(__package__)
 
 
-def save_sts_token(session: Session, client, saml: str,
-                   role: Role) -> datetime:
-    token = client.assume_role_with_saml(
-        RoleArn=role[1],
-        PrincipalArn=role[0],
-        SAMLAssertion=saml,
-    )
+def save_sts_token(profile: Profile, session: Session, client, saml: str,
+                   role: Role, duration: Optional[int] = None) \
+                   -> Dict[str, Any]:
+    """ Assumes a role and saves the STS credentials. Returns the
+        Credentials dict returned by STS. """
+    token = sts.assume_role_with_saml(client, role, saml, duration)
     logger.info("Retrieved temporary Amazon credentials for role: " + role[1])
 
-    return save_credentials(session, token)
+    save_credentials(session, token)
+    cache.save(profile.credential_cache, token['Credentials'], role)
+
+    return token['Credentials']
+
 
+def save_sts_tokens(profile: Profile, session: Session, client, saml: str,
+                    targets: Dict[str, Role],
+                    duration: Optional[int] = None) -> Dict[str, Any]:
+    """ Assumes many roles concurrently and saves the STS credentials of
+        every profile in one pass. Returns the Credentials dict of the
+        primary profile. """
+    results, errors = assume_roles(client, saml, targets, duration=duration)
 
-def daemonize(profile: Profile, session: Session, client: boto3.client,
-              role: Role, expires: datetime) -> bool:
-    with Daemonizer() as (is_setup, daemonizer):
-        is_parent, profile, session, client, role, expires = daemonizer(
-            profile.pidfile,
-            profile,
-            session,
-            client,
-            role,
-            expires,
+    name = primary(profile.name, targets)
+    if name in errors:
+        raise errors[name]
+
+    cache_dir = path.dirname(profile.credential_cache)
+    roles.save(get_credentials_file(session), cache_dir, targets, results)
+    roles.save_profiles(profile.profiles_file, targets)
+
+    return results[name]
+
+
+def idp_login(profile: Profile) -> SamlResponse:
+    """ Authenticates to the IdP using cookies, or else the user's
+        credentials, and caches the assertion returned. Cookies are
+        not tried if the IdP session has certainly ended. """
+    decision = idp_session.check(
+        profile.ecp_endpoint_url,
+        profile.cookies,
+        profile.idp_session_lifetime,
+        profile.idp_session_timeout,
+    )
+    response = None
+
+    if decision.refresh:
+        try:
+            response = refresh(
+                profile.ecp_endpoint_url,
+                profile.cookies,
+            )
+            outcome = 'refreshed'
+        except Exception:
+            outcome = 'refresh_failed'
+    else:
+        outcome = 'skipped'
+    idp_session.record(profile.home, profile.name, decision, outcome)
+
+    if response is None:
+        creds = profile.get_credentials()
+        response = authenticate(
+            profile.ecp_endpoint_url,
+            profile.cookies,
+            *creds,
         )
 
-        if not is_parent:
-            sighandler = SignalHandler1(profile.pidfile)
-            sighandler.start()
+    assertion.save(profile.home, profile.ecp_endpoint_url, profile.username,
+                   response, profile.enable_keyring)
+    return response
+
+
+def assume(profile: Profile, session: Session, client,
+           response: SamlResponse) -> Tuple[Dict[str, Role], Dict[str, Any]]:
+    """ Assumes the selected role(s) and saves their credentials.
+
+    Returns:
+        The roles assumed for each profile, and the Credentials dict
+        of the primary profile.
+    """
+    saml, arns = response.assertion, response.roles
+    duration = sts.session_duration(profile.duration,
+                                    response.session_duration)
+
+    if profile.role_profiles:
+        mapping = parse_role_profiles(profile.role_profiles)
+        targets = map_roles(mapping, arns)
+        creds = save_sts_tokens(profile, session, client, saml, targets,
+                                duration)
+    else:
+        role = get_selection(arns, profile.role_arn,
+                             parse_account_aliases(profile.account_aliases),
+                             profile.usage_file)
+        targets = {profile.name: role}
+        creds = save_sts_token(profile, session, client, saml, role,
+                               duration)
+
+    return targets, creds
+
+
+def serve_credentials(profile: Profile) -> Optional[str]:
+    """ Creates the authorization token for the credentials endpoint.
+
+    Returns:
+        The token or None if the endpoint is disabled.
+    """
+    if not profile.credentials_port:
+        return None
+
+    token = new_token()
+    save_token(profile.tokenfile, token)
+
+    port = profile.credentials_port
+    url = 'http://%s:%d/%s' % (LOCALHOST, port, profile.name)
+    print('export AWS_CONTAINER_CREDENTIALS_FULL_URI=' + url)
+    print('export AWS_CONTAINER_AUTHORIZATION_TOKEN_FILE=' + profile.tokenfile)
+
+    return token
+
+
+def daemonize(profile: Profile, session: Session, region: Optional[str],
+              targets: Dict[str, Role], creds: Dict[str, Any],
+              response: Optional[SamlResponse] = None) -> bool:
+    """
+    Hands a profile to the refresh supervisor, starting the supervisor
+    if it is not already running.
+
+    Returns:
+        True in the calling process, False in the supervisor once it
+        has finished.
+    """
+    token = serve_credentials(profile)
+    reg = Registration.from_profile(
+        profile, get_credentials_file(session), targets, creds, token, region,
+        response,
+    )
+    pidfile = path.join(profile.home, supervisor.PIDFILE)
+
+    # Held until the supervisor is started, so only one login starts it
+    with supervisor.StartLock(profile.home):
+        # The supervisor may be starting up or shutting down
+        for _ in range(10):
+            if supervisor.register(profile.home, reg):
+                logger.info('Registered with refresh supervisor')
+                return True
 
-            logger = configFileLogger(profile.logfile, logging.INFO)
-            logger.info('Startig refresh process for role %s' % role[1])
+            if not supervisor.is_running(profile.home):
+                break
+            sleep(0.5)
 
-            # TODO add retries!
-            while(True):
-                retries = 0
-                nap(expires, 0.9)
+        cache.remove(pidfile)  # Left behind by a supervisor that crashed
+        # Do not share connections with the supervisor
+        close_all()
+        sts.reset()
 
-                while(True):
-                    try:
-                        saml, _ = refresh(
-                            profile.ecp_endpoint_url,
-                            profile.cookies,
-                        )
-                    except Exception as e:
-                        retries += 1
+        with Daemonizer() as (is_setup, daemonizer):
+            is_parent, reg = daemonizer(pidfile, reg)
 
-                        if (retries < 4):
-                            logger.info('Refresh failed: %s' % str(e))
-                            nap(expires, 0.2)
-                        else:
-                            raise
-                    else:
-                        break
+            if not is_parent:
+                # The supervisor handles SIGINT and SIGTERM itself
+                logfile = path.join(profile.home, supervisor.LOGFILE)
+                configFileLogger(logfile, logging.INFO)
 
-                expires = save_sts_token(session, client, saml, role)
+                Supervisor(profile.home).run(reg)
 
-        return is_parent
+            return is_parent
 
 
-def error_handler(skip_args=True, validate=False):
+def error_handler(skip_args=True, validate=False, pass_args=False):
     """ A decorator for exception handling and logging. """
     def decorator(f):
         @wraps(f)
@@ -111,7 +255,10 @@ def error_handler(skip_args=True, validate=False):
                 else:
                     profile = Profile(session, None, validate)
 
-                f(profile, session)
+                if pass_args:
+                    f(profile, session, args)
+                else:
+                    f(profile, session)
             except AWSCLILogin as e:
                 code = e.code
                 exp = e
@@ -138,38 +285,71 @@ def error_handler(skip_args=True, validate=False):
     return decorator
 
 
+def control(profile: Profile) -> bool:
+    """ Asks the refresh supervisor to switch the role of a profile it
+        is refreshing, or to refresh it now if forced.
+
+    Returns:
+        True if the supervisor handled the login.
+
+    Raises:
+        AlreadyLoggedIn: If the profile already has the role asked for.
+    """
+    if profile.role_arn and not profile.role_profiles:
+        switched = supervisor.switch_role(profile.home, profile.name,
+                                          profile.role_arn,
+                                          profile.force_refresh)
+        if switched is False:
+            raise AlreadyLoggedIn
+        if switched:
+            logger.info('Switched the refreshed role to ' + profile.role_arn)
+            return True
+
+    if profile.force_refresh and \
+            supervisor.refresh_now(profile.home, profile.name):
+        logger.info('Refreshed by the refresh supervisor')
+        return True
+
+    return False
+
+
 @error_handler(skip_args=False, validate=True)
 def main(profile: Profile, session: Session):
     is_parent = True
 
     try:
-        client = boto3.client('sts')
+        if control(profile):
+            return
+
+        region = sts.resolve_region(profile.home, profile.sts_region)
+        client = sts.get_client(region)
 
-        # TODO force-refresh should kill refresh!
         if not profile.force_refresh:
             profile.raise_if_logged_in()
 
         # Must know username to lookup cookies
         profile.get_username()
 
+        cached = None
+        if not profile.force_refresh:
+            cached = assertion.load(profile.home, profile.ecp_endpoint_url,
+                                    profile.username, profile.enable_keyring)
+        response = cached or idp_login(profile)
         try:
-            saml, roles = refresh(
-                profile.ecp_endpoint_url,
-                profile.cookies,
-            )
-        except Exception:
-            creds = profile.get_credentials()
-            saml, roles = authenticate(
-                profile.ecp_endpoint_url,
-                profile.cookies,
-                *creds,
-            )
+            targets, creds = assume(profile, session, client, response)
+        except ClientError:
+            if cached is None:
+                raise
 
-        role = get_selection(roles)
-        expires = save_sts_token(session, client, saml, role)
+            logger.info('STS rejected the cached SAML assertion')
+            assertion.evict(profile.home, profile.ecp_endpoint_url,
+                            profile.username, profile.enable_keyring)
+            response = idp_login(profile)
+            targets, creds = assume(profile, session, client, response)
 
         if not profile.force_refresh:
-            is_parent = daemonize(profile, session, client, role, expires)
+            is_parent = daemonize(profile, session, region, targets, creds,
+                                  response)
     except Exception as e:
         raise
     finally:
@@ -177,10 +357,133 @@ def main(profile: Profile, session: Session):
             logger.info('Exiting refresh process')
 
 
+def clean_up(profile: Profile, others: Iterable[str]) -> None:
+    """ Removes the files and cached assertions of a logged out profile. """
+    cache.remove(profile.credential_cache)
+    for name in others:
+        cache.remove(path.join(path.dirname(profile.credential_cache),
+                               name + '.json'))
+    cache.remove(profile.profiles_file)
+    cache.remove(profile.tokenfile)
+
+    if profile.ecp_endpoint_url:
+        if profile.username:
+            assertion.evict(profile.home, profile.ecp_endpoint_url,
+                            profile.username, profile.enable_keyring)
+        assertion.evict_all(profile.home, profile.ecp_endpoint_url)
+
+
+def deregister(profile: Profile) -> bool:
+    """
+    Stops the refresh supervisor refreshing a profile.
+
+    Returns:
+        False if the profile may be refreshed by a process started by
+        an older release instead, which must be sent SIGINT.
+
+    Raises:
+        SupervisorError: If the supervisor refreshing the profile did
+            not answer.
+    """
+    found = supervisor.deregister(profile.home, profile.name)
+    if found:
+        return True
+
+    # Signalling the supervisor would stop refreshing every profile
+    if not supervisor.owns(profile.home, profile.pidfile):
+        return False
+    if found is None and supervisor.is_running(profile.home):
+        raise SupervisorError('Unable to stop refreshing %s' %
+                              profile.name)
+
+    cache.remove(profile.pidfile)  # Left behind by a supervisor
+    return True
+
+
 @error_handler()
 def logout(profile: Profile, session: Session):
     try:
-        send(profile.pidfile, SIGINT)
-        remove_credentials(session)
+        if not deregister(profile):
+            # A refresh process started by an older release
+            send(profile.pidfile, SIGINT)
+        others = roles.load_profiles(profile.profiles_file) or {}
+        remove_credentials(session, others)
+        clean_up(profile, others)
     except IOError:
         raise AlreadyLoggedOut
+
+
+def logged_in(home: str) -> List[str]:
+    """ Returns the profiles being refreshed, found by their pidfiles. """
+    skip = path.basename(supervisor.PIDFILE)
+
+    return sorted(f[:-len('.pid')]
+                  for f in listdir(path.join(home, CONFIG_DIR))
+                  if f.endswith('.pid') and f != skip)
+
+
+def stop_refresh(profile: Profile, deadline: float) -> bool:
+    """ Stops refreshing a profile, waiting until deadline for a refresh
+        process started by an older release to exit. Returns False if
+        the supervisor refreshing it did not answer. """
+    try:
+        if deregister(profile):
+            return True
+    except SupervisorError:
+        return False
+
+    try:
+        send(profile.pidfile, SIGINT)
+    except FileNotFoundError:
+        return True
+    except (OSError, ValueError):
+        cache.remove(profile.pidfile)  # Left behind by a process that died
+        return True
+
+    while path.isfile(profile.pidfile):
+        if time() >= deadline:
+            logger.warning('The refresh process of %s did not exit' %
+                           profile.name)
+            return True
+        sleep(0.1)
+
+    return True
+
+
+@error_handler(pass_args=True)
+def logout_all(profile: Profile, session: Session, args: Namespace):
+    """ Logs out of every profile being refreshed, or of those listed,
+        stopping their refreshes concurrently and removing all of their
+        credentials in one write. """
+    if args.all:
+        names = logged_in(profile.home)
+    else:
+        names = [n.strip() for n in args.profiles.split(',') if n.strip()]
+
+    if not names:
+        raise AlreadyLoggedOut
+
+    profiles = [Profile(session, None, False, name) for name in names]
+    deadline = time() + LOGOUT_TIMEOUT
+
+    with ThreadPoolExecutor(min(len(profiles), LOGOUT_WORKERS)) as pool:
+        stopped = list(pool.map(lambda p: stop_refresh(p, deadline),
+                                profiles))
+
+    # Credentials still being refreshed would only be written again
+    failed = [p.name for p, ok in zip(profiles, stopped) if not ok]
+    profiles = [p for p, ok in zip(profiles, stopped) if ok]
+
+    others = {p.name: roles.load_profiles(p.profiles_file) or {}
+              for p in profiles}
+    cleared = list(others)
+    for written in others.values():
+        cleared += [name for name in written if name not in cleared]
+    clear_credentials(get_credentials_file(session), cleared)
+
+    for p in profiles:
+        clean_up(p, others[p.name])
+
+    if failed:
+        raise SupervisorError('Unable to stop refreshing %s' %
+                              ', '.join(failed))
@@ -0,0 +1,163 @@
+"""
+Caches the last SAML assertion from an IdP until it expires.
+
+An assertion may be exchanged for STS credentials until its
+Conditions/@NotOnOrAfter, so a login or role switch made within that
+window skips the IdP. Assertions are cached per IdP and username in
+~/.aws-login/cache, readable only by the user, or in the keyring when
+enable_keyring is set. Expired assertions are evicted when next read,
+and every assertion for an IdP is evicted on logout.
+"""
+import json
+import logging
+
+from datetime import datetime, timedelta, timezone
+from glob import glob
+from hashlib import sha256
+from os import path
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from awscli_login import cache
+from awscli_login.const import CACHE_DIR
+from awscli_login.roles import Roles
+from awscli_login.saml import SAML_SUCCESS, SamlResponse
+
+KEYRING_SERVICE = 'awscli_login_assertion'
+
+# Assertions expiring sooner than this are not used, to allow for
+# clock skew and the time taken to reach STS.
+MARGIN = 30  # in seconds
+
+logger = logging.getLogger(__name__)
+
+
+def _key(url: str, username: str) -> str:
+    # The same key used for passwords in the keyring
+    return username + '@' + urlparse(url).netloc
+
+
+def cache_file(home: str, url: str, username: str) -> str:
+    """ Returns the path to the cached assertion of a user at an IdP. """
+    digest = sha256(_key(url, username).encode()).hexdigest()[:32]
+    return path.join(home, CACHE_DIR, digest + '.saml.json')
+
+
+def save(home: str, url: str, username: str, response: SamlResponse,
+         keyring: bool = False) -> None:
+    """
+    Caches an assertion until it expires.
+
+    Assertions without a NotOnOrAfter are not cached.
+
+    Args:
+        home: The user's home directory.
+        url: ECP endpoint URL for the IdP.
+        username: The user the assertion was issued to.
+        response: A successful SamlResponse.
+        keyring: If true the assertion is kept in the keyring.
+    """
+    if response.not_on_or_after is None or not response.succeeded:
+        return
+
+    entry: Dict[str, Any] = {
+        'idp': urlparse(url).netloc,
+        'not_on_or_after': response.not_on_or_after.timestamp(),
+        'session_duration': response.session_duration,
+    }
+    secret = {
+        'assertion': response.assertion,
+        'roles': [list(role) for role in response.roles],
+    }
+
+    if keyring:
+        try:
+            from keyring import set_password
+
+            set_password(KEYRING_SERVICE, _key(url, username),
+                         json.dumps(secret))
+            entry['keyring'] = True
+        except Exception as e:
+            # Some backends limit the size of secrets
+            logger.warning('Unable to keep assertion in keyring: %s' % e)
+            entry.update(secret)
+    else:
+        entry.update(secret)
+
+    cache.write(cache_file(home, url, username), entry)
+    logger.info('Cached SAML assertion until ' +
+                response.not_on_or_after.isoformat())
+
+
+def load(home: str, url: str, username: str, keyring: bool = False,
+         now: Optional[datetime] = None) -> Optional[SamlResponse]:
+    """
+    Returns the cached assertion of a user at an IdP, or None if there
+    is none, it expires within MARGIN seconds or it can not be read.
+    """
+    try:
+        return _load(home, url, username, keyring, now)
+    except Exception as e:
+        # A corrupt entry or a failing keyring must not stop a login
+        logger.warning('Unable to read cached SAML assertion: %s' % e)
+        return None
+
+
+def _load(home: str, url: str, username: str, keyring: bool,
+          now: Optional[datetime]) -> Optional[SamlResponse]:
+    filename = cache_file(home, url, username)
+    entry = cache.load(filename)
+    if not entry:
+        return None
+
+    now = now or datetime.now(timezone.utc)
+    expires = datetime.fromtimestamp(entry.get('not_on_or_after', 0),
+                                     timezone.utc)
+    if expires - now <= timedelta(seconds=MARGIN):
+        evict(home, url, username, entry.get('keyring', False))
+        return None
+
+    secret: Optional[Dict[str, Any]] = entry
+    if entry.get('keyring'):
+        if not keyring:
+            return None
+
+        from keyring import get_password
+
+        value = get_password(KEYRING_SERVICE, _key(url, username))
+        secret = json.loads(value) if value else None
+
+    if not secret or 'assertion' not in secret:
+        return None
+
+    logger.info('Using SAML assertion cached until ' + expires.isoformat())
+    return SamlResponse(
+        status=SAML_SUCCESS,
+        assertion=secret['assertion'],
+        roles=Roles(secret['roles']),
+        not_on_or_after=expires,
+        session_duration=entry.get('session_duration'),
+    )
+
+
+def evict(home: str, url: str, username: str, keyring: bool = False) -> None:
+    """ Removes the cached assertion of a user at an IdP. """
+    cache.remove(cache_file(home, url, username))
+
+    if keyring:
+        try:
+            from keyring import delete_password
+
+            delete_password(KEYRING_SERVICE, _key(url, username))
+        except Exception:
+            pass
+
+
+def evict_all(home: str, url: str) -> None:
+    """ Removes every cached assertion from an IdP, whatever the user. """
+    netloc = urlparse(url).netloc
+
+    for filename in glob(path.join(home, CACHE_DIR, '*.saml.json')):
+        entry = cache.load(filename)
+        if entry is None or entry.get('idp') == netloc:
+            cache.remove(filename)
@@ -0,0 +1,103 @@
+"""
+This module manages the STS credential cache in ~/.aws-login/cache.
+
+The cache is read by aws-login-credential-process for every SDK client
+created, so this module must only depend on the standard library.
+"""
+import json
+import os
+
+from datetime import datetime, timedelta, timezone
+from tempfile import mkstemp
+from typing import Any, Dict, Optional, Sequence
+
+# Fields output by credential_process as documented here:
+# https://docs.aws.amazon.com/cli/latest/topic/config-vars.html
+PROCESS_KEYS = (
+    'Version',
+    'AccessKeyId',
+    'SecretAccessKey',
+    'SessionToken',
+    'Expiration',
+)
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def save(filename: str, creds: Dict[str, Any], role: Sequence[str]) -> None:
+    """
+    Atomically writes STS credentials to the cache.
+
+    Args:
+        filename: Path to the cache file.
+        creds: The Credentials dict returned by STS.
+        role: A tuple containing a SAML provider ARN and a role ARN.
+    """
+    expires = creds['Expiration'].astimezone(timezone.utc)
+    entry = {
+        'Version': 1,
+        'AccessKeyId': creds['AccessKeyId'],
+        'SecretAccessKey': creds['SecretAccessKey'],
+        'SessionToken': creds['SessionToken'],
+        'Expiration': expires.strftime(DATE_FORMAT),
+        'PrincipalArn': role[0],
+        'RoleArn': role[1],
+    }
+
+    write(filename, entry)
+
+
+def write(filename: str, entry: Dict[str, Any]) -> None:
+    """ Atomically writes a JSON cache entry only we can read. """
+    directory = os.path.dirname(filename)
+    fd, tmp = mkstemp(dir=directory, prefix='.cache.')  # mode 0600
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load(filename: str) -> Optional[Dict[str, Any]]:
+    """ Returns a cache entry or None if it is missing or unreadable. """
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove(filename: str) -> None:
+    """ Removes a file quietly, i.e. no error if it does not exist. """
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+def expiration(entry: Dict[str, Any]) -> datetime:
+    """ Returns the expiration of a cache entry. """
+    expires = datetime.strptime(entry['Expiration'], DATE_FORMAT)
+    return expires.replace(tzinfo=timezone.utc)
+
+
+def is_fresh(entry: Optional[Dict[str, Any]], margin: int) -> bool:
+    """
+    Returns True if a cache entry is valid for more than margin seconds.
+    """
+    if not entry:
+        return False
+
+    try:
+        expires = expiration(entry)
+    except (KeyError, ValueError):
+        return False
+
+    return expires - datetime.now(timezone.utc) > timedelta(seconds=margin)
+
+
+def process_output(entry: Dict[str, Any]) -> str:
+    """ Returns the JSON expected from a credential_process. """
+    return json.dumps({key: entry[key] for key in PROCESS_KEYS})
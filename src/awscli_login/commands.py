@@ -0,0 +1,260 @@
+"""
+Lightweight awscli command stubs.
+
+These classes only describe the commands' arguments. The modules that
+do the actual work, and their heavy dependencies, are imported the
+first time _run_main is called.
+"""
+from argparse import Namespace
+
+from awscli.customizations.commands import BasicCommand
+
+
+class Login(BasicCommand):
+    NAME = 'login'
+    DESCRIPTION = ('is a plugin that manages retrieving and rotating'
+                   ' Amazon STS keys using the Shibboleth IdP and Duo'
+                   ' for authentication.')
+    SYNOPSIS = ('aws login [<Arg> ...]')
+
+    ARG_TABLE = [
+        {'name': 'entity-id', 'help_text': 'Entity ID of the IdP'},
+        {
+            'name': 'ecp-endpoint-url',
+            'help_text': 'ECP endpoint URL of the IdP'
+        },
+        {'name': 'username', 'help_text': 'Username to use on login to IdP'},
+        {'name': 'password', 'help_text': 'Password to use on login to IdP'},
+        {
+            'name': 'role-arn',
+            'help_text': 'The Role ARN, or a pattern matching it, to select. '
+                         'If a single Role matches it is autoselected.'
+        },
+        {'name': 'factor', 'help_text': 'The Duo factor to use on login'},
+        {'name': 'passcode', 'help_text': 'A Duo passcode'},
+        {
+            'name': 'refresh',
+            'default': 0,
+            'cli_type_name': 'integer',
+            'help_text': 'How often in seconds to refresh the STS credentials'
+        },
+        {
+            'name': 'refresh-lead',
+            'cli_type_name': 'integer',
+            'help_text': 'Refresh the STS credentials this many seconds '
+                         'before they expire'
+        },
+        {
+            'name': 'refresh-spread',
+            'cli_type_name': 'integer',
+            'help_text': 'Randomly move the first refresh up to this many '
+                         'seconds earlier'
+        },
+        {
+            'name': 'duration',
+            'cli_type_name': 'integer',
+            'help_text': 'Request STS credentials valid for this many '
+                         'seconds, up to the IdP\'s SessionDuration'
+        },
+        {
+            'name': 'sts-region',
+            'help_text': 'The region whose STS endpoint is used, '
+                         'or auto to use the fastest'
+        },
+        {
+            'name': 'verbose',
+            'action': 'count',
+            'default': 0,
+            'cli_type_name': 'integer',
+            'help_text': 'Display verbose output'
+        },
+        {
+            'name': 'ask-password',
+            'action': 'store_true',
+            'default': False,
+            'help_text': 'Force prompt for password'
+        },
+        {
+            'name': 'force-refresh',
+            'action': 'store_true',
+            'default': False,
+            'help_text': 'Forces a login attempt to the IdP using cookies'
+        },
+        {
+            'name': 'keepalive',
+            'action': 'store_true',
+            'default': False,
+            'help_text': 'Keep the IdP session alive between refreshes, '
+                         'until its lifetime ends'
+        },
+        {
+            'name': 'credentials-port',
+            'cli_type_name': 'integer',
+            'help_text': 'Serve the STS credentials on this localhost port '
+                         'using the container credentials protocol'
+        },
+    ]
+
+    UPDATE = False
+
+    def _run_main(self, args: Namespace, parsed_globals):
+        from awscli_login.__main__ import main
+
+        main(args, self._session)
+        return 0
+
+
+class Logout(BasicCommand):
+    NAME = 'logout'
+    DESCRIPTION = ("Kills the process that is renewing the user's"
+                   "credentials.")
+    SYNOPSIS = ('aws logout [--all | --profiles PROFILES]')
+
+    ARG_TABLE = [
+        {
+            'name': 'verbose',
+            'action': 'count',
+            'default': 0,
+            'cli_type_name': 'integer',
+            'help_text': 'Display verbose output'
+        },
+        {
+            'name': 'all',
+            'action': 'store_true',
+            'default': False,
+            'help_text': 'Log out of every profile being refreshed'
+        },
+        {
+            'name': 'profiles',
+            'help_text': 'Log out of a comma separated list of profiles'
+        },
+    ]
+
+    UPDATE = False
+
+    def _run_main(self, args: Namespace, parsed_globals):
+        from awscli_login.__main__ import logout, logout_all
+
+        if args.all or args.profiles:
+            logout_all(args, self._session)
+        else:
+            logout(args, self._session)
+        return 0
+
+
+class Configure(BasicCommand):
+    NAME = 'login'
+    DESCRIPTION = ('''
+Configure LOGIN options. If this command is run with no arguments,
+you will be prompted for configuration values such as your IdP's
+entity ID and its ECP endpoint URL.  You can configure a named
+profile using the --profile argument. If your config file does not
+exist (the default location is ~/.aws-login/config), it will be
+created for you. To keep an existing value, hit enter when prompted
+for the value.  When you are prompted for information, the current
+value will be dis- played in [brackets]. If the config item has
+no value, it be displayed as [None].
+
+=======================
+Configuration Variables
+=======================
+
+The following configuration variables are supported in the config
+file:
+
+* **entity_id** - The entity ID of the IDP to use for authenitication
+* **ecp_endpoint_url** - The ECP endpoint URL of the IDP to use for authn
+''')
+    SYNOPSIS = ('aws login configure')
+
+    ARG_TABLE = [
+        {
+            'name': 'verbose',
+            'action': 'count',
+            'default': 0,
+            'cli_type_name': 'integer',
+            'help_text': 'Display verbose output'
+        },
+    ]
+
+    UPDATE = False
+
+    EXAMPLES = ('''
+To create a new configuration::\n
+\n
+    $ aws login configure
+    Entity ID [None]: urn:mace:incommon:idp.edu
+    ECP Endpoint URL [None]: https://idp.edu/idp/profile/SAML2/SOAP/ECP\n
+\n
+To update just the entity ID::\n
+\n
+    $ aws login configure
+    Entity ID [urn:mace:incommon:idp.edu]: urn:mace:uncommon:foo.com
+    ECP Endpoint URL [https://idp.edu/idp/profile/SAML2/SOAP/ECP]:
+''')
+
+    def _run_main(self, args: Namespace, parsed_globals):
+        from awscli_login.configure import configure
+
+        configure(args, self._session)
+        return 0
+
+
+class Status(BasicCommand):
+    NAME = 'status'
+    DESCRIPTION = ('Shows when the STS credentials of a login profile'
+                   ' expire and are next refreshed, whether refreshing'
+                   ' is failing, and when its IdP session is predicted'
+                   ' to end.')
+    SYNOPSIS = ('aws login status [--all] [--json]')
+
+    ARG_TABLE = [
+        {
+            'name': 'all',
+            'action': 'store_true',
+            'default': False,
+            'help_text': 'Show every profile being refreshed'
+        },
+        {
+            'name': 'json',
+            'action': 'store_true',
+            'default': False,
+            'help_text': 'Output JSON'
+        },
+    ]
+
+    UPDATE = False
+
+    def _run_main(self, args: Namespace, parsed_globals):
+        from awscli_login.status import status
+
+        profile = self._session.profile or 'default'
+        return status(profile, args.all, args.json)
+
+
+class CredentialProcess(BasicCommand):
+    NAME = 'credential-process'
+    DESCRIPTION = ('Outputs the cached STS credentials of a login profile'
+                   ' in the JSON format expected by credential_process.'
+                   ' Expiring credentials are refreshed using the IdP'
+                   ' cookies. SDKs should prefer the lighter'
+                   ' aws-login-credential-process command.')
+    SYNOPSIS = ('aws login credential-process')
+
+    ARG_TABLE = [
+        {
+            'name': 'margin',
+            'default': 900,
+            'cli_type_name': 'integer',
+            'help_text': 'Refresh credentials expiring within this '
+                         'many seconds'
+        },
+    ]
+
+    UPDATE = False
+
+    def _run_main(self, args: Namespace, parsed_globals):
+        from awscli_login.credential_process import credential_process
+
+        profile = self._session.profile or 'default'
+        return credential_process(profile, args.margin)
@@ -11,6 +11,7 @@ from typing import (
     Any,
     Dict,
     FrozenSet,
+    Optional,
 )
 from urllib.parse import urlparse
 
@@ -18,19 +19,24 @@ from keyring import get_password, set_password
 
 from botocore.session import Session
 from awscli.customizations.configure.writer import ConfigFileWriter
+from awscli_login.const import (
+    CACHE_DIR,
+    CONFIG_DIR,
+    CONFIG_FILE,
+    COOKIE_STORES,
+    JAR_DIR,
+    LOG_DIR,
+)
+from awscli_login.scheduler import DEFAULT_LEAD, DEFAULT_SPREAD
 from awscli_login.typing import Creds
 from awscli_login.exceptions import (
     AlreadyLoggedIn,
+    InvalidCookieStore,
     InvalidFactor,
     ProfileMissingArgs,
     ProfileNotFound,
 )
 
-CONFIG_DIR = '.aws-login'
-CONFIG_FILE = path.join(CONFIG_DIR, 'config')
-JAR_DIR = path.join(CONFIG_DIR, 'cookies')
-LOG_DIR = path.join(CONFIG_DIR, 'log')
-
 ERROR_NONE = 0
 ERROR_UNKNOWN = 1
 
@@ -59,10 +65,22 @@ class Profile:
     passcode: str
     verbose: str
     refresh: int
+    refresh_lead: int
+    refresh_spread: int
+    sts_region: str
+    role_profiles: str
+    account_aliases: str
+    duration: int
+    idp_session_lifetime: int
+    idp_session_timeout: int
+    keepalive: bool
+    credentials_port: int
+    cookie_store: str
 
     config_file: str
+    credential_cache: str
     # Private vars
-    _args: Namespace
+    _args: Optional[Namespace]
     _required: FrozenSet[str] = frozenset(['ecp_endpoint_url'])
     _optional: Dict[str, Any] = {
             'username': None,
@@ -72,8 +90,20 @@ class Profile:
             'factor': None,
             'passcode': None,
             'verbose': 0,
-            'refresh': 3000,  # in seconds (every 50 mins)
+            'refresh': 0,  # in seconds, or 0 to refresh before expiry
+            'refresh_lead': DEFAULT_LEAD,
+            'refresh_spread': DEFAULT_SPREAD,
+            'sts_region': None,
+            'role_profiles': None,
+            'account_aliases': None,
+            'duration': 0,  # in seconds, or 0 for SessionDuration
+            'idp_session_lifetime': 0,  # in seconds, or 0 if unknown
+            'idp_session_timeout': 0,  # in seconds, or 0 if unknown
+            'keepalive': False,
+            'logout_on_exit': False,
             'force_refresh': False,
+            'credentials_port': 0,  # disabled
+            'cookie_store': 'lwp',
     }
 
     _config_options: Dict[str, str] = OrderedDict(
@@ -101,9 +131,15 @@ class Profile:
         makedirs(path.join(home, CONFIG_DIR), exist_ok=True)
         makedirs(path.join(home, LOG_DIR), exist_ok=True)
         makedirs(path.join(home, JAR_DIR), exist_ok=True)
+        makedirs(path.join(home, CACHE_DIR), mode=0o700, exist_ok=True)
 
         self.pidfile = path.join(home, CONFIG_DIR, self.name + '.pid')
         self.logfile = path.join(home, LOG_DIR, self.name + '.log')
+        self.credential_cache = path.join(home, CACHE_DIR, self.name + '.json')
+        self.tokenfile = path.join(home, CONFIG_DIR, self.name + '.token')
+        self.profiles_file = path.join(home, CACHE_DIR,
+                                       self.name + '.profiles.json')
+        self.usage_file = path.join(home, CACHE_DIR, 'usage.json')
 
     def _set_attrs(self, validate: bool) -> None:
         """ Load login profile from configuration. """
@@ -123,7 +159,8 @@ class Profile:
         options = self.options - frozenset(self._override.keys())
 
         for option in options:
-            value = getattr(self._args, option)
+            # Not every option is available on the command line
+            value = getattr(self._args, option, None)
 
             if value:
                 setattr(self, option, value)
@@ -136,20 +173,23 @@ class Profile:
             if value:
                 setattr(self, attr, False)
 
-    def __init__(self, session: Session, args: Namespace,
-                 validate: bool = True) -> None:
+    def __init__(self, session: Session, args: Optional[Namespace],
+                 validate: bool = True, name: Optional[str] = None) -> None:
         """Load login profile.
 
         Args:
             session: a botocore session used to determine the current profile.
             args: an object containing command line arguments.
             validate: if true will validate the profile.
+            name: a profile to load instead of the current profile.
 
         Raises:
             ProfileNotFound: If the Profile can not be found.
             ProfileMissingArgs: If required arguments are missing.
         """
-        self.name = session.profile if session.profile else 'default'
+        if name is None:
+            name = session.profile if session.profile else 'default'
+        self.name = name
         self._args = args
 
         self._init_dir()
@@ -161,7 +201,10 @@ class Profile:
         """ Process dynamic attributes. """
         if item == 'cookies':
                 if self.username:
-                    filename = self.username + '.txt'
+                    store = self.cookie_store
+                    if store not in COOKIE_STORES:
+                        raise InvalidCookieStore(store)
+                    filename = self.username + COOKIE_STORES[store]
                     return path.join(self.home, JAR_DIR, filename)
                 else:
                     return None
@@ -1 +1,12 @@
+from os import path
+
 FACTORS = ['auto', 'push', 'passcode', 'sms', 'phone']
+
+# Cookie stores and the extension of their jars
+COOKIE_STORES = {'lwp': '.txt', 'sqlite': '.db'}
+
+CONFIG_DIR = '.aws-login'
+CONFIG_FILE = path.join(CONFIG_DIR, 'config')
+CACHE_DIR = path.join(CONFIG_DIR, 'cache')
+JAR_DIR = path.join(CONFIG_DIR, 'cookies')
+LOG_DIR = path.join(CONFIG_DIR, 'log')
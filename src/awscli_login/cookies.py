@@ -0,0 +1,457 @@
+"""
+Cookie jars for the IdP session cookies of each username.
+
+Two stores are supported, chosen by the cookie_store option:
+
+- lwp: ~/.aws-login/cookies/<username>.txt, a libwww-perl text file
+  read and written whole.
+- sqlite: ~/.aws-login/cookies/<username>.db, a SQLite database in
+  WAL mode indexed by domain. Only the cookies of the IdP contacted
+  are read, and saving replaces only the cookies of that IdP in a
+  single transaction, so processes sharing a database do not
+  overwrite each other's cookies for other domains.
+
+The first time a SQLite jar is opened it is created from the text
+jar of the same username, if there is one. The text jar is left in
+place so the lwp store may still be switched back to.
+
+Jars of both stores know whether they were changed since they were
+last loaded or saved, so a login only writes cookies the IdP set or
+rotated. Text jars are written to a temporary file and renamed over
+the old one, so a jar is never left half written.
+
+Every profile with the same username shares one jar, so several
+processes may refresh with it at once. Saving therefore merges with
+the cookies stored since the jar was loaded: cookies this process did
+not change are taken as stored, those another process did not change
+are taken from this jar, and when both changed a cookie the one that
+expires last wins. Text jars hold an advisory lock on <jar>.lock
+while loading, shared, and while merging and saving, exclusive. SQLite
+jars merge within the write transaction that already serializes them.
+"""
+import json
+import logging
+import os
+import sqlite3
+
+from contextlib import contextmanager
+from http.cookiejar import Cookie, FileCookieJar, LWPCookieJar
+from os import path
+from tempfile import mkstemp
+from time import time
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlparse
+
+from awscli_login.const import COOKIE_STORES
+
+# Seconds to wait for another process to finish writing
+BUSY_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cookies (
+    domain TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT,
+    version INTEGER,
+    port TEXT,
+    port_specified INTEGER NOT NULL,
+    domain_specified INTEGER NOT NULL,
+    domain_initial_dot INTEGER NOT NULL,
+    path_specified INTEGER NOT NULL,
+    secure INTEGER NOT NULL,
+    expires INTEGER,
+    discard INTEGER NOT NULL,
+    comment TEXT,
+    comment_url TEXT,
+    rest TEXT NOT NULL,
+    rfc2109 INTEGER NOT NULL,
+    PRIMARY KEY (domain, path, name)
+) WITHOUT ROWID
+"""
+
+COLUMNS = ('version', 'name', 'value', 'port', 'port_specified', 'domain',
+           'domain_specified', 'domain_initial_dot', 'path',
+           'path_specified', 'secure', 'expires', 'discard', 'comment',
+           'comment_url', 'rest', 'rfc2109')
+
+INSERT = 'INSERT OR REPLACE INTO cookies (%s) VALUES (%s)' % (
+    ','.join(COLUMNS), ','.join('?' * len(COLUMNS)))
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str]
+State = Tuple[Optional[str], Optional[int], bool, bool]
+
+
+def domains(host: str) -> List[str]:
+    """
+    Returns the cookie domains that may be sent to a host.
+
+    For idp.example.com these are idp.example.com, .idp.example.com
+    and .example.com. Cookies set by a host without a dot, such as
+    localhost, are stored for localhost.local.
+    """
+    labels = host.lower().split('.')
+    found = [host.lower()]
+
+    for i in range(len(labels) - 1):
+        found.append('.' + '.'.join(labels[i:]))
+
+    if len(labels) == 1:
+        found.append(host.lower() + '.local')
+
+    return found
+
+
+@contextmanager
+def lock(filename: str, exclusive: bool = False) -> Iterator[None]:
+    """
+    Holds an advisory lock on <filename>.lock.
+
+    Args:
+        filename: The cookie jar to lock.
+        exclusive: True to exclude other readers as well as writers.
+    """
+    fd = os.open(filename + '.lock', os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover
+            yield
+            return
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)  # Releases the lock
+
+
+def _key(cookie: Cookie) -> Key:
+    return cookie.domain, cookie.path, cookie.name
+
+
+def _state(cookie: Optional[Cookie]) -> Optional[State]:
+    if cookie is None:
+        return None
+
+    return cookie.value, cookie.expires, cookie.secure, cookie.discard
+
+
+def _expiry(cookie: Cookie) -> float:
+    # Session cookies outlast those with an expiry
+    return float('inf') if cookie.expires is None else cookie.expires
+
+
+def merge(base: Dict[Key, Optional[State]], ours: Iterable[Cookie],
+          theirs: Iterable[Cookie]) -> List[Cookie]:
+    """
+    Merges the cookies of a jar with those stored since it was loaded.
+
+    Args:
+        base: The state of each cookie when the jar was loaded.
+        ours: The cookies of the jar.
+        theirs: The cookies stored now.
+
+    Returns:
+        Each cookie as changed by either side. If both changed one, the
+        cookie that expires last, or ours, is kept; a cookie one side
+        updated is kept even if the other deleted it.
+    """
+    mine = {_key(c): c for c in ours}
+    other = {_key(c): c for c in theirs}
+    merged = []
+
+    for key in sorted(set(mine) | set(other)):
+        a, b = mine.get(key), other.get(key)
+        was = base.get(key)
+
+        if _state(a) == was:
+            keep = b
+        elif _state(b) == was or b is None:
+            keep = a
+        elif a is None or _expiry(b) > _expiry(a):
+            keep = b
+        else:
+            keep = a
+
+        if keep is not None:
+            merged.append(keep)
+
+    return merged
+
+
+def _select(cookies: Iterable[Cookie], ignore_discard: bool,
+            ignore_expires: bool) -> List[Cookie]:
+    now = int(time())
+    return [c for c in cookies
+            if (ignore_discard or not c.discard) and
+            (ignore_expires or not c.is_expired(now))]
+
+
+class _DirtyCookieJar(FileCookieJar):
+    """ A FileCookieJar that tracks how it changed since loaded or saved. """
+    filename: str
+    _cookies_lock: ContextManager[Any]  # Set by CookieJar
+    _clean: Optional[Dict[Key, Optional[State]]]
+
+    def __init__(self, filename: str) -> None:
+        super().__init__(filename)
+        self._clean = {}
+
+    def _snapshot(self) -> Dict[Key, Optional[State]]:
+        with self._cookies_lock:
+            return {_key(c): _state(c) for c in self}
+
+    @property
+    def dirty(self) -> bool:
+        """ True if the cookies differ from those last loaded or saved. """
+        return self._snapshot() != self._clean
+
+    def baseline(self) -> None:
+        """
+        Treats the cookies already stored as the last loaded, without
+        adding them to this jar.
+        """
+        stored = self._empty()
+        try:
+            stored.load(ignore_discard=True)
+            self._clean = stored._snapshot()
+        except FileNotFoundError:
+            self._clean = None
+
+    def _mark_clean(self) -> None:
+        self._clean = self._snapshot()
+
+    def _merge(self, stored: Iterable[Cookie], ignore_discard: bool,
+               ignore_expires: bool) -> List[Cookie]:
+        """ Merges with the cookies stored and keeps the result. """
+        with self._cookies_lock:
+            ours = _select(self, ignore_discard, ignore_expires)
+            cookies = _select(merge(self._clean or {}, ours, stored),
+                              ignore_discard, ignore_expires)
+
+            self.clear()
+            for cookie in cookies:
+                self.set_cookie(cookie)
+
+        return cookies
+
+    def _empty(self) -> '_DirtyCookieJar':
+        """ Returns an empty jar saved to the same file. """
+        return type(self)(self.filename)
+
+
+class TextCookieJar(_DirtyCookieJar, LWPCookieJar):
+    """ A libwww-perl text cookie jar saved atomically. """
+
+    def load(self, filename: Optional[str] = None,
+             ignore_discard: bool = False,
+             ignore_expires: bool = False) -> None:
+        filename = filename or self.filename
+        if not path.exists(filename):
+            # Do not leave a lock file for a missing jar
+            raise FileNotFoundError(filename)
+
+        with lock(filename):
+            super().load(filename, ignore_discard, ignore_expires)
+        self._mark_clean()
+
+    def save(self, filename: Optional[str] = None,
+             ignore_discard: bool = False,
+             ignore_expires: bool = False) -> None:
+        """ Merges with the cookies stored and atomically replaces them. """
+        filename = filename or self.filename
+        with lock(filename, exclusive=True):
+            stored = LWPCookieJar(filename)
+            try:
+                stored.load(ignore_discard=True, ignore_expires=True)
+            except FileNotFoundError:
+                pass
+            self._merge(stored, ignore_discard, ignore_expires)
+
+            fd, tmp = mkstemp(dir=path.dirname(filename) or '.',
+                              prefix='.cookies.')  # mode 0600
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write('#LWP-Cookies-2.0\n')
+                    f.write(self.as_lwp_str(True, True))
+                os.replace(tmp, filename)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+        self._mark_clean()
+
+
+def _row(cookie: Cookie) -> tuple:
+    rest = json.dumps(getattr(cookie, '_rest', {}))
+    return tuple(rest if c == 'rest' else getattr(cookie, c) for c in COLUMNS)
+
+
+def _cookie(row: sqlite3.Row) -> Cookie:
+    kwargs = dict(zip(row.keys(), row))
+    kwargs['rest'] = json.loads(kwargs['rest'])
+    for flag in ('port_specified', 'domain_specified', 'domain_initial_dot',
+                 'path_specified', 'secure', 'discard', 'rfc2109'):
+        kwargs[flag] = bool(kwargs[flag])
+
+    return Cookie(**kwargs)
+
+
+class SQLiteCookieJar(_DirtyCookieJar):
+    """
+    A cookie jar kept in a SQLite database.
+
+    Args:
+        filename: The database, ending in .db.
+        host: If given only the cookies that may be sent to this host
+            are loaded, and saved.
+    """
+
+    def __init__(self, filename: str, host: Optional[str] = None) -> None:
+        super().__init__(filename)
+        self.host = host
+
+    def _connect(self) -> sqlite3.Connection:
+        if not path.exists(self.filename):
+            # The -wal and -shm files are created with the same mode
+            os.close(os.open(self.filename, os.O_CREAT | os.O_WRONLY, 0o600))
+
+        conn = sqlite3.connect(self.filename, timeout=BUSY_TIMEOUT,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(SCHEMA)
+
+        return conn
+
+    def _empty(self) -> _DirtyCookieJar:
+        return SQLiteCookieJar(self.filename, self.host)
+
+    def _domains(self) -> Optional[List[str]]:
+        return domains(self.host) if self.host else None
+
+    def _migrate(self) -> None:
+        """ Creates the database from the text jar of the same name. """
+        text = path.splitext(self.filename)[0] + COOKIE_STORES['lwp']
+        if not path.isfile(text):
+            raise FileNotFoundError(self.filename)
+
+        jar = LWPCookieJar(text)
+        jar.load(ignore_discard=True, ignore_expires=True)
+        self._write(jar, None)
+        logger.info('Migrated cookie jar %s to %s' % (text, self.filename))
+
+    def _write(self, cookies: Iterable[Cookie], scope: Optional[List[str]],
+               resolve: Optional[Callable[[List[Cookie]], List[Cookie]]] = None
+               ) -> None:
+        """
+        Replaces the cookies of the domains in scope, or all.
+
+        Args:
+            cookies: The cookies to store.
+            scope: The domains to replace, or None for all.
+            resolve: If given, called with the cookies stored in scope
+                to return those to store instead.
+        """
+        cookies = list(cookies)
+        if scope is not None:
+            scope = sorted(set(scope) | {c.domain for c in cookies})
+
+        where = ''
+        if scope is not None:
+            where = ' WHERE domain IN (%s)' % ','.join('?' * len(scope))
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if resolve is not None:
+                rows = conn.execute('SELECT %s FROM cookies%s' % (
+                    ','.join(COLUMNS), where), scope or ()).fetchall()
+                cookies = resolve([_cookie(row) for row in rows])
+            conn.execute('DELETE FROM cookies' + where, scope or ())
+            conn.executemany(INSERT, [_row(c) for c in cookies])
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def load(self, filename: Optional[str] = None,
+             ignore_discard: bool = False,
+             ignore_expires: bool = False) -> None:
+        """ Loads cookies, migrating a text jar on first use. """
+        if filename is not None:
+            self.filename = filename
+
+        if not path.exists(self.filename):
+            self._migrate()
+
+        scope = self._domains()
+        query = 'SELECT %s FROM cookies' % ','.join(COLUMNS)
+        if scope is not None:
+            query += ' WHERE domain IN (%s)' % ','.join('?' * len(scope))
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, scope or ()).fetchall()
+        finally:
+            conn.close()
+
+        now = int(time())
+        with self._cookies_lock:
+            for row in rows:
+                cookie = _cookie(row)
+                if not ignore_discard and cookie.discard:
+                    continue
+                if not ignore_expires and cookie.is_expired(now):
+                    continue
+                self.set_cookie(cookie)
+
+        self._mark_clean()
+
+    def save(self, filename: Optional[str] = None,
+             ignore_discard: bool = False,
+             ignore_expires: bool = False) -> None:
+        """ Merges with the cookies stored and replaces them. """
+        if filename is not None:
+            self.filename = filename
+
+        with self._cookies_lock:
+            cookies = list(self)
+
+        def resolve(stored: List[Cookie]) -> List[Cookie]:
+            return self._merge(stored, ignore_discard, ignore_expires)
+
+        self._write(cookies, self._domains(), resolve)
+        self._mark_clean()
+
+
+def cookie_jar(filename: str, url: Optional[str] = None
+               ) -> Union[TextCookieJar, SQLiteCookieJar]:
+    """
+    Returns an empty jar for a file of either cookie store.
+
+    Args:
+        filename: A path to a cookie jar, ending in .txt or .db.
+        url: If given, a SQLite jar only loads and saves the cookies
+            of this URL's host.
+    """
+    if filename.endswith(COOKIE_STORES['sqlite']):
+        host = urlparse(url).hostname if url else None
+        return SQLiteCookieJar(filename, host)
+
+    return TextCookieJar(filename)
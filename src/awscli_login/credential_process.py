@@ -0,0 +1,172 @@
+"""
+Serves cached STS credentials to the AWS SDKs using credential_process.
+
+Example ~/.aws/config entry::
+
+    [profile prod-sdk]
+    credential_process = aws-login-credential-process --profile prod
+
+SDKs run this command every time a client is created, so on a cache
+hit only the standard library is imported. The IdP is contacted using
+cookies only when the cached credentials are about to expire. Profiles
+without cached credentials, e.g. after aws logout, are not logged in
+again.
+"""
+import argparse
+import sys
+
+from os import path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from awscli_login import cache
+from awscli_login.const import CACHE_DIR
+
+if TYPE_CHECKING:  # pragma: no cover
+    from awscli_login.roles import Roles  # noqa: F401
+    from awscli_login.typing import Role  # noqa: F401
+
+# botocore forces a refresh of credentials expiring in less than 10
+# minutes, so fresh credentials must outlive that window.
+DEFAULT_MARGIN = 900  # in seconds
+
+
+def cache_file(profile: str) -> str:
+    """ Returns the path to a profile's credential cache. """
+    return path.join(path.expanduser('~'), CACHE_DIR, profile + '.json')
+
+
+def refresh_credentials(name: str, margin: int) -> Dict[str, Any]:
+    """
+    Retrieves new STS credentials using the IdP cookies (slow path).
+
+    Args:
+        name: Name of the login profile.
+        margin: Minimum time in seconds the credentials must be valid.
+
+    Returns:
+        The new cache entry.
+
+    Raises:
+        NotLoggedIn: If the profile is logged out, or there is no IdP
+            session or role to refresh.
+    """
+    from botocore.session import Session
+
+    from awscli_login.__main__ import save_sts_token
+    from awscli_login.config import Profile
+    from awscli_login.exceptions import NotLoggedIn
+    from awscli_login.saml import refresh
+    from awscli_login.sts import get_client, resolve_region, session_duration
+
+    session = Session(profile=name)
+    profile = Profile(session, None)
+
+    with _lock(profile.credential_cache + '.lock'):
+        # Another process may have refreshed while we waited
+        entry = cache.load(profile.credential_cache)
+        if entry is None:
+            # Logged out while we waited
+            raise NotLoggedIn(name)
+        if cache.is_fresh(entry, margin):
+            return entry
+
+        if profile.cookies is None:
+            raise NotLoggedIn(name)
+
+        response = refresh(profile.ecp_endpoint_url, profile.cookies)
+        role = _select_role(entry, profile.role_arn, response.roles)
+        if role is None:
+            raise NotLoggedIn(name)
+
+        region = resolve_region(profile.home, profile.sts_region)
+        client = get_client(region)
+        duration = session_duration(profile.duration,
+                                    response.session_duration)
+        save_sts_token(profile, session, client, response.assertion, role,
+                       duration)
+
+        entry = cache.load(profile.credential_cache)
+        if entry is None:
+            # Removed by aws logout as soon as it was written
+            raise NotLoggedIn(name)
+
+        return entry
+
+
+def _select_role(entry: Optional[Dict[str, Any]], role_arn: Optional[str],
+                 roles: 'Roles') -> Optional['Role']:
+    """ Returns the previously assumed role, or None if ambiguous. """
+    if entry and 'RoleArn' in entry:
+        role_arn = entry['RoleArn']
+
+    if role_arn is not None:
+        matched = roles.match(role_arn)
+        return matched[0] if len(matched) == 1 else None
+
+    return roles[0] if len(roles) == 1 else None
+
+
+class _lock:
+    """ Serializes slow path refreshes of the same profile. """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+
+    def __enter__(self) -> None:
+        self.f = open(self.filename, 'a')
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover
+            return
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+
+    def __exit__(self, *args) -> None:
+        self.f.close()
+
+
+def credential_process(profile: str, margin: int = DEFAULT_MARGIN) -> int:
+    """
+    Prints credential_process JSON for a login profile.
+
+    Returns:
+        An exit code.
+    """
+    entry = cache.load(cache_file(profile))
+
+    if entry is None:
+        from awscli_login.exceptions import NotLoggedIn
+
+        e = NotLoggedIn(profile)
+        print(str(e), file=sys.stderr)
+        return e.code
+
+    if not cache.is_fresh(entry, margin):
+        try:
+            entry = refresh_credentials(profile, margin)
+        except Exception as e:
+            print(str(e), file=sys.stderr)
+            return getattr(e, 'code', 1)
+
+    print(cache.process_output(entry))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """ Entry point for aws-login-credential-process. """
+    parser = argparse.ArgumentParser(
+        prog='aws-login-credential-process',
+        description='Outputs cached awscli-login credentials for use '
+                    'with credential_process.',
+    )
+    parser.add_argument('--profile', default='default',
+                        help='The login profile to use')
+    parser.add_argument('--margin', type=int, default=DEFAULT_MARGIN,
+                        help='Refresh credentials expiring within this '
+                             'many seconds')
+    args = parser.parse_args(argv)
+
+    return credential_process(args.profile, args.margin)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
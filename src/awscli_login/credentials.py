@@ -0,0 +1,263 @@
+""" This module is used to update ~/.aws/credentials """
+import logging
+import os
+import re
+
+from datetime import datetime, timezone
+from tempfile import mkstemp
+from typing import Dict, Iterable, List, Optional, Tuple
+
+STS_KEYS = (
+    'aws_access_key_id',
+    'aws_secret_access_key',
+    'aws_session_token',
+    'aws_session_expiration',
+)
+
+SECTION_REGEX = re.compile(rb'^[ \t]*\[([^\]\r\n]+)\][^\n]*$', re.MULTILINE)
+OPTION_REGEX = re.compile(rb'^[ \t]*([^#;\s\[][^:=\n]*?)[ \t]*[:=]')
+
+logger = logging.getLogger(__name__)
+
+
+def iso8601(expires: datetime) -> str:
+    """ Formats a datetime the way Amazon formats STS expirations. """
+    return expires.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def sts_values(creds: Optional[Dict]) -> Dict[str, str]:
+    """
+    Maps an STS Credentials dict to credentials file keys.
+
+    Args:
+        creds: The Credentials dict returned by STS, or None to blank
+            every key.
+
+    Returns:
+        A dict of credentials file keys and values.
+    """
+    if creds is None:
+        return {key: '' for key in STS_KEYS}
+
+    return {
+        'aws_access_key_id': creds['AccessKeyId'],
+        'aws_secret_access_key': creds['SecretAccessKey'],
+        'aws_session_token': creds['SessionToken'],
+        'aws_session_expiration': iso8601(creds['Expiration']),
+    }
+
+
+class CredentialsFile:
+    """
+    An in-memory copy of an AWS shared credentials file.
+
+    The file is read once and split into a chunk of bytes per section,
+    indexed by name, so that updating one profile in a file holding
+    hundreds of them only touches that profile's bytes. Any number of
+    sections may be updated before the file is joined and written back
+    atomically with save. Comments and unrelated sections are left
+    untouched.
+
+    Used as a context manager the file is read and saved holding an
+    exclusive lock on <filename>.lock, so that concurrent writers, e.g.
+    the refresh supervisor and aws login, do not drop each other's
+    sections.
+    """
+    filename: str
+
+    _chunks: List[bytes]  # the text before any section, then each section
+    _index: Dict[str, int]  # section -> position in _chunks
+    _loaded: bool
+    _dirty: bool
+    _lock_fd: Optional[int]
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._chunks, self._index = [], {}
+        self._loaded = False
+        self._dirty = False
+        self._lock_fd = None
+
+    def __enter__(self) -> 'CredentialsFile':
+        self._lock()
+        try:
+            self._load()
+        except BaseException:
+            self._unlock()
+            raise
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self.save()
+        finally:
+            self._unlock()
+
+    def __contains__(self, section: str) -> bool:
+        self._load()
+        return section in self._index
+
+    def _lock(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(directory, exist_ok=True)
+
+        fd = os.open(self.filename + '.lock', os.O_CREAT | os.O_RDWR, 0o600)
+        self._lock_fd = fd
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover
+            return
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # Releases the lock
+            self._lock_fd = None
+
+    def _load(self) -> None:
+        """ Reads the file on first use. """
+        if self._loaded:
+            return
+
+        try:
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+
+        self._chunks, self._index = self._split(data)
+        self._loaded = True
+
+    @staticmethod
+    def _split(data: bytes) -> Tuple[List[bytes], Dict[str, int]]:
+        """ Splits a file into sections and indexes them in one scan. """
+        matches = list(SECTION_REGEX.finditer(data))
+        starts = [0] + [m.start() for m in matches] + [len(data)]
+        chunks = [data[a:b] for a, b in zip(starts, starts[1:])]
+
+        index: Dict[str, int] = {}
+        for i, match in enumerate(matches, 1):
+            # Like ConfigParser the first section wins
+            index.setdefault(match.group(1).decode().strip(), i)
+
+        return chunks, index
+
+    @staticmethod
+    def _validate(section: str, values: Dict[str, str]) -> None:
+        for value in (section, *values.keys(), *values.values()):
+            if '\n' in value or '\r' in value:
+                raise ValueError('Newlines are not allowed in credentials!')
+
+    @staticmethod
+    def _line(key: str, value: str) -> bytes:
+        return ('%s = %s\n' % (key, value)).encode()
+
+    def _update_section(self, body: bytes, values: Dict[str, str]) -> bytes:
+        """ Replaces or inserts values in a section's body. """
+        lines = body.splitlines(keepends=True)
+        if lines and not lines[-1].endswith(b'\n'):
+            lines[-1] += b'\n'
+
+        pending = dict(values)
+        last_option = 0  # Line 0 is the section header
+
+        for i, line in enumerate(lines[1:], 1):
+            match = OPTION_REGEX.match(line)
+            if match is None:
+                continue
+
+            last_option = i
+            key = match.group(1).decode()
+            if key in pending:
+                lines[i] = self._line(key, pending.pop(key))
+
+        new = [self._line(k, v) for k, v in pending.items()]
+        lines[last_option + 1:last_option + 1] = new
+
+        return b''.join(lines)
+
+    def update(self, section: str, values: Dict[str, str]) -> None:
+        """
+        Sets values in a section, creating the section if necessary.
+
+        Args:
+            section: The name of the profile to update.
+            values: The keys and values to set.
+
+        Raises:
+            ValueError: If a section, key or value contains a newline.
+        """
+        self._validate(section, values)
+        self._load()
+
+        i = self._index.get(section)
+        if i is None:
+            last = self._chunks[-1]
+            if last and not last.endswith(b'\n'):
+                self._chunks[-1] = last + b'\n'
+
+            header = ('[%s]\n' % section).encode()
+            self._index[section] = len(self._chunks)
+            self._chunks.append(self._update_section(header, values))
+        else:
+            self._chunks[i] = self._update_section(self._chunks[i], values)
+
+        self._dirty = True
+
+    def update_many(self, sections: Iterable[Tuple[str, Dict[str, str]]]) \
+            -> None:
+        """ Calls update for each (section, values) pair. """
+        for section, values in sections:
+            self.update(section, values)
+
+    def save(self) -> None:
+        """
+        Atomically replaces the credentials file if it was modified.
+
+        The new contents are written to a temporary file in the same
+        directory, flushed to disk, and renamed over the original so
+        that readers never see a partially written file.
+        """
+        if not self._dirty:
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(directory, exist_ok=True)
+
+        try:
+            mode = os.stat(self.filename).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o600
+
+        fd, tmp = mkstemp(dir=directory, prefix='.credentials.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b''.join(self._chunks))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, mode)
+            os.replace(tmp, self.filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self._fsync_dir(directory)
+        self._dirty = False
+        logger.debug("Wrote credentials file: " + self.filename)
+
+    @staticmethod
+    def _fsync_dir(directory: str) -> None:
+        """ Ensures the rename itself is durable. """
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:  # e.g. Windows
+            return
+
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
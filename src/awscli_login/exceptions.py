@@ -1,5 +1,5 @@
 """ A collection of custom exceptions """
-from .const import FACTORS
+from .const import COOKIE_STORES, FACTORS
 
 
 class AWSCLILogin(Exception):
@@ -86,3 +86,60 @@ class RoleParseFail(SAML):
     def __init__(self, role: str) -> None:
         mesg = "Bad SAML Response! Failed to parse role: %s!"
         super().__init__(mesg % role)
+
+
+class NotLoggedIn(ConfigError):
+    code = 11
+
+    def __init__(self, profile: str) -> None:
+        mesg = "Not logged in! Please run: aws --profile %s login"
+        super().__init__(mesg % profile)
+
+
+class SupervisorError(AWSCLILogin):
+    code = 12
+
+    def __init__(self, error: str) -> None:
+        mesg = "Refresh supervisor error: %s"
+        super().__init__(mesg % error)
+
+
+class InvalidRoleProfiles(ConfigError):
+    code = 13
+
+    def __init__(self, line: str) -> None:
+        mesg = "Invalid role_profiles entry: %s"
+        super().__init__(mesg % line)
+
+
+class NoRolesMatched(SAML):
+    code = 14
+
+    def __init__(self) -> None:
+        mesg = "None of the roles returned by the IdP match role_profiles!"
+        super().__init__(mesg)
+
+
+class RoleNotFound(SAML):
+    code = 15
+
+    def __init__(self, role: str) -> None:
+        mesg = "The IdP did not return the role: %s!"
+        super().__init__(mesg % role)
+
+
+class InvalidAccountAliases(ConfigError):
+    code = 16
+
+    def __init__(self, line: str) -> None:
+        mesg = "Invalid account_aliases entry: %s"
+        super().__init__(mesg % line)
+
+
+class InvalidCookieStore(ConfigError):
+    code = 17
+
+    def __init__(self, store: str) -> None:
+        valid_stores = ', '.join(COOKIE_STORES) + '.'
+        mesg = "Invalid cookie_store %s! Valid values are: " + valid_stores
+        super().__init__(mesg % store)
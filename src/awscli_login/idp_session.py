@@ -0,0 +1,215 @@
+"""
+Decides offline whether an IdP session can still be used.
+
+Logging in first tries to refresh the SAML assertion with the cookies
+of the last login, and only asks for a password if that fails. When
+the IdP session has certainly ended, that refresh is a wasted round
+trip, so the cookie jar is checked locally first:
+
+- no_jar, no_cookies: there is no session cookie for the IdP.
+- cookies_expired: every cookie for the IdP has expired.
+- lifetime_exceeded: the last password login was longer ago than
+  idp_session_lifetime, the IdP's absolute session lifetime.
+- idle_timeout: the last successful login was longer ago than
+  idp_session_timeout, the IdP's inactivity timeout.
+
+The times of the last password login and of the last success are
+kept next to the cookie jar. Both policy options default to 0,
+unknown, as they depend on the IdP.
+
+Every decision, and whether the refresh it allowed then succeeded,
+is appended to ~/.aws-login/log/idp_session.jsonl so the heuristic
+can be measured with summarize.
+"""
+import json
+import logging
+import sqlite3
+
+from collections import Counter
+from http.cookiejar import LoadError
+from os import path
+from time import time
+from typing import Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+from awscli_login import cache
+from awscli_login.const import LOG_DIR
+from awscli_login.cookies import cookie_jar, domains
+
+DECISION_LOG = path.join(LOG_DIR, 'idp_session.jsonl')
+
+logger = logging.getLogger(__name__)
+
+
+class Decision(NamedTuple):
+    """ Whether to try refreshing with cookies, and why. """
+    refresh: bool
+    reason: str
+
+
+def state_file(cookies: str) -> str:
+    """ Returns the file the session times of a cookie jar are kept in. """
+    return path.splitext(cookies)[0] + '.session.json'
+
+
+def load_state(cookies: str) -> Dict[str, float]:
+    """
+    Returns the times of the last password login, authenticated, and
+    of the last success, succeeded, with a cookie jar.
+    """
+    state = cache.load(state_file(cookies))
+    return state if isinstance(state, dict) else {}
+
+
+def touch(cookies: str, authenticated: bool = False,
+          now: Optional[float] = None) -> None:
+    """
+    Records a successful login to an IdP.
+
+    Args:
+        cookies: A path to the cookie jar used.
+        authenticated: True if a password was used, starting a new
+            IdP session.
+        now: The time of the login, by default the current time.
+    """
+    now = time() if now is None else now
+    filename = state_file(cookies)
+    state = {} if authenticated else load_state(cookies)
+
+    state['succeeded'] = now
+    if authenticated:
+        state['authenticated'] = now
+
+    try:
+        cache.write(filename, state)
+    except OSError as e:
+        logger.warning('Unable to save IdP session state: %s' % e)
+
+
+def check(url: str, cookies: Optional[str], lifetime: int = 0,
+          timeout: int = 0, now: Optional[float] = None) -> Decision:
+    """
+    Decides whether refreshing with cookies may succeed.
+
+    Args:
+        url: ECP endpoint URL for the IdP.
+        cookies: A path to a cookie jar.
+        lifetime: The IdP's session lifetime in seconds, or 0.
+        timeout: The IdP's inactivity timeout in seconds, or 0.
+        now: The current time, by default the system's.
+
+    Returns:
+        A Decision to refresh unless the session has certainly ended.
+    """
+    now = time() if now is None else now
+
+    if not cookies:
+        return Decision(False, 'no_jar')
+
+    jar = cookie_jar(cookies, url)
+    try:
+        jar.load(ignore_discard=True, ignore_expires=True)
+    except FileNotFoundError:
+        return Decision(False, 'no_jar')
+    except (OSError, LoadError, sqlite3.Error):
+        # Let refresh report the problem
+        return Decision(True, 'unreadable')
+
+    scope = set(domains(urlparse(url).hostname or ''))
+    expires = [c.expires for c in jar if c.domain in scope]
+    if not expires:
+        return Decision(False, 'no_cookies')
+
+    # Session cookies have no expiry and last until the IdP ends them
+    if all(e is not None and e <= now for e in expires):
+        return Decision(False, 'cookies_expired')
+
+    state = load_state(cookies)
+    authenticated = state.get('authenticated')
+    succeeded = state.get('succeeded')
+
+    if lifetime and authenticated and now - authenticated >= lifetime:
+        return Decision(False, 'lifetime_exceeded')
+
+    if timeout and succeeded and now - succeeded >= timeout:
+        return Decision(False, 'idle_timeout')
+
+    return Decision(True, 'ok')
+
+
+def session_end(lifetime: int, timeout: int, authenticated: Optional[float],
+                succeeded: Optional[float],
+                next_contact: Optional[float]) -> Optional[float]:
+    """
+    Predicts when an IdP session will end, and a password be needed.
+
+    Args:
+        lifetime: The IdP's session lifetime in seconds, or 0.
+        timeout: The IdP's inactivity timeout in seconds, or 0.
+        authenticated: When the password was last used.
+        succeeded: When the IdP was last contacted successfully.
+        next_contact: When the IdP will next be contacted.
+
+    Returns:
+        The time the session ends, or None if unknown.
+    """
+    ends = []
+
+    if lifetime and authenticated:
+        ends.append(authenticated + lifetime)
+
+    if timeout and succeeded and next_contact is not None and \
+            next_contact - succeeded >= timeout:
+        ends.append(succeeded + timeout)
+
+    return min(ends) if ends else None
+
+
+def record(home: str, profile: str, decision: Decision, outcome: str,
+           now: Optional[float] = None) -> None:
+    """
+    Appends a decision and its outcome to the decision log.
+
+    Args:
+        home: The user's home directory.
+        profile: The profile logging in.
+        decision: The Decision made by check.
+        outcome: refreshed, refresh_failed or skipped.
+        now: The time of the decision, by default the current time.
+    """
+    entry = {
+        'time': round(time() if now is None else now, 3),
+        'profile': profile,
+        'refresh': decision.refresh,
+        'reason': decision.reason,
+        'outcome': outcome,
+    }
+    logger.info('IdP session check: %(reason)s, %(outcome)s' % entry)
+
+    try:
+        with open(path.join(home, DECISION_LOG), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+    except OSError as e:
+        logger.warning('Unable to record IdP session check: %s' % e)
+
+
+def summarize(home: str) -> Dict[Tuple[str, str], int]:
+    """
+    Counts the decisions logged by reason and outcome.
+
+    A refresh_failed outcome is a refresh the check failed to avoid.
+    """
+    counts: Counter = Counter()
+
+    try:
+        with open(path.join(home, DECISION_LOG)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    counts[entry['reason'], entry['outcome']] += 1
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+
+    return dict(counts)
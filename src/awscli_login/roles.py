@@ -0,0 +1,253 @@
+"""
+Indexes the roles in a SAML assertion, maps them to AWS CLI profiles
+and assumes them concurrently.
+
+A single login may write the credentials of many profiles by listing
+role ARNs, or fnmatch patterns, and the profiles they map to in
+~/.aws-login/config. Profile names may refer to the {account} and
+{role} of the matched role::
+
+    [admin]
+    ecp_endpoint_url = https://idp.example.com/idp/profile/SAML2/SOAP/ECP
+    role_profiles =
+        arn:aws:iam::111111111111:role/Admin = prod
+        arn:aws:iam::*:role/ReadOnly = {account}-readonly
+
+Every matched role is assumed with the same SAML assertion over a
+bounded thread pool, and every profile is written to
+~/.aws/credentials in a single pass.
+"""
+import logging
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from os import path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from awscli_login import cache
+from awscli_login.credentials import CredentialsFile, sts_values
+from awscli_login.exceptions import InvalidRoleProfiles, NoRolesMatched
+from awscli_login.sts import assume_role_with_saml
+from awscli_login.typing import Role
+
+# STS throttles AssumeRoleWithSAML per account; the client's adaptive
+# retries slow every thread down once it does.
+MAX_WORKERS = 8
+
+logger = logging.getLogger(__name__)
+
+Mapping = List[Tuple[str, str]]
+Results = Dict[str, Dict[str, Any]]
+
+_MAGIC = re.compile('[*?[]')
+
+
+class Roles(List[Role]):
+    """
+    The roles returned by an IdP, in the order returned, indexed by
+    role ARN, account id and role name.
+
+    The indexes are built on first use, so a Roles must not be
+    modified after that.
+    """
+
+    def __init__(self, roles: Iterable[Tuple[str, str]] = ()) -> None:
+        super().__init__(role if type(role) is Role else Role(*role)
+                         for role in roles)
+        self._arns: Optional[Dict[str, int]] = None
+
+    def _index(self) -> Dict[str, int]:
+        if self._arns is None:
+            self._arns = {}
+            self._accounts: Dict[str, List[int]] = {}
+            self._names: Dict[str, List[int]] = {}
+
+            for i, (_, arn) in enumerate(self):
+                # One split instead of Role.account_id and Role.name
+                _, _, _, _, account, resource = arn.split(':', 5)
+                name = resource.rsplit('/', 1)[-1]
+                self._arns.setdefault(arn, i)
+                self._accounts.setdefault(account, []).append(i)
+                self._names.setdefault(name, []).append(i)
+
+        return self._arns
+
+    @property
+    def accounts(self) -> List[str]:
+        """ The account ids, in the order first returned. """
+        self._index()
+        return list(self._accounts)
+
+    def get(self, arn: str) -> Optional[Role]:
+        """ Returns the role with an ARN or None. """
+        i = self._index().get(arn)
+        return None if i is None else self[i]
+
+    def match(self, pattern: str) -> List[Role]:
+        """ Returns the roles whose ARN matches an fnmatch pattern. """
+        if not _MAGIC.search(pattern):
+            role = self.get(pattern)
+            return [] if role is None else [role]
+
+        return [role for role in self if fnmatchcase(role.arn, pattern)]
+
+    def positions(self, account_id: str) -> List[int]:
+        """ Returns the positions of an account's roles. """
+        self._index()
+        return self._accounts.get(account_id, [])
+
+    def by_account(self, account_id: str) -> List[Role]:
+        """ Returns the roles in an account. """
+        return [self[i] for i in self.positions(account_id)]
+
+    def by_name(self, name: str) -> List[Role]:
+        """ Returns the roles with a name, in any account. """
+        self._index()
+        return [self[i] for i in self._names.get(name, [])]
+
+
+def parse_role_profiles(value: str) -> Mapping:
+    """
+    Parses the role_profiles option.
+
+    Args:
+        value: Lines of the form <role ARN or pattern> = <profile>.
+
+    Returns:
+        A list of (pattern, profile) tuples in the order given.
+
+    Raises:
+        InvalidRoleProfiles: If a line can not be parsed.
+    """
+    mapping = []
+
+    for line in value.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        pattern, sep, profile = line.rpartition('=')
+        pattern, profile = pattern.strip(), profile.strip()
+        if not sep or not pattern or not profile:
+            raise InvalidRoleProfiles(line)
+
+        mapping.append((pattern, profile))
+
+    return mapping
+
+
+def _profile_name(template: str, role: Role) -> str:
+    try:
+        return template.format(account=role.account_id, role=role.name)
+    except (KeyError, IndexError, ValueError):
+        raise InvalidRoleProfiles(template)
+
+
+def map_roles(mapping: Mapping, roles: List[Role]) -> Dict[str, Role]:
+    """
+    Maps the roles returned by the IdP to profiles.
+
+    Each role is mapped by the first pattern it matches.
+
+    Returns:
+        A dict of profile names to roles.
+
+    Raises:
+        NoRolesMatched: If no role matched.
+        InvalidRoleProfiles: If two roles map to the same profile.
+    """
+    targets: Dict[str, Role] = {}
+
+    for role in roles:
+        for pattern, template in mapping:
+            if fnmatchcase(role.arn, pattern):
+                name = _profile_name(template, role)
+                if name in targets:
+                    raise InvalidRoleProfiles('%s = %s' % (pattern, name))
+
+                targets[name] = role
+                break
+
+    if not targets:
+        raise NoRolesMatched()
+
+    return targets
+
+
+def assume_roles(client, saml: str, targets: Dict[str, Role],
+                 max_workers: int = MAX_WORKERS,
+                 duration: Optional[int] = None) \
+                 -> Tuple[Results, Dict[str, Exception]]:
+    """
+    Assumes many roles concurrently using one SAML assertion.
+
+    Args:
+        client: A boto3 STS client. Clients are thread safe.
+        saml: A base 64 encoded SAML assertion.
+        targets: A dict of profile names to roles.
+        max_workers: The most concurrent requests to STS.
+        duration: The session duration in seconds to request.
+
+    Returns:
+        The Credentials dict of each profile that succeeded, and the
+        exception raised for each profile that failed.
+    """
+    def assume(role: Role) -> Dict[str, Any]:
+        token = assume_role_with_saml(client, role, saml, duration)
+        return token['Credentials']
+
+    results: Results = {}
+    errors: Dict[str, Exception] = {}
+    workers = max(1, min(max_workers, len(targets)))
+
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {name: pool.submit(assume, role)
+                   for name, role in targets.items()}
+
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+            logger.info("Retrieved temporary Amazon credentials for role: " +
+                        targets[name].arn)
+        except Exception as e:
+            logger.error('Unable to assume role %s for profile %s: %s' %
+                         (targets[name].arn, name, e))
+            errors[name] = e
+
+    return results, errors
+
+
+def save(credentials_file: str, cache_dir: str, targets: Dict[str, Role],
+         results: Results) -> None:
+    """ Writes every profile's credentials in one pass, and caches them. """
+    with CredentialsFile(credentials_file) as credentials:
+        credentials.update_many(
+            (name, sts_values(creds)) for name, creds in results.items()
+        )
+
+    for name, creds in results.items():
+        cache.save(path.join(cache_dir, name + '.json'), creds, targets[name])
+
+    logger.info("Saved temporary STS credentials to profile(s): " +
+                ', '.join(results))
+
+
+def primary(name: str, profiles: Iterable[str]) -> str:
+    """ Returns the profile whose credentials a login reports. """
+    profiles = sorted(profiles)
+    return name if name in profiles else profiles[0]
+
+
+def save_profiles(filename: str, targets: Dict[str, Role]) -> None:
+    """ Records the profiles written by a login, for logout. """
+    cache.write(filename, {name: list(role) for name, role in targets.items()})
+
+
+def load_profiles(filename: str) -> Optional[Dict[str, Role]]:
+    """ Returns the profiles written by a login or None. """
+    entry = cache.load(filename)
+    if entry is None:
+        return None
+
+    return {name: Role(*role) for name, role in entry.items()}
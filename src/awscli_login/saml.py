@@ -1,20 +1,26 @@
 import logging
 import re
+import threading
 
 import lxml.etree as ET
 
 from base64 import b64encode
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timezone
 from uuid import uuid4
-from http.cookiejar import LWPCookieJar
+from http.cookiejar import CookieJar
 from typing import cast
-from typing import List, Tuple
+from typing import Any, List, NamedTuple, Optional, Tuple
 
 from lxml.etree import XMLSyntaxError
 from lxml.etree import tostring, Element, SubElement
 from requests import Session
 from requests.cookies import RequestsCookieJar
 
+from awscli_login import idp_session
+from awscli_login.cookies import cookie_jar
+from awscli_login.roles import Roles
+from awscli_login.transport import get_transport
 from awscli_login.typing import Role, Headers
 from awscli_login.exceptions import (
     AuthnFailed,
@@ -31,6 +37,32 @@ ns = {
        'saml2p': 'urn:oasis:names:tc:SAML:2.0:protocol',
 }
 
+# IdP responses larger than this are rejected unparsed
+MAX_RESPONSE_SIZE = 16 * 1024 * 1024  # in bytes
+CHUNK_SIZE = 64 * 1024  # in bytes
+
+_RESPONSE = ET.XPath('/S:Envelope/S:Body/saml2p:Response', namespaces=ns)
+_STATUS = ET.XPath('saml2p:Status/saml2p:StatusCode/@Value', namespaces=ns)
+_ASSERTION = ET.XPath('saml2:Assertion', namespaces=ns)
+_CONDITIONS = ET.XPath('saml2:Conditions', namespaces=ns)
+_ROLES = ET.XPath("saml2:AttributeStatement/saml2:Attribute[@Name="
+                  "'https://aws.amazon.com/SAML/Attributes/Role']/"
+                  "saml2:AttributeValue", namespaces=ns)
+_SESSION_DURATION = ET.XPath(
+    "saml2:AttributeStatement/saml2:Attribute[@Name="
+    "'https://aws.amazon.com/SAML/Attributes/SessionDuration']/"
+    "saml2:AttributeValue/text()", namespaces=ns)
+
+# Matches role and SAML provider ARNs in every partition
+_ARN = re.compile(r'arn:aws[a-z-]*:iam::[0-9]+:(role|saml-provider)/[^,:\s]+')
+_PAIR = re.compile(r'\s*(%s)\s*,\s*(%s)\s*' % (_ARN.pattern, _ARN.pattern))
+
+_local = threading.local()
+
+# Successful refreshes by this process, and those that updated the jar
+refresh_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,6 +71,164 @@ def utcnow() -> datetime:
     return datetime.utcnow()
 
 
+class SamlResponse(NamedTuple):
+    """
+    The parts of an IdP's SAML response used by a login.
+
+    Attributes:
+        status: The top level SAML status code.
+        assertion: The base 64 encoded SAML Response element.
+        roles: A list of tuples containing a SAML provider ARN and
+            a role ARN.
+        not_before: The start of the assertion's validity window.
+        not_on_or_after: The end of the assertion's validity window.
+        session_duration: The longest session in seconds the IdP
+            allows, if it sent one.
+    """
+    status: Optional[str]
+    assertion: str
+    roles: Roles
+    not_before: Optional[datetime] = None
+    not_on_or_after: Optional[datetime] = None
+    session_duration: Optional[int] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == SAML_SUCCESS
+
+
+def parse_instant(value: Optional[str]) -> Optional[datetime]:
+    """ Parses a SAML xs:dateTime in UTC, or returns None. """
+    if not value or not value.endswith('Z'):
+        return None
+
+    seconds, _, fraction = value[:-1].partition('.')
+    try:
+        instant = datetime.strptime(seconds, '%Y-%m-%dT%H:%M:%S')
+        micro = int((fraction + '000000')[:6]) if fraction else 0
+    except ValueError:
+        return None
+
+    return instant.replace(microsecond=micro, tzinfo=timezone.utc)
+
+
+def _response_span(soap: bytes, resp: Element) -> Optional[bytes]:
+    """
+    Returns the bytes of the Response element as sent by the IdP, or
+    None if they are not well formed by themselves.
+
+    The span may stand alone when it declares every namespace prefix
+    it uses. Prefixes inherited from the SOAP envelope that are never
+    mentioned in the span, such as the envelope's own, are harmless.
+    """
+    if resp.getroottree().docinfo.encoding.upper() not in ('UTF-8', 'ASCII'):
+        return None
+
+    tag = (resp.prefix + ':Response' if resp.prefix else 'Response').encode()
+    start = [m.start() for m in re.finditer(b'<' + tag + rb'[\s/>]', soap)]
+    end = soap.rfind(b'</' + tag + b'>')
+    if len(start) != 1 or end < start[0]:
+        return None
+
+    span = soap[start[0]:end + len(tag) + 3]
+    head = span[:span.find(b'>')]
+    declared = set(re.findall(rb'xmlns(?::([\w.-]+))?\s*=', head))
+
+    for prefix in resp.nsmap:
+        if prefix is None:
+            if b'' not in declared:
+                return None
+        elif prefix.encode() not in declared and \
+                prefix.encode() + b':' in span:
+            return None
+
+    return span
+
+
+def _parser() -> ET.XMLParser:
+    """
+    Returns this thread's parser for untrusted IdP responses.
+
+    It never touches the network, loads DTDs or expands entities,
+    and keeps libxml2's limits on the depth and size of documents.
+    Parsers may not be shared between threads.
+    """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = ET.XMLParser(
+            resolve_entities=False,
+            no_network=True,
+            load_dtd=False,
+            huge_tree=False,
+        )
+
+    return parser
+
+
+def parse_xml(soap: bytes) -> Element:
+    """
+    Parses an untrusted XML document.
+
+    Raises:
+        XMLSyntaxError: If the document contains syntax errors, or
+            a DTD, which SOAP forbids.
+    """
+    root = ET.fromstring(soap, _parser())
+    if root.getroottree().docinfo.internalDTD is not None:
+        raise XMLSyntaxError('DTDs are forbidden', None, 0, 0)
+
+    return root
+
+
+def parse_saml_response(soap: bytes) -> SamlResponse:
+    """
+    Parses a SAML SOAP response from an IdP in a single pass.
+
+    The base 64 assertion is taken from the bytes sent by the IdP
+    when possible, and otherwise from the re-serialized element.
+
+    Args:
+        soap: A byte string containing a SOAP response from an IdP.
+
+    Returns:
+        A SamlResponse. Its roles and validity window are empty
+        unless authentication succeeded.
+
+    Raises:
+        XMLSyntaxError: If the SOAP response contains syntax errors.
+        RoleParseFail: If a role can not be parsed.
+    """
+    found = _RESPONSE(parse_xml(soap))
+    if not found:
+        return SamlResponse(None, '', Roles())
+
+    resp = found[0]
+    status = next(iter(_STATUS(resp)), None)
+    if status != SAML_SUCCESS:
+        return SamlResponse(status, '', Roles())
+
+    assertion = next(iter(_ASSERTION(resp)), None)
+    if assertion is None:
+        return SamlResponse(status, '', Roles())
+
+    roles = _ROLES(assertion)
+    conditions: Any = next(iter(_CONDITIONS(assertion)), {})
+    duration = next(iter(_SESSION_DURATION(assertion)), '').strip()
+
+    span = _response_span(soap, resp)
+    if span is None:
+        span = tostring(resp)
+
+    return SamlResponse(
+        status=status,
+        assertion=b64encode(span).decode("us-ascii"),
+        roles=parse_role_arns(roles),
+        not_before=parse_instant(conditions.get('NotBefore')),
+        not_on_or_after=parse_instant(conditions.get('NotOnOrAfter')),
+        session_duration=int(duration) if duration.isdigit() else None,
+    )
+
+
 def raise_if_saml_failed(soap: bytes) -> None:
     """
     Parses a SAML SOAP response to determine if authentication
@@ -52,19 +242,33 @@ def raise_if_saml_failed(soap: bytes) -> None:
         AuthnFailed: If a SAML success code was not returned.
         XMLSyntaxError: If the SOAP response contains syntax errors.
     """
-    xml = ET.fromstring(soap)
+    if not parse_saml_response(soap).succeeded:
+        raise AuthnFailed
 
-    elem = xml.find('S:Body/saml2p:Response/saml2p:Status' +
-                    '/saml2p:StatusCode' +
-                    '[@Value="' + SAML_SUCCESS + '"]', ns)
 
-    if elem is None:
-        raise AuthnFailed
+def read_response(r: Any, url: str) -> bytes:
+    """
+    Reads the body of a streamed response, stopping at MAX_RESPONSE_SIZE.
+
+    Raises:
+        InvalidSOAP: If the body is larger than MAX_RESPONSE_SIZE.
+    """
+    length = r.headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > MAX_RESPONSE_SIZE:
+        raise InvalidSOAP(url)
 
+    content = bytearray()
+    for chunk in r.iter_content(CHUNK_SIZE):
+        content += chunk
+        if len(content) > MAX_RESPONSE_SIZE:
+            raise InvalidSOAP(url)
 
-def saml_login(url: str, jar: LWPCookieJar,
+    return bytes(content)
+
+
+def saml_login(url: str, jar: CookieJar,
                username: str = None, password: str = None,
-               headers: Headers = None) -> bytes:
+               headers: Headers = None) -> SamlResponse:
     """
     Generates and posts a SAML AuthNRequest to an IdP.
 
@@ -75,9 +279,13 @@ def saml_login(url: str, jar: LWPCookieJar,
         headers: optional headers to provide to the IdP.
 
     Returns:
-        The SOAP response from the IdP.
+        The parsed SAML response from the IdP.
+
+    Raises:
+        AuthnFailed: If a SAML success code was not returned.
+        InvalidSOAP: If the IdP did not return valid SOAP.
     """
-    s = Session()
+    s = get_transport(url).mount(Session())
     s.cookies = cast(RequestsCookieJar, jar)
     s.headers.update({'Content-Type': 'text/xml', 'charset': 'utf-8'})
 
@@ -85,20 +293,27 @@ def saml_login(url: str, jar: LWPCookieJar,
     auth = (username, password) if username and password else None
     logger.debug("POST %s\nheaders: %s\npayload %s" %
                  (url, headers, envelope))
-    r = s.post(url, data=envelope, headers=headers, auth=auth)
-    logger.debug("POST returned: %s" % r.content)
+    r = s.post(url, data=envelope, headers=headers, auth=auth, stream=True)
+    try:
+        r.raise_for_status()
+        content = read_response(r, url)
+    finally:
+        r.close()
+    logger.debug("POST returned: %r" % content)
 
-    r.raise_for_status()
     try:
-        raise_if_saml_failed(r.content)
+        response = parse_saml_response(content)
     except XMLSyntaxError:
         raise InvalidSOAP(url)
-    return r.content
+
+    if not response.succeeded:
+        raise AuthnFailed
+    return response
 
 
 def authenticate(url: str, cookies: str,
                  username: str, password: str,
-                 headers: Headers) -> Tuple[str, List[Role]]:
+                 headers: Headers) -> SamlResponse:
     """
     Authenitcate with user credentials to IdP.
 
@@ -110,46 +325,61 @@ def authenticate(url: str, cookies: str,
         headers: Optional headers to provide to the IdP.
 
     Returns:
-        A base 64 encoded SAML assertion string, and a list of
-        tuples containing a SAML provider ARN and a Role ARN.
+        The parsed SAML response from the IdP.
     """
-    jar = LWPCookieJar(cookies)
-    soap = saml_login(url, jar, username, password, headers)
+    jar = cookie_jar(cookies, url)
+    jar.baseline()
+    response = saml_login(url, jar, username, password, headers)
 
     mesg = "Successfully authenticated with username/password"
     logger.info(mesg + " to endpoint: " + url)
 
-    jar.save(ignore_discard=True)
-    logger.info("Saved cookies to jar: " + jar.filename)
+    if jar.dirty:
+        jar.save(ignore_discard=True)
+        logger.info("Saved cookies to jar: " + jar.filename)
+    idp_session.touch(cookies, authenticated=True)
 
-    return parse_soap_response(soap)
+    return response
 
 
-def refresh(url: str, cookies: str) -> Tuple[str, List[Role]]:
+def refresh(url: str, cookies: str) -> SamlResponse:
     """
     Reauthenticate with cookies to IdP.
 
+    Cookies the IdP rotated are merged into the jar, which other
+    profiles with the same username may be saving at the same time.
+
     Args:
         url: ECP endpoint URL for the IdP.
         cookies: A path to a cookie jar.
 
     Returns:
-        A base 64 encoded SAML assertion string, and a list of
-        tuples containing a SAML provider ARN and a role ARN.
+        The parsed SAML response from the IdP.
     """
-    jar = LWPCookieJar(cookies)
+    jar = cookie_jar(cookies, url)
     try:
         jar.load(ignore_discard=True)
         logger.info("Loaded cookie jar: " + cookies)
     except FileNotFoundError:
         raise MissingCookieJar(url)
 
-    soap = saml_login(url, jar)
+    response = saml_login(url, jar)
 
     mesg = "Successfully authenticated with cookies"
     logger.info(mesg + " to endpoint: " + url)
 
-    return parse_soap_response(soap)
+    # Keep cookies the IdP rotated or extended
+    updated = jar.dirty
+    if updated:
+        jar.save(ignore_discard=True)
+        logger.info("Saved updated cookies to jar: " + cookies)
+    idp_session.touch(cookies)
+
+    with _stats_lock:
+        refresh_stats['refreshes'] += 1
+        refresh_stats['jar_updates'] += updated
+
+    return response
 
 
 def parse_soap_response(soap: bytes) -> Tuple[str, List[Role]]:
@@ -164,47 +394,52 @@ def parse_soap_response(soap: bytes) -> Tuple[str, List[Role]]:
         A base 64 encoded SAML assertion string, and a list of
         tuples containing a SAML provider ARN and a role ARN.
     """
-    body = ET.fromstring(soap)
-    resp = body.find('S:Body/saml2p:Response', ns)
-
-    roles = resp.findall("saml2:Assertion/" +
-                         "saml2:AttributeStatement/saml2:Attribute[@Name=" +
-                         "'https://aws.amazon.com/SAML/Attributes/Role']/" +
-                         "saml2:AttributeValue", ns)
+    response = parse_saml_response(soap)
+    return response.assertion, response.roles
 
-    return b64encode(tostring(resp)).decode("us-ascii"), parse_role_arns(roles)
 
-
-def parse_role_arns(roles: List[SubElement]) -> List[Role]:
+def parse_role_arns(roles: List[SubElement]) -> Roles:
     """
     Parses SAML Attributes for SAML provider and Role ARNS.
 
+    Each attribute holds a SAML provider ARN and a role ARN, in
+    either order, separated by a comma.
+
     Args:
         roles: List of XML SAML Attributes.
 
     Returns:
-        A list of tuples containing a SAML provider ARN and a
-        Role ARN.
+        The roles, indexed by ARN, account and name.
 
     Raises:
         SAML: If unable to find a SAML provider or Role ARN.
     """
     role_arns = []
-    role_regex = re.compile('.*(arn:aws:iam::([0-9]+):role/([^,:]+)).*')
-    saml_regex = re.compile(
-        '.*(arn:aws:iam::([0-9]+):saml-provider/([^,:]+)).*'
-    )
 
     for role in roles:
-        arn = role_regex.match(role.text)
-        saml = saml_regex.match(role.text)
-
-        if arn and saml:
-            role_arns.append((saml.group(1), arn.group(1)))
+        text = role.text or ''
+        pair = _PAIR.fullmatch(text)
+
+        if pair:
+            first, kind, second, other = pair.groups()
+            if kind != other:
+                role_arns.append(Role(first, second) if kind[0] == 's'
+                                 else Role(second, first))
+                continue
+
+        # Tolerate text around the ARNs
+        arns = {}
+        for part in text.split(','):
+            match = _ARN.search(part)
+            if match:
+                arns[match.group(1)] = match.group(0)
+
+        if len(arns) == 2:
+            role_arns.append(Role(arns['saml-provider'], arns['role']))
         else:
             raise RoleParseFail(role.text)
 
-    return role_arns
+    return Roles(role_arns)
 
 
 def authn_request() -> bytes:
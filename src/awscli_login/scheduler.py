@@ -0,0 +1,167 @@
+"""
+Decides when the refresh supervisor refreshes each profile.
+
+Credentials are refreshed refresh_lead seconds before they expire,
+leaving room for retries. The first refresh after login is moved
+earlier by a random amount of up to refresh_spread seconds, so that
+hosts whose users all logged in at the same time do not all contact
+the IdP at the same time. Since every later refresh is relative to
+the previous one the spread persists. Failed refreshes are retried
+using exponential backoff with full jitter, but never after the
+credentials have expired.
+
+Profiles with keepalive set also contact the IdP between refreshes,
+every half of idp_session_timeout, so that the IdP session outlives
+its inactivity timeout.
+
+All times are seconds since the epoch read from a Clock. Tests use a
+SimulatedClock so that hours of refreshes run instantly.
+"""
+import asyncio
+import random
+import time
+
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+DEFAULT_LEAD = 900  # in seconds
+DEFAULT_SPREAD = 300  # in seconds
+
+BACKOFF_BASE = 5  # in seconds
+BACKOFF_CAP = 300  # in seconds
+BACKOFF_MIN = 1  # in seconds
+
+KEEPALIVE_DEFAULT = 1800  # in seconds, if the IdP's timeout is unknown
+KEEPALIVE_MIN = 60  # in seconds
+
+
+class Clock:
+    """ Wall clock time. """
+
+    def time(self) -> float:
+        return time.time()
+
+    async def wait(self, event: asyncio.Event,
+                   timeout: Optional[float]) -> None:
+        """ Waits for an event to be set, for up to timeout seconds. """
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class SimulatedClock(Clock):
+    """
+    A clock that only moves when told to or when waited on.
+
+    Waiting with a timeout advances the clock instead of sleeping.
+    """
+
+    def __init__(self, now: float = 0) -> None:
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    async def wait(self, event: asyncio.Event,
+                   timeout: Optional[float]) -> None:
+        if timeout is None:
+            await event.wait()
+        else:
+            self.advance(timeout)
+            await asyncio.sleep(0)
+
+    def advance(self, seconds: float) -> None:
+        self.now += max(seconds, 0)
+
+
+class Schedule(NamedTuple):
+    """ A profile's refresh settings from ~/.aws-login/config.
+
+    Attributes:
+        lead: Refresh this many seconds before the credentials expire.
+        spread: Spread the first refresh over this many seconds.
+        interval: If set, never wait longer than this many seconds
+            between refreshes.
+    """
+    lead: int = DEFAULT_LEAD
+    spread: int = DEFAULT_SPREAD
+    interval: int = 0
+
+
+class Scheduler:
+    """
+    Computes refresh deadlines.
+
+    Args:
+        clock: The source of the current time.
+        rng: The source of jitter.
+    """
+    clock: Clock
+
+    def __init__(self, clock: Optional[Clock] = None,
+                 rng: Optional[random.Random] = None) -> None:
+        self.clock = clock if clock is not None else Clock()
+        self._rng = rng if rng is not None else random.SystemRandom()
+
+    def time(self) -> float:
+        return self.clock.time()
+
+    def next(self, expires: datetime, schedule: Schedule) -> float:
+        """ Returns when to refresh credentials expiring at expires. """
+        now = self.time()
+        ttl = expires.timestamp() - now
+
+        # Short lived credentials are refreshed half way through
+        when = now + ttl - min(schedule.lead, ttl / 2)
+        if schedule.interval:
+            when = min(when, now + schedule.interval)
+
+        return max(when, now)
+
+    def first(self, expires: datetime, schedule: Schedule) -> float:
+        """ Returns when to first refresh credentials after login. """
+        now = self.time()
+        when = self.next(expires, schedule)
+        spread = min(schedule.spread, when - now)
+
+        return when - self._rng.uniform(0, max(spread, 0))
+
+    def keepalive(self, last: float, timeout: int = 0) -> float:
+        """
+        Returns when to next contact the IdP to keep a session alive.
+
+        Args:
+            last: When the IdP was last contacted.
+            timeout: The IdP's inactivity timeout in seconds, or 0 if
+                unknown.
+        """
+        interval = max(timeout // 2, KEEPALIVE_MIN) if timeout \
+            else KEEPALIVE_DEFAULT
+
+        return max(last + interval, self.time())
+
+    def retry(self, expires: datetime, attempt: int) -> Optional[float]:
+        """
+        Returns when to retry a failed refresh.
+
+        Args:
+            expires: When the current credentials expire.
+            attempt: The number of consecutive failures so far,
+                starting at 1.
+
+        Returns:
+            The time to retry, or None if the credentials expire too
+            soon to retry.
+        """
+        now = self.time()
+        ceiling = min(
+            BACKOFF_CAP,
+            BACKOFF_BASE * 2 ** (attempt - 1),
+            expires.timestamp() - now,
+        )
+
+        if ceiling < BACKOFF_MIN:
+            return None
+
+        return now + self._rng.uniform(0, ceiling)
@@ -0,0 +1,215 @@
+"""
+Selects a role from the roles returned by an IdP.
+
+Roles are listed by account with the most recently and frequently
+used first. Typing part of an account id, account alias or role name
+instead of a number narrows the list, and each further refinement
+only searches the roles left by the last one. Account aliases are
+not in the SAML assertion, so they are read from the account_aliases
+option::
+
+    [admin]
+    ecp_endpoint_url = https://idp.example.com/idp/profile/SAML2/SOAP/ECP
+    account_aliases =
+        111111111111 = prod
+        222222222222 = dev
+
+Usage is kept in ~/.aws-login/cache/usage.json as a score per role
+ARN that halves every HALF_LIFE seconds and grows by one each time
+the role is selected.
+"""
+import logging
+import os
+
+from collections import OrderedDict
+from time import time
+from typing import Dict, List, Optional
+
+from awscli_login import cache
+from awscli_login.exceptions import InvalidAccountAliases
+from awscli_login.roles import Roles
+from awscli_login.typing import Role
+from awscli_login.util import sort_roles
+
+HALF_LIFE = 14 * 24 * 3600  # in seconds
+MAX_ENTRIES = 200  # roles remembered
+PAGE = 40  # roles listed at once
+
+logger = logging.getLogger(__name__)
+
+
+def parse_account_aliases(value: Optional[str]) -> Dict[str, str]:
+    """
+    Parses the account_aliases option.
+
+    Args:
+        value: Lines of the form <account id> = <alias>.
+
+    Returns:
+        A dict mapping account ids to aliases.
+
+    Raises:
+        InvalidAccountAliases: If a line can not be parsed.
+    """
+    aliases = {}
+
+    for line in (value or '').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        account, sep, alias = line.partition('=')
+        account, alias = account.strip(), alias.strip()
+        if not sep or not account.isdigit() or not alias:
+            raise InvalidAccountAliases(line)
+
+        aliases[account] = alias
+
+    return aliases
+
+
+class Usage:
+    """ How recently and frequently each role has been selected. """
+
+    def __init__(self, filename: Optional[str] = None) -> None:
+        self.filename = filename
+        entries = cache.load(filename) if filename else None
+        self.entries: Dict[str, List[float]] = \
+            entries if isinstance(entries, dict) else {}
+
+    def score(self, arn: str, now: Optional[float] = None) -> float:
+        """ Returns the decayed score of a role, or 0 if never used. """
+        try:
+            score, last = self.entries[arn]
+        except (KeyError, TypeError, ValueError):
+            return 0.0
+
+        now = time() if now is None else now
+        return score * 0.5 ** (max(now - last, 0) / HALF_LIFE)
+
+    def record(self, arn: str, now: Optional[float] = None) -> None:
+        """ Records that a role was selected and saves the usage. """
+        now = time() if now is None else now
+        self.entries[arn] = [self.score(arn, now) + 1, now]
+
+        if len(self.entries) > MAX_ENTRIES:
+            keep = sorted(self.entries, key=lambda a: self.score(a, now),
+                          reverse=True)[:MAX_ENTRIES]
+            self.entries = {a: self.entries[a] for a in keep}
+
+        if self.filename:
+            try:
+                os.makedirs(os.path.dirname(self.filename), mode=0o700,
+                            exist_ok=True)
+                cache.write(self.filename, self.entries)
+            except OSError as e:
+                logger.warning('Unable to save role usage: %s' % e)
+
+
+class RoleIndex:
+    """
+    A search index over the account ids, account aliases and names of
+    a set of roles, ranked by usage.
+    """
+
+    def __init__(self, roles: Roles, aliases: Optional[Dict[str, str]] = None,
+                 usage: Optional[Usage] = None) -> None:
+        self.roles = roles
+        self.aliases = aliases or {}
+
+        keys = {}
+        for acct, group in sort_roles(roles):
+            alias = self.aliases.get(acct, '')
+            for i, name in group:
+                keys[i] = ' '.join((acct, alias, name)).lower()
+        self.keys = keys
+
+        # Python's sort is stable, so unused roles stay in account order
+        order = list(keys)
+        if usage is not None and usage.entries:
+            now = time()
+            scores = {i: usage.score(roles[i].arn, now) for i in order}
+            order.sort(key=lambda i: -scores[i])
+        self.order = order
+
+    def search(self, query: str, within: Optional[List[int]] = None) \
+            -> List[int]:
+        """
+        Returns the positions of the roles matching every word of a
+        query, in rank order.
+
+        Args:
+            query: Words to find in the account id, alias or role name.
+            within: Positions to search, by default every role.
+        """
+        terms = query.lower().split()
+        candidates = self.order if within is None else within
+
+        return [i for i in candidates
+                if all(term in self.keys[i] for term in terms)]
+
+    def groups(self, positions: List[int]) \
+            -> 'OrderedDict[str, List[int]]':
+        """ Groups positions by account, in rank order. """
+        accounts: 'OrderedDict[str, List[int]]' = OrderedDict()
+        for i in positions:
+            accounts.setdefault(self.roles[i].account_id, []).append(i)
+
+        return accounts
+
+
+def _show(index: RoleIndex, matches: List[int]) -> List[int]:
+    """ Lists up to PAGE matches and returns their positions by number. """
+    choices: List[int] = []
+
+    for acct, positions in index.groups(matches[:PAGE]).items():
+        alias = index.aliases.get(acct)
+        print(' ' * 4, "Account:", acct + (' (%s)' % alias if alias else ''))
+
+        for i in positions:
+            print(' ' * 8, "[ %d ]:" % len(choices), index.roles[i].name)
+            choices.append(i)
+
+    if len(matches) > PAGE:
+        print(' ' * 4, "... and %d more. Type part of an account or role "
+              "name to narrow the list." % (len(matches) - PAGE))
+
+    return choices
+
+
+def select(index: RoleIndex) -> Role:
+    """
+    Prompts the user until a role is selected.
+
+    A number selects the role listed with it, other input, including
+    numbers not listed such as part of an account id, narrows the list
+    to the roles matching it, and an empty line selects the only role
+    left or lists every role again.
+    """
+    matches, query = index.order, ''
+
+    print("Please choose the role you would like to assume:")
+    choices = _show(index, matches)
+    print("Selection:\a ", end='')
+
+    while True:
+        answer = str(input()).strip()
+
+        if answer.isdigit() and int(answer) < len(choices):
+            return index.roles[choices[int(answer)]]
+        elif not answer and len(matches) == 1:
+            return index.roles[matches[0]]
+        else:
+            # Refining the last query can only remove matches
+            within = matches if query and answer.startswith(query) else None
+            found = index.search(answer, within)
+
+            if found:
+                matches, query = found, answer
+                choices = _show(index, matches)
+            elif answer.isdigit():
+                print("Invalid selection: %s" % answer)
+            else:
+                print("No roles match: %s" % answer)
+
+        print("Selection: ", end='')
@@ -0,0 +1,152 @@
+"""
+A localhost credentials endpoint compatible with the AWS SDKs'
+container credential provider.
+
+Clients are configured with::
+
+    AWS_CONTAINER_CREDENTIALS_FULL_URI=http://127.0.0.1:<port>/<profile>
+    AWS_CONTAINER_AUTHORIZATION_TOKEN_FILE=~/.aws-login/<profile>.token
+
+Credentials are served from memory, so clients never see a partially
+written ~/.aws/credentials file.
+"""
+import json
+import logging
+import os
+import secrets
+
+from hmac import compare_digest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+from awscli_login.credentials import iso8601
+
+LOCALHOST = '127.0.0.1'
+
+logger = logging.getLogger(__name__)
+
+
+def new_token() -> str:
+    """ Returns a random authorization token. """
+    return secrets.token_urlsafe(32)
+
+
+def save_token(filename: str, token: str) -> None:
+    """ Writes an authorization token to a file only we can read. """
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: 'CredentialServer'
+
+    # Headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        auth = self.headers.get('Authorization', '')
+        found = self.server.lookup(self.path.strip('/'))
+
+        if found is None:
+            # Do not reveal which profiles are served
+            self._reply(401, b'{"message": "Unauthorized"}')
+            return
+
+        token, body = found
+        if not compare_digest(auth.encode(), token.encode()):
+            self._reply(401, b'{"message": "Unauthorized"}')
+        else:
+            self._reply(200, body)
+
+    def _reply(self, code: int, body: bytes) -> None:
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug('%s %s' % (self.address_string(), format % args))
+
+
+class CredentialServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves STS credentials for one or more profiles over HTTP.
+
+    Each profile has its own authorization token. Each request is
+    handled in its own thread, so slow clients never block each other
+    or the refresh loop that calls update.
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int) -> None:
+        super().__init__((LOCALHOST, port), _Handler)
+        self._lock = Lock()
+        self._profiles: Dict[str, Tuple[str, bytes]] = {}
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def url(self, profile: str) -> str:
+        """ Returns the AWS_CONTAINER_CREDENTIALS_FULL_URI for a profile. """
+        return 'http://%s:%d/%s' % (LOCALHOST, self.port, profile)
+
+    def update(self, profile: str, creds: Dict[str, Any],
+               token: Optional[str] = None) -> None:
+        """
+        Replaces the credentials served for a profile.
+
+        Args:
+            profile: The name of the profile.
+            creds: The Credentials dict returned by STS.
+            token: The profile's authorization token. Required the
+                first time a profile is updated.
+        """
+        body = json.dumps({
+            'AccessKeyId': creds['AccessKeyId'],
+            'SecretAccessKey': creds['SecretAccessKey'],
+            'Token': creds['SessionToken'],
+            'Expiration': iso8601(creds['Expiration']),
+        }).encode()
+
+        with self._lock:
+            if token is None:
+                token = self._profiles[profile][0]
+            self._profiles[profile] = (token, body)
+
+    def remove(self, profile: str) -> None:
+        """ Stops serving credentials for a profile. """
+        with self._lock:
+            self._profiles.pop(profile, None)
+
+    @property
+    def profiles(self) -> List[str]:
+        """ The names of the profiles being served. """
+        with self._lock:
+            return list(self._profiles)
+
+    def lookup(self, profile: str) -> Optional[Tuple[str, bytes]]:
+        """ Returns a profile's token and serialized credentials or None.
+
+        An empty profile name matches when a single profile is served.
+        """
+        with self._lock:
+            if not profile and len(self._profiles) == 1:
+                return next(iter(self._profiles.values()))
+            return self._profiles.get(profile)
+
+    def start(self) -> None:
+        """ Serves requests in a background thread. """
+        thread = Thread(target=self.serve_forever, name='credential-server')
+        thread.daemon = True
+        thread.start()
+        logger.info('Serving credentials on port %d' % self.port)
+
+    def stop(self) -> None:
+        """ Stops the background thread and closes the socket. """
+        self.shutdown()
+        self.server_close()
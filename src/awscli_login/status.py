@@ -0,0 +1,439 @@
+"""
+A memory-mapped table of the state of every refreshed profile.
+
+The refresh supervisor keeps a fixed-size record per registered
+profile in ~/.aws-login/status.tbl, updating it in place whenever the
+profile is scheduled. aws login status reads the table directly, so
+it needs neither the supervisor nor anything beyond the standard
+library, and takes microseconds.
+
+Each record starts with a sequence number that the writer makes odd
+while updating the record and even again when done. Readers retry a
+record until they see the same even number before and after copying
+it, so they never return a half written record. The file only grows,
+so that a reader never touches a page truncated under it.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from os import path
+from threading import Lock
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from awscli_login.const import CONFIG_DIR
+
+TABLE = path.join(CONFIG_DIR, 'status.tbl')
+
+MAGIC = b'ALST'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+HEADER_SIZE = 64
+SLOT_SIZE = 1024
+SLOTS = 64  # added whenever the table is full
+RETRIES = 100
+
+# seq, flags, pid, failures, started, expiration, next_refresh,
+# next_keepalive, latency, idp_session_end, updated, name, role, profiles
+RECORD = struct.Struct('<IIiIddddddd128s256s256s')
+SEQ = struct.Struct('<I')
+NAME_SIZE = 128
+TEXT_SIZE = 256
+
+IN_USE = 1
+KEEPALIVE = 2
+ROLE_TRUNCATED = 4
+PROFILES_TRUNCATED = 8
+
+TOO_LONG = '(too long to show)'
+
+
+class Status(NamedTuple):
+    """ The state of a profile refreshed by the supervisor.
+
+    Times are seconds since the epoch, or None if unknown.
+
+    Attributes:
+        name: The login profile.
+        pid: The supervisor's process id.
+        started: When the supervisor started.
+        role: The role ARN of the profile.
+        profiles: Every profile whose credentials are written.
+        expiration: When the credentials expire.
+        next_refresh: When the credentials are next refreshed.
+        keepalive: True if the IdP session is kept alive.
+        next_keepalive: When the IdP session is next kept alive.
+        latency: How many seconds the last refresh took.
+        failures: The number of consecutive failed refreshes.
+        idp_session_end: When the IdP session is predicted to end.
+        updated: When this record was last written.
+        truncated: The attributes too long to be kept in the table.
+            A truncated role is empty, and only the profiles that fit
+            in full are listed.
+    """
+    name: str
+    pid: int
+    started: float
+    role: str
+    profiles: List[str]
+    expiration: float
+    next_refresh: Optional[float]
+    keepalive: bool
+    next_keepalive: Optional[float]
+    latency: Optional[float]
+    failures: int
+    idp_session_end: Optional[float]
+    updated: float
+    truncated: Tuple[str, ...] = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns a JSON serializable dict with ISO 8601 times. """
+        r = self._asdict()
+        for key in ('started', 'expiration', 'next_refresh',
+                    'next_keepalive', 'idp_session_end', 'updated'):
+            r[key] = iso(r[key])
+
+        return r
+
+
+def iso(when: Optional[float]) -> Optional[str]:
+    """ Formats a time like awscli_login.credentials.iso8601. """
+    if not when:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(when))
+
+
+def _join(values: Iterable[str], size: int) -> Tuple[bytes, bool]:
+    """ Joins as many whole values as fit, and if any were left out. """
+    joined = b''
+    for value in values:
+        item = value.encode() if not joined else b',' + value.encode()
+        if len(joined) + len(item) > size:
+            return joined, True
+        joined += item
+
+    return joined, False
+
+
+def _pack(status: Status, seq: int) -> bytes:
+    flags = IN_USE | (KEEPALIVE if status.keepalive else 0)
+
+    role = status.role.encode()
+    if len(role) > TEXT_SIZE:
+        role = b''  # Rather than show a wrong ARN
+        flags |= ROLE_TRUNCATED
+
+    profiles, cut = _join(status.profiles, TEXT_SIZE)
+    if cut:
+        flags |= PROFILES_TRUNCATED
+
+    return RECORD.pack(
+        seq, flags, status.pid, status.failures, status.started,
+        status.expiration, status.next_refresh or 0,
+        status.next_keepalive or 0, status.latency or 0,
+        status.idp_session_end or 0, status.updated,
+        status.name.encode(), role, profiles,
+    )
+
+
+def _unpack(record: bytes) -> Optional[Status]:
+    (_, flags, pid, failures, started, expiration, next_refresh,
+     next_keepalive, latency, idp_session_end, updated, name, role,
+     profiles) = RECORD.unpack(record)
+
+    if not flags & IN_USE:
+        return None
+
+    def text(value: bytes) -> str:
+        return value.rstrip(b'\0').decode(errors='ignore')
+
+    truncated = []
+    if flags & ROLE_TRUNCATED:
+        truncated.append('role')
+    if flags & PROFILES_TRUNCATED:
+        truncated.append('profiles')
+
+    return Status(
+        name=text(name),
+        pid=pid,
+        started=started,
+        role=text(role),
+        profiles=[p for p in text(profiles).split(',') if p],
+        expiration=expiration,
+        next_refresh=next_refresh or None,
+        keepalive=bool(flags & KEEPALIVE),
+        next_keepalive=next_keepalive or None,
+        latency=latency or None,
+        failures=failures,
+        idp_session_end=idp_session_end or None,
+        updated=updated,
+        truncated=tuple(truncated),
+    )
+
+
+class StatusTable:
+    """
+    The supervisor's side of the status table.
+
+    Opening the table clears records left by an earlier supervisor.
+
+    Args:
+        filename: The table, normally ~/.aws-login/status.tbl.
+    """
+    filename: str
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._lock = Lock()
+        self._slots: Dict[str, int] = {}
+        self._mm: Optional[mmap.mmap] = None
+
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+        self._file = os.fdopen(fd, 'r+b')
+        self._file.seek(0)
+        header = self._file.read(HEADER.size)
+
+        count = 0
+        if header == HEADER.pack(MAGIC, VERSION, SLOT_SIZE):
+            count = (os.fstat(fd).st_size - HEADER_SIZE) // SLOT_SIZE
+        mm = self._map(max(count, SLOTS))
+
+        if not count:
+            mm[:] = bytes(len(mm))  # An empty or foreign file
+            mm[:HEADER.size] = HEADER.pack(MAGIC, VERSION, SLOT_SIZE)
+        for slot in range(count):
+            self._clear(slot)
+
+    def _map(self, count: int) -> mmap.mmap:
+        size = HEADER_SIZE + count * SLOT_SIZE
+        if os.fstat(self._file.fileno()).st_size < size:
+            os.ftruncate(self._file.fileno(), size)
+
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self._count = count
+        return self._mm
+
+    def _mapped(self) -> mmap.mmap:
+        if self._mm is None:
+            raise ValueError('The status table is closed')
+        return self._mm
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * SLOT_SIZE
+
+    def _write(self, slot: int, status: Optional[Status]) -> None:
+        mm = self._mapped()
+        offset = self._offset(slot)
+        seq = SEQ.unpack_from(mm, offset)[0]
+        seq += 1 + (seq & 1)  # Odd while writing
+
+        if status is None:
+            record = SEQ.pack(seq) + bytes(RECORD.size - SEQ.size)
+        else:
+            record = _pack(status, seq)
+
+        SEQ.pack_into(mm, offset, seq)
+        mm[offset:offset + RECORD.size] = record
+        SEQ.pack_into(mm, offset, seq + 1)
+
+    def _clear(self, slot: int) -> None:
+        offset = self._offset(slot)
+        if RECORD.unpack_from(self._mapped(), offset)[1] & IN_USE:
+            self._write(slot, None)
+
+    def update(self, status: Status) -> None:
+        """
+        Writes the record of a profile.
+
+        Raises:
+            ValueError: If the profile name is too long for the table,
+                as a cut name would not be found by aws login status.
+        """
+        if len(status.name.encode()) > NAME_SIZE:
+            raise ValueError('Profile name %s is longer than %d bytes'
+                             % (status.name, NAME_SIZE))
+
+        with self._lock:
+            slot = self._slots.get(status.name)
+            if slot is None:
+                used = set(self._slots.values())
+                slot = next((i for i in range(self._count) if i not in used),
+                            self._count)
+                if slot == self._count:
+                    self._map(self._count + SLOTS)
+                self._slots[status.name] = slot
+
+            self._write(slot, status)
+
+    def remove(self, name: str) -> None:
+        """ Clears the record of a profile. """
+        with self._lock:
+            slot = self._slots.pop(name, None)
+            if slot is not None:
+                self._write(slot, None)
+
+    def close(self) -> None:
+        """ Clears every record and closes the table. """
+        with self._lock:
+            for slot in self._slots.values():
+                self._write(slot, None)
+            self._slots.clear()
+            self._mapped().close()
+            self._mm = None
+            self._file.close()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)  # Sends no signal
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def read(filename: str) -> List[Status]:
+    """
+    Returns the record of every profile of a running supervisor.
+
+    Args:
+        filename: The table, normally ~/.aws-login/status.tbl.
+    """
+    try:
+        f = open(filename, 'rb')
+    except FileNotFoundError:
+        return []
+
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER_SIZE + SLOT_SIZE:
+            return []
+
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            if HEADER.unpack_from(mm) != (MAGIC, VERSION, SLOT_SIZE):
+                return []
+
+            found = []
+            for offset in range(HEADER_SIZE, size - SLOT_SIZE + 1,
+                                SLOT_SIZE):
+                for _ in range(RETRIES):
+                    seq = SEQ.unpack_from(mm, offset)[0]
+                    record = mm[offset:offset + RECORD.size]
+                    if not seq & 1 and \
+                            SEQ.unpack_from(mm, offset)[0] == seq:
+                        break
+                else:
+                    continue  # Being rewritten continuously
+
+                status = _unpack(record)
+                if status is not None:
+                    found.append(status)
+
+    alive: Dict[int, bool] = {}
+    return sorted((s for s in found
+                   if alive.setdefault(s.pid, _alive(s.pid))),
+                  key=lambda s: s.name)
+
+
+def _role(status: Status) -> str:
+    return TOO_LONG if 'role' in status.truncated else status.role
+
+
+def print_status(status: Status) -> None:
+    """ Prints the status of a profile. """
+    others = [p for p in status.profiles if p != status.name]
+    if 'profiles' in status.truncated:
+        others.append('...')
+    refresh = iso(status.next_refresh) or 'unknown'
+    if status.failures:
+        refresh += ' (%d failed)' % status.failures
+
+    if not status.keepalive:
+        keepalive = 'off'
+    else:
+        keepalive = iso(status.next_keepalive) or \
+            'not needed before refresh'
+
+    latency = '%.2fs' % status.latency if status.latency else ''
+
+    rows = [
+        ('Profile', status.name),
+        ('Also writes', ', '.join(others)),
+        ('Role', _role(status)),
+        ('Credentials expire', iso(status.expiration)),
+        ('Next refresh', refresh),
+        ('Last refresh took', latency),
+        ('Next keep-alive', keepalive),
+        ('IdP session ends', iso(status.idp_session_end) or 'unknown'),
+        ('Supervisor', 'pid %d since %s' % (status.pid,
+                                            iso(status.started))),
+    ]
+    for label, value in rows:
+        if value:
+            print('%-20s %s' % (label + ':', value))
+
+
+def print_table(statuses: Iterable[Status]) -> None:
+    """ Prints a line per profile. """
+    rows = [('PROFILE', 'ROLE', 'EXPIRES', 'NEXT REFRESH', 'FAILURES')]
+    rows += [(s.name, _role(s), iso(s.expiration) or '',
+              iso(s.next_refresh) or 'unknown', str(s.failures))
+             for s in statuses]
+    widths = [max(len(row[i]) for row in rows) for i in range(4)] + [0]
+
+    for row in rows:
+        print('  '.join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def status(profile: str, show_all: bool = False, as_json: bool = False,
+           home: Optional[str] = None) -> int:
+    """
+    Prints the status of a profile, or of every profile.
+
+    Args:
+        profile: The login profile to show.
+        show_all: True to show every profile being refreshed.
+        as_json: True to print JSON.
+        home: The user's home directory, by default ~.
+
+    Returns:
+        An exit code.
+    """
+    home = home if home is not None else path.expanduser('~')
+    statuses = read(path.join(home, TABLE))
+
+    if show_all:
+        if as_json:
+            print(json.dumps([s.to_dict() for s in statuses], indent=4))
+        else:
+            print_table(statuses)
+        return 0
+
+    found = next((s for s in statuses if s.name == profile), None)
+    if found is None:
+        from awscli_login.exceptions import NotLoggedIn
+
+        e = NotLoggedIn(profile)
+        print(str(e), file=sys.stderr)
+        return e.code
+
+    if as_json:
+        print(json.dumps(found.to_dict(), indent=4))
+    else:
+        print_status(found)
+    return 0
@@ -0,0 +1,215 @@
+"""
+STS clients shared by logins and refreshes.
+
+Clients are created once per region and reused, with short connect
+and read timeouts and adaptive retries, which slow down every thread
+sharing a client once STS throttles it. AssumeRoleWithSAML is
+unsigned, so the clients never look up credentials; this also keeps
+credential_process from recursively invoking itself.
+
+By default the STS endpoint of the user's configured region is used.
+The sts_region profile option picks a regional endpoint, or the one
+with the lowest latency when set to auto. Probe results are cached in
+~/.aws-login/cache/sts-region.json for a day.
+
+Roles are assumed for the longest session allowed by both the IdP's
+SessionDuration attribute and the duration profile option. A role
+whose maximum session is shorter is assumed again for the default
+hour.
+"""
+import logging
+import socket
+
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from threading import Lock
+from time import perf_counter, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from awscli_login import cache
+from awscli_login.const import CACHE_DIR
+
+AUTO = 'auto'
+
+CONNECT_TIMEOUT = 5  # in seconds
+READ_TIMEOUT = 10  # in seconds
+MAX_ATTEMPTS = 4
+
+# The range of DurationSeconds accepted by AssumeRoleWithSAML
+MIN_DURATION = 900  # in seconds
+MAX_DURATION = 43200  # in seconds
+
+PROBE_FILE = path.join(CACHE_DIR, 'sts-region.json')
+PROBE_TIMEOUT = 2  # in seconds
+PROBE_TTL = 24 * 60 * 60  # in seconds
+PROBE_REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2',
+    'ca-central-1', 'sa-east-1',
+    'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-central-1', 'eu-north-1',
+    'ap-south-1', 'ap-southeast-1', 'ap-southeast-2',
+    'ap-northeast-1', 'ap-northeast-2',
+]
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[Optional[str], Any] = {}
+_lock = Lock()
+
+
+def new_client(region: Optional[str] = None):
+    """ Returns a new STS client for a region's endpoint.
+
+    Args:
+        region: The region whose STS endpoint is used, or None for
+            the user's configured region.
+    """
+    import boto3
+
+    from botocore import UNSIGNED
+    from botocore.config import Config
+    from botocore.session import get_session
+
+    config = Config(
+        signature_version=UNSIGNED,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries={'max_attempts': MAX_ATTEMPTS, 'mode': 'adaptive'},
+    )
+    core = get_session()
+
+    if region is not None:
+        # Do not fall back to sts.amazonaws.com in us-east-1
+        core.set_config_variable('sts_regional_endpoints', 'regional')
+
+    session = boto3.session.Session(botocore_session=core)
+    return session.client('sts', region_name=region, config=config)
+
+
+def get_client(region: Optional[str] = None):
+    """ Returns the process wide STS client for a region. """
+    with _lock:
+        client = _clients.get(region)
+        if client is None:
+            client = _clients[region] = new_client(region)
+            logger.info('Created STS client for endpoint: ' +
+                        client.meta.endpoint_url)
+
+    return client
+
+
+def reset() -> None:
+    """ Forgets every client, for instance after forking. """
+    with _lock:
+        _clients.clear()
+
+
+def session_duration(option: Optional[int],
+                     allowed: Optional[int]) -> Optional[int]:
+    """
+    Returns the DurationSeconds to request from STS.
+
+    Args:
+        option: The duration profile option.
+        allowed: The SessionDuration sent by the IdP.
+
+    Returns:
+        The shorter of the two, or None to use the STS default.
+    """
+    durations = [d for d in (option, allowed) if d]
+    if not durations:
+        return None
+
+    return max(MIN_DURATION, min(MAX_DURATION, *durations))
+
+
+def assume_role_with_saml(client, role: Tuple[str, str], saml: str,
+                          duration: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Assumes a role for duration seconds.
+
+    If the role does not allow sessions that long, it is assumed
+    again for the STS default.
+
+    Returns:
+        The AssumeRoleWithSAML response.
+    """
+    from botocore.exceptions import ClientError
+
+    kwargs = {
+        'RoleArn': role[1],
+        'PrincipalArn': role[0],
+        'SAMLAssertion': saml,
+    }
+    if duration is None:
+        return client.assume_role_with_saml(**kwargs)
+
+    try:
+        return client.assume_role_with_saml(DurationSeconds=duration,
+                                            **kwargs)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ValidationError':
+            raise
+
+        logger.info('Role %s does not allow %ds sessions: %s' %
+                    (role[1], duration, e))
+        return client.assume_role_with_saml(**kwargs)
+
+
+def connect_time(region: str, timeout: float = PROBE_TIMEOUT) -> float:
+    """ Returns the seconds taken to connect to a region's STS endpoint. """
+    start = perf_counter()
+
+    try:
+        host = 'sts.%s.amazonaws.com' % region
+        with socket.create_connection((host, 443), timeout):
+            pass
+    except OSError:
+        return float('inf')
+
+    return perf_counter() - start
+
+
+def probe(regions: List[str] = PROBE_REGIONS,
+          measure: Callable[[str], float] = connect_time) -> Optional[str]:
+    """ Returns the region with the lowest latency, or None if every
+    region is unreachable. """
+    with ThreadPoolExecutor(len(regions)) as pool:
+        times = dict(zip(regions, pool.map(measure, regions)))
+
+    region = min(regions, key=lambda r: times[r])
+    if times[region] == float('inf'):
+        return None
+
+    logger.info('Fastest STS region is %s (%.1fms)' %
+                (region, times[region] * 1000))
+    return region
+
+
+def resolve_region(home: str, region: Optional[str],
+                   probe: Callable[[], Optional[str]] = probe,
+                   ttl: float = PROBE_TTL) -> Optional[str]:
+    """
+    Resolves the sts_region profile option to a region.
+
+    Args:
+        home: The user's home directory.
+        region: A region, auto, or None for the configured region.
+        probe: Returns the fastest region.
+        ttl: How long in seconds to cache the result of probe.
+
+    Returns:
+        A region or None.
+    """
+    if region != AUTO:
+        return region or None
+
+    filename = path.join(home, PROBE_FILE)
+    entry = cache.load(filename)
+    if entry and time() - entry.get('time', 0) < ttl:
+        return entry.get('region')
+
+    best = probe()
+    if best is not None:
+        cache.write(filename, {'region': best, 'time': time()})
+
+    return best
@@ -0,0 +1,1111 @@
+"""
+A single per-user process that keeps every logged in profile's STS
+credentials fresh.
+
+Profiles are held in a priority queue ordered by when they must next
+be refreshed. aws login registers a profile with the supervisor over
+a Unix domain socket in ~/.aws-login, starting the supervisor if it is
+not already running, and aws logout deregisters it. The supervisor
+exits once no profiles remain.
+
+Profiles with keepalive set are also refreshed with the IdP alone
+between credential refreshes, so that their IdP session is not ended
+by its inactivity timeout. The state of every profile, such as when
+it is next refreshed and when its IdP session is predicted to end, is
+kept in the memory-mapped status table read by aws login status.
+
+Besides registering profiles, the control socket lets aws login switch
+the role of a profile being refreshed, reusing the last SAML assertion
+while it is valid, or refresh it at once, and lets scripts change the
+log level of the supervisor or stop it.
+
+The supervisor runs on a single asyncio event loop. Each profile due
+is refreshed by its own task, and the blocking IdP and STS calls run
+on a pool of WORKERS threads, so a slow IdP delays neither other
+profiles nor requests on the control socket. SIGINT and SIGTERM stop
+the supervisor, first removing the credentials of profiles with
+logout_on_exit set.
+
+Logins hold StartLock while registering and, if that fails, starting
+a supervisor, so that concurrent logins start only one. A supervisor
+that finds another listening on the control socket exits at once.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+import signal
+import socket
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from itertools import count
+from os import path
+from threading import RLock
+from time import monotonic, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from awscli_login import cache, idp_session, sts
+from awscli_login.const import CONFIG_DIR, LOG_DIR
+from awscli_login.credentials import iso8601
+from awscli_login.exceptions import SupervisorError
+from awscli_login.roles import Roles, assume_roles, primary, save
+from awscli_login.saml import SAML_SUCCESS, SamlResponse, refresh
+from awscli_login.saml import refresh_stats
+from awscli_login.scheduler import (
+    DEFAULT_LEAD,
+    DEFAULT_SPREAD,
+    Schedule,
+    Scheduler,
+)
+from awscli_login.server import CredentialServer
+from awscli_login.status import TABLE, Status, StatusTable
+from awscli_login.sts import session_duration
+from awscli_login.typing import Role
+from awscli_login.util import clear_credentials
+
+SOCKET = path.join(CONFIG_DIR, 'supervisor.sock')
+PIDFILE = path.join(CONFIG_DIR, 'supervisor.pid')
+STARTLOCK = path.join(CONFIG_DIR, 'supervisor.lock')
+LOGFILE = path.join(LOG_DIR, 'supervisor.log')
+
+TIMEOUT = 10  # in seconds
+REFRESH_TIMEOUT = 60  # in seconds, for requests that contact the IdP
+MARGIN = 30  # in seconds, as for cached assertions
+WORKERS = 16  # threads for IdP and STS calls
+
+logger = logging.getLogger(__name__)
+
+
+def parse_iso8601(value: str) -> datetime:
+    """ The inverse of awscli_login.credentials.iso8601. """
+    expires = datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+    return expires.replace(tzinfo=timezone.utc)
+
+
+class Registration:
+    """
+    Everything the supervisor needs to refresh a logged in profile.
+
+    A login profile may write the credentials of many profiles, each
+    for its own role. creds holds those of the primary profile.
+    """
+    name: str
+    ecp_endpoint_url: str
+    cookies: str
+    profiles: Dict[str, Role]
+    credentials_file: str
+    credential_cache: str
+    pidfile: str
+    tokenfile: str
+    credentials_port: int
+    token: Optional[str]
+    creds: Dict[str, Any]
+    refresh: int
+    refresh_lead: int
+    refresh_spread: int
+    sts_region: Optional[str]
+    keepalive: bool
+    idp_session_lifetime: int
+    idp_session_timeout: int
+    authenticated: Optional[float]
+    succeeded: Optional[float]
+    logout_on_exit: bool
+    response: Optional[SamlResponse]
+
+    # Supervisor state
+    deadline: float = 0
+    retries: int = 0
+    refresh_at: float = 0
+    pinged: float = 0
+    latency: float = 0
+    _STATE = ('deadline', 'retries', 'refresh_at', 'pinged', 'latency')
+
+    def __init__(self, name: str, ecp_endpoint_url: str, cookies: str,
+                 profiles: Dict[str, Role], credentials_file: str,
+                 credential_cache: str,
+                 pidfile: str, tokenfile: str, credentials_port: int,
+                 token: Optional[str], creds: Dict[str, Any],
+                 refresh: int = 0, refresh_lead: int = DEFAULT_LEAD,
+                 refresh_spread: int = DEFAULT_SPREAD,
+                 sts_region: Optional[str] = None,
+                 duration: Optional[int] = None,
+                 keepalive: bool = False,
+                 idp_session_lifetime: int = 0,
+                 idp_session_timeout: int = 0,
+                 authenticated: Optional[float] = None,
+                 succeeded: Optional[float] = None,
+                 logout_on_exit: bool = False,
+                 response: Optional[SamlResponse] = None) -> None:
+        self.name = name
+        self.ecp_endpoint_url = ecp_endpoint_url
+        self.cookies = cookies
+        self.profiles = {k: Role(*v) for k, v in profiles.items()}
+        self.credentials_file = credentials_file
+        self.credential_cache = credential_cache
+        self.pidfile = pidfile
+        self.tokenfile = tokenfile
+        self.credentials_port = credentials_port
+        self.token = token
+        self.creds = creds
+        self.refresh = refresh
+        self.refresh_lead = refresh_lead
+        self.refresh_spread = refresh_spread
+        self.sts_region = sts_region
+        self.duration = duration
+        self.keepalive = keepalive
+        self.idp_session_lifetime = idp_session_lifetime
+        self.idp_session_timeout = idp_session_timeout
+        self.authenticated = authenticated
+        self.succeeded = succeeded
+        self.logout_on_exit = logout_on_exit
+        self.response = response
+
+    @property
+    def primary(self) -> str:
+        return primary(self.name, self.profiles)
+
+    @property
+    def role(self) -> Role:
+        """ The role of the primary profile. """
+        return self.profiles[self.primary]
+
+    def assertion(self, now: float) -> Optional[SamlResponse]:
+        """ Returns the last SAML response if its assertion is valid. """
+        response = self.response
+        if response is None or response.not_on_or_after is None or \
+                response.not_on_or_after.timestamp() - now <= MARGIN:
+            return None
+
+        return response
+
+    @property
+    def schedule(self) -> Schedule:
+        return Schedule(self.refresh_lead, self.refresh_spread, self.refresh)
+
+    @property
+    def session_end(self) -> Optional[float]:
+        """ When the IdP session is predicted to end, if known. """
+        return idp_session.session_end(
+            self.idp_session_lifetime,
+            self.idp_session_timeout,
+            self.authenticated,
+            self.succeeded,
+            self.deadline or None,
+        )
+
+    @classmethod
+    def from_profile(cls, profile, credentials_file: str,
+                     profiles: Dict[str, Role],
+                     creds: Dict[str, Any], token: Optional[str],
+                     sts_region: Optional[str] = None,
+                     response: Optional[SamlResponse] = None
+                     ) -> 'Registration':
+        """ Creates a registration for a logged in Profile. """
+        state = idp_session.load_state(profile.cookies)
+
+        return cls(
+            name=profile.name,
+            ecp_endpoint_url=profile.ecp_endpoint_url,
+            cookies=profile.cookies,
+            profiles=profiles,
+            credentials_file=credentials_file,
+            credential_cache=profile.credential_cache,
+            pidfile=profile.pidfile,
+            tokenfile=profile.tokenfile,
+            credentials_port=profile.credentials_port,
+            token=token,
+            creds=creds,
+            refresh=profile.refresh,
+            refresh_lead=profile.refresh_lead,
+            refresh_spread=profile.refresh_spread,
+            sts_region=sts_region,
+            duration=profile.duration,
+            keepalive=profile.keepalive,
+            idp_session_lifetime=profile.idp_session_lifetime,
+            idp_session_timeout=profile.idp_session_timeout,
+            authenticated=state.get('authenticated'),
+            succeeded=state.get('succeeded'),
+            logout_on_exit=profile.logout_on_exit,
+            response=response,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns a JSON serializable dict. """
+        r = dict(vars(self))
+        for key in self._STATE:
+            r.pop(key, None)
+        r['creds'] = dict(self.creds)
+        r['creds']['Expiration'] = iso8601(self.creds['Expiration'])
+
+        if self.response is not None:
+            expires = self.response.not_on_or_after
+            r['response'] = {
+                'assertion': self.response.assertion,
+                'roles': [list(role) for role in self.response.roles],
+                'not_on_or_after': expires and expires.timestamp(),
+                'session_duration': self.response.session_duration,
+            }
+
+        return r
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> 'Registration':
+        """ The inverse of to_dict. """
+        d = dict(d)
+        d['creds'] = dict(d['creds'])
+        d['creds']['Expiration'] = parse_iso8601(d['creds']['Expiration'])
+
+        response = d.get('response')
+        if response is not None:
+            expires = response['not_on_or_after']
+            d['response'] = SamlResponse(
+                status=SAML_SUCCESS,
+                assertion=response['assertion'],
+                roles=Roles(response['roles']),
+                not_on_or_after=expires and datetime.fromtimestamp(
+                    expires, timezone.utc),
+                session_duration=response['session_duration'],
+            )
+
+        return cls(**d)
+
+
+class Supervisor:
+    """
+    Refreshes the credentials of many profiles on time.
+
+    Args:
+        home: The user's home directory.
+        get_client: Returns the STS client for a region.
+        scheduler: Decides when profiles are refreshed.
+        workers: The number of IdP and STS calls made at once.
+    """
+    home: str
+    get_client: Callable[[Optional[str]], Any]
+    scheduler: Scheduler
+    workers: int
+
+    _profiles: Dict[str, Registration]
+    _heap: List[Tuple[float, int, Registration]]
+    _servers: Dict[int, CredentialServer]
+    _tasks: Dict['asyncio.Future[Any]', Registration]
+
+    def __init__(self, home: str,
+                 get_client: Optional[Callable[[Optional[str]], Any]] = None,
+                 scheduler: Optional[Scheduler] = None,
+                 workers: int = WORKERS) -> None:
+        self.home = home
+        self.get_client = sts.get_client if get_client is None \
+            else get_client
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.workers = workers
+
+        self._lock = RLock()
+        self._heap = []
+        self._seq = count()
+        self._profiles = {}
+        self._servers = {}
+        self._tasks = {}
+
+        # Set while running
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._main: Optional['asyncio.Future[None]'] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._control: Optional[asyncio.AbstractServer] = None
+        self._table: Optional[StatusTable] = None
+        self._started = 0.0
+        self._stopping = False
+
+    @property
+    def profiles(self) -> List[str]:
+        """ The names of the registered profiles. """
+        with self._lock:
+            return sorted(self._profiles)
+
+    def register(self, reg: Registration) -> None:
+        """ Starts refreshing a profile, replacing any prior registration. """
+        with self._lock:
+            old = self._profiles.get(reg.name)
+            if old is not None:
+                self._unserve(old)
+
+            self._profiles[reg.name] = reg
+            if not reg.succeeded:
+                reg.succeeded = self.scheduler.time()
+            when = self.scheduler.first(reg.creds['Expiration'], reg.schedule)
+            self._schedule(reg, when)
+            self._serve(reg)
+
+            with open(reg.pidfile, 'w') as f:
+                f.write(str(os.getpid()))
+
+        self._notify()
+        logger.info('Registered profile %s for role %s' %
+                    (reg.name, reg.role[1]))
+
+    def deregister(self, name: str) -> bool:
+        """ Stops refreshing a profile. Returns False if not registered. """
+        with self._lock:
+            reg = self._profiles.pop(name, None)
+            if reg is None:
+                return False
+
+            self._unserve(reg)
+            cache.remove(reg.pidfile)
+            if self._table is not None:
+                self._table.remove(name)
+
+        self._notify()
+        logger.info('Deregistered profile %s' % name)
+        return True
+
+    def stop(self) -> None:
+        """ Stops a running supervisor, as SIGINT and SIGTERM do. """
+        if self._loop is not None and self._main is not None:
+            self._loop.call_soon_threadsafe(self._main.cancel)
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """ Handles a request received on the control socket. """
+        op = request.get('op')
+
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid()}
+        elif op == 'register':
+            self.register(Registration.from_dict(request['profile']))
+            return {'ok': True}
+        elif op == 'deregister':
+            return {'ok': self.deregister(request['name'])}
+        elif op == 'list':
+            return {'ok': True, 'profiles': self.profiles}
+        elif op == 'status':
+            status = self.status(request['name'])
+            return {'ok': status is not None, 'status': status}
+        elif op == 'loglevel':
+            level = request['level']
+            try:
+                logging.getLogger().setLevel(
+                    level if isinstance(level, int) else level.upper())
+            except ValueError as e:
+                return {'ok': False, 'error': str(e)}
+            return {'ok': True}
+        elif op == 'stop':
+            self.stop()
+            return {'ok': True}
+        else:
+            return {'ok': False, 'error': 'Unknown operation: %s' % op}
+
+    def status(self, name: str) -> Optional[Dict[str, Any]]:
+        """ Returns the state of a registered profile, or None. """
+        with self._lock:
+            reg = self._profiles.get(name)
+            if reg is None:
+                return None
+
+            return self._status(reg).to_dict()
+
+    def _status(self, reg: Registration) -> Status:
+        """ Must be called holding self._lock. """
+        keepalive = reg.deadline if reg.deadline < reg.refresh_at else None
+
+        return Status(
+            name=reg.name,
+            pid=os.getpid(),
+            started=self._started,
+            role=reg.role.arn,
+            profiles=sorted(reg.profiles),
+            expiration=reg.creds['Expiration'].timestamp(),
+            next_refresh=reg.refresh_at or None,
+            keepalive=reg.keepalive,
+            next_keepalive=keepalive,
+            latency=reg.latency or None,
+            failures=reg.retries,
+            idp_session_end=reg.session_end,
+            updated=self.scheduler.time(),
+        )
+
+    def _schedule(self, reg: Registration, when: float) -> None:
+        """ Must be called holding self._lock. """
+        reg.refresh_at = when
+        reg.deadline = when
+
+        if reg.keepalive:
+            # Renew the IdP session if it would idle out before then
+            ping = self.scheduler.keepalive(
+                max(reg.succeeded or 0, reg.pinged),
+                reg.idp_session_timeout,
+            )
+            end = None
+            if reg.authenticated and reg.idp_session_lifetime:
+                end = reg.authenticated + reg.idp_session_lifetime
+            if ping < when and (end is None or ping < end):
+                reg.deadline = ping
+
+        heapq.heappush(self._heap, (reg.deadline, next(self._seq), reg))
+        self._show(reg)
+
+    def _show(self, reg: Registration) -> None:
+        """ Must be called holding self._lock. """
+        if self._table is None:
+            return
+
+        try:
+            self._table.update(self._status(reg))
+        except ValueError as e:
+            logger.warning('Not shown by aws login status: %s' % e)
+
+    def _notify(self) -> None:
+        """ Wakes _next after the queue changed, from any thread. """
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # The loop has closed
+
+    def _due(self) -> Tuple[Optional[Registration], Optional[float]]:
+        """
+        Pops the profile due for refresh, if any.
+
+        Returns:
+            The due profile, or None and the seconds until the next is
+            due, or None and None when the queue is empty.
+        """
+        with self._lock:
+            while self._heap:
+                when, _, reg = self._heap[0]
+
+                # Skip entries that were deregistered or rescheduled
+                if self._profiles.get(reg.name) is not reg or \
+                        reg.deadline != when:
+                    heapq.heappop(self._heap)
+                    continue
+
+                delay = when - self.scheduler.time()
+                if delay <= 0:
+                    heapq.heappop(self._heap)
+                    return reg, None
+
+                return None, delay
+
+        return None, None
+
+    async def _next(self) -> Optional[Registration]:
+        """ Waits until a profile is due for refresh.
+
+        Returns:
+            The due profile, or None when no profiles remain.
+        """
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        while self.profiles:
+            self._wakeup.clear()
+            reg, delay = self._due()
+            if reg is not None:
+                return reg
+
+            await self.scheduler.clock.wait(self._wakeup, delay)
+
+        return None
+
+    async def _call(self, func: Callable[..., Any], *args: Any,
+                    **kwargs: Any) -> Any:
+        """ Calls a blocking function on the worker threads. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(func, *args, **kwargs))
+
+    async def _refresh(self, reg: Registration,
+                       role: Optional[Role] = None) -> Optional[Exception]:
+        """
+        Refreshes a login profile's profiles and reschedules it.
+
+        Args:
+            reg: The login profile.
+            role: A role to switch the primary profile to, reusing the
+                last SAML assertion while it is valid.
+
+        Returns:
+            The error if the refresh failed.
+        """
+        start = monotonic()
+        targets = dict(reg.profiles)
+        if role is not None:
+            targets[reg.primary] = role
+
+        try:
+            response = None
+            if role is not None:
+                response = reg.assertion(self.scheduler.time())
+            if response is None:
+                response = await self._call(refresh, reg.ecp_endpoint_url,
+                                            reg.cookies)
+            duration = session_duration(reg.duration,
+                                        response.session_duration)
+            client = await self._call(self.get_client, reg.sts_region)
+            results, errors = await self._call(
+                assume_roles, client, response.assertion, targets,
+                duration=duration,
+            )
+            if reg.primary in errors:
+                raise errors[reg.primary]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reg.latency = monotonic() - start
+
+            if role is not None:
+                # The current credentials are still good
+                logger.info('Switching %s to %s failed: %s' %
+                            (reg.name, role.arn, e))
+                with self._lock:
+                    if self._profiles.get(reg.name) is reg:
+                        self._schedule(reg, reg.refresh_at)
+                self._notify()
+                return e
+
+            reg.retries += 1
+            when = self.scheduler.retry(reg.creds['Expiration'], reg.retries)
+
+            if when is not None:
+                logger.info('Refresh of %s failed: %s' % (reg.name, e))
+                with self._lock:
+                    if self._profiles.get(reg.name) is reg:
+                        self._schedule(reg, when)
+                self._notify()
+            else:
+                logger.error('Giving up on %s: %s' % (reg.name, e))
+                self.deregister(reg.name)
+            return e
+
+        creds = results[reg.primary]
+        cache_dir = path.dirname(reg.credential_cache)
+
+        # Checked and saved holding the lock, so that a profile logged
+        # out while refreshing is never written again. Saved on the
+        # loop, so refreshes never write the file at once. Profiles
+        # that failed keep their credentials until next time.
+        with self._lock:
+            if self._profiles.get(reg.name) is not reg:
+                return None  # Deregistered while refreshing
+
+            save(reg.credentials_file, cache_dir, targets, results)
+            logger.info('Refreshed credentials of %s' % reg.name)
+            logger.info('%(jar_updates)d of %(refreshes)d refreshes updated '
+                        'the cookie jar' % refresh_stats)
+
+            reg.retries = 0
+            reg.latency = monotonic() - start
+            reg.profiles = targets
+            reg.response = response
+            reg.creds = creds
+            reg.succeeded = self.scheduler.time()
+            if reg.credentials_port in self._servers:
+                self._servers[reg.credentials_port].update(reg.name, creds)
+            self._schedule(reg, self.scheduler.next(creds['Expiration'],
+                                                    reg.schedule))
+        self._notify()
+        return None
+
+    async def _keepalive(self, reg: Registration) -> None:
+        """ Renews a profile's IdP session without assuming its roles. """
+        reg.pinged = self.scheduler.time()
+
+        try:
+            await self._call(refresh, reg.ecp_endpoint_url, reg.cookies)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info('Keep-alive of %s failed: %s' % (reg.name, e))
+        else:
+            reg.succeeded = reg.pinged
+            logger.info('Kept the IdP session of %s alive' % reg.name)
+
+        with self._lock:
+            if self._profiles.get(reg.name) is reg:
+                self._schedule(reg, reg.refresh_at)
+        self._notify()
+
+    def _start(self, reg: Registration) -> None:
+        """ Refreshes a due profile in a task of its own. """
+        task: 'asyncio.Future[Any]'
+
+        if reg.deadline < reg.refresh_at:
+            task = asyncio.ensure_future(self._keepalive(reg))
+        else:
+            task = asyncio.ensure_future(self._refresh(reg))
+
+        self._track(task, reg)
+
+    def _track(self, task: 'asyncio.Future[Any]',
+               reg: Registration) -> None:
+        self._tasks[task] = reg
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: 'asyncio.Future[Any]') -> None:
+        self._tasks.pop(task, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Refresh failed unexpectedly',
+                         exc_info=task.exception())
+
+    def _serve(self, reg: Registration) -> None:
+        """ Serves a profile's credentials if requested. """
+        if not reg.credentials_port or not reg.token:
+            return
+
+        server = self._servers.get(reg.credentials_port)
+        if server is None:
+            try:
+                server = CredentialServer(reg.credentials_port)
+            except OSError as e:
+                logger.error('Unable to serve credentials on port %d: %s' %
+                             (reg.credentials_port, e))
+                return
+
+            server.start()
+            self._servers[reg.credentials_port] = server
+
+        server.update(reg.name, reg.creds, reg.token)
+
+    def _unserve(self, reg: Registration) -> None:
+        server = self._servers.get(reg.credentials_port)
+        if server is None:
+            return
+
+        server.remove(reg.name)
+        cache.remove(reg.tokenfile)
+
+        if not server.profiles:
+            server.stop()
+            del self._servers[reg.credentials_port]
+
+    async def _now(self, reg: Registration,
+                   role: Optional[Role] = None) -> Optional[Exception]:
+        """ Refreshes a profile at once, after any refresh in progress. """
+        while True:
+            running = [t for t, r in self._tasks.items() if r is reg]
+            if not running:
+                break
+            await asyncio.wait(running)
+
+        with self._lock:
+            if self._profiles.get(reg.name) is not reg:
+                return SupervisorError('%s was deregistered' % reg.name)
+            reg.deadline = 0  # Drops its entry from the queue
+
+        task = asyncio.ensure_future(self._refresh(reg, role))
+        self._track(task, reg)
+        return await task
+
+    async def _switch_role(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """ Switches the role of a profile's primary profile. """
+        reg = self._profiles.get(request['name'])
+        if reg is None:
+            return {'ok': False, 'registered': False,
+                    'error': '%s is not being refreshed' % request['name']}
+
+        pattern = request['role_arn']
+        if not request.get('force') and Roles([reg.role]).match(pattern):
+            return {'ok': True, 'switched': False}
+
+        if reg.response is None:
+            roles = Roles(reg.profiles.values())
+        else:
+            roles = reg.response.roles
+        matched = roles.match(pattern)
+        if len(matched) != 1:
+            return {'ok': False, 'error': '%s matches %d roles' %
+                    (pattern, len(matched))}
+
+        error = await self._now(reg, matched[0])
+        if error is not None:
+            return {'ok': False, 'error': str(error)}
+        return {'ok': True, 'switched': True, 'role': matched[0].arn}
+
+    async def _refresh_now(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """ Refreshes a profile without waiting for its schedule. """
+        reg = self._profiles.get(request['name'])
+        if reg is None:
+            return {'ok': False, 'registered': False,
+                    'error': '%s is not being refreshed' % request['name']}
+
+        error = await self._now(reg)
+        if error is not None:
+            return {'ok': False, 'error': str(error)}
+        return {'ok': True}
+
+    async def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """ Handles requests that wait for a refresh, then the rest. """
+        op = request.get('op')
+
+        # Profiles added or refreshed now would never be scheduled
+        if self._stopping and op in ('register', 'switch-role',
+                                     'refresh-now'):
+            return {
+                'ok': False,
+                'stopping': True,
+                'error': 'The refresh supervisor is stopping',
+            }
+
+        if op == 'switch-role':
+            return await self._switch_role(request)
+        elif op == 'refresh-now':
+            return await self._refresh_now(request)
+        else:
+            return self.dispatch(request)
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        """ Answers a request on the control socket. """
+        try:
+            line = await asyncio.wait_for(reader.readline(), TIMEOUT)
+            if not line:
+                writer.close()  # Probed by a starting supervisor
+                return
+            reply = await self._dispatch(json.loads(line.decode()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception('Bad control request')
+            reply = {'ok': False, 'error': str(e)}
+
+        try:
+            writer.write(json.dumps(reply).encode() + b'\n')
+            await writer.drain()
+        except OSError:
+            pass  # The client gave up
+        finally:
+            writer.close()
+
+    async def _start_control(self) -> None:
+        """
+        Listens for requests on ~/.aws-login/supervisor.sock.
+
+        Raises:
+            SupervisorError: If another supervisor is listening.
+        """
+        filename = path.join(self.home, SOCKET)
+        if _listening(filename):
+            raise SupervisorError('Another supervisor is running')
+        cache.remove(filename)  # Left behind by a supervisor that crashed
+
+        umask = os.umask(0o177)
+        try:
+            self._control = await asyncio.start_unix_server(self._handle,
+                                                            path=filename)
+        finally:
+            os.umask(umask)
+
+    def _add_signal_handlers(self) -> None:
+        assert self._loop is not None
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(sig, self._signalled, sig)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Only the main thread of a Unix process may handle them
+                return
+
+    def _signalled(self, sig: signal.Signals) -> None:
+        logger.info('Received signal: %s. Shutting down...' % sig.name)
+        self.stop()
+
+    def _logout(self, reg: Registration) -> None:
+        """ Removes a profile's credentials, as aws logout does. """
+        cache_dir = path.dirname(reg.credential_cache)
+        try:
+            clear_credentials(reg.credentials_file, sorted(reg.profiles))
+        except Exception as e:
+            logger.error('Unable to remove credentials of %s: %s' %
+                         (reg.name, e))
+
+        for name in reg.profiles:
+            cache.remove(path.join(cache_dir, name + '.json'))
+
+    async def _stop(self, stopped: bool) -> None:
+        """ Cancels refreshes in progress and cleans up. """
+        self._stopping = True
+        if self._control is not None:
+            self._control.close()  # Stop accepting new requests
+
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._executor is not None:
+            # Calls already made to the IdP or STS cannot be cancelled
+            self._executor.shutdown(wait=False)
+
+        if self._control is not None:
+            await self._control.wait_closed()
+            cache.remove(path.join(self.home, SOCKET))
+
+        with self._lock:
+            for reg in self._profiles.values():
+                if stopped and reg.logout_on_exit:
+                    self._logout(reg)
+                cache.remove(reg.pidfile)
+                cache.remove(reg.tokenfile)
+
+            for server in self._servers.values():
+                server.stop()
+
+            if self._table is not None:
+                self._table.close()
+                self._table = None
+
+    async def _run(self, reg: Optional[Registration] = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._main = asyncio.current_task()
+        self._wakeup = asyncio.Event()
+
+        # Before touching the status table or any profile's files
+        try:
+            await self._start_control()
+        except SupervisorError as e:
+            logger.error(str(e))
+            self._loop = None
+            return
+
+        self._executor = ThreadPoolExecutor(self.workers,
+                                            'supervisor-worker')
+        self._started = time()
+        self._stopping = False
+        self._table = StatusTable(path.join(self.home, TABLE))
+        with self._lock:
+            for old in self._profiles.values():
+                self._show(old)
+
+        if reg is not None:
+            self.register(reg)
+
+        stopped = False
+        try:
+            self._add_signal_handlers()
+            logger.info('Started refresh supervisor')
+
+            while True:
+                due = await self._next()
+                if due is None:
+                    break
+                self._start(due)
+        except asyncio.CancelledError:
+            stopped = True
+        finally:
+            await self._stop(stopped)
+            self._loop = None
+            logger.info('Stopped refresh supervisor')
+
+    def run(self, reg: Optional[Registration] = None) -> None:
+        """ Refreshes profiles until none remain or a signal arrives.
+
+        Args:
+            reg: An optional profile to register before starting.
+        """
+        asyncio.run(self._run(reg))
+
+
+class StartLock:
+    """
+    Holds an exclusive lock on ~/.aws-login/supervisor.lock while a
+    login registers with the supervisor or starts one.
+
+    The supervisor is forked while the lock is held, and daemoniker
+    closes every descriptor in the fork, so only the process that took
+    the lock releases it.
+
+    Args:
+        home: The user's home directory.
+    """
+
+    def __init__(self, home: str) -> None:
+        self.filename = path.join(home, STARTLOCK)
+        self._fd: Optional[int] = None
+        self._pid = 0
+
+    def __enter__(self) -> 'StartLock':
+        self._fd = os.open(self.filename, os.O_CREAT | os.O_RDWR, 0o600)
+        self._pid = os.getpid()
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover
+            return self
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self._fd is not None and os.getpid() == self._pid:
+            os.close(self._fd)  # Releases the lock
+        self._fd = None
+
+
+def _listening(filename: str) -> bool:
+    """ Returns True if a process accepts connections on a socket. """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    with sock:
+        try:
+            sock.connect(filename)
+        except OSError:
+            return False
+
+    return True
+
+
+def is_running(home: str) -> bool:
+    """ Returns True if the supervisor's pidfile names a live process. """
+    try:
+        with open(path.join(home, PIDFILE)) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return False
+
+    return True
+
+
+def request(home: str, message: Dict[str, Any],
+            timeout: float = TIMEOUT) -> Optional[Dict[str, Any]]:
+    """
+    Sends a request to the supervisor.
+
+    Args:
+        home: The user's home directory.
+        message: The request.
+        timeout: Seconds to wait for the reply.
+
+    Returns:
+        The reply, or None if the supervisor is not running.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+
+    with sock:
+        try:
+            sock.connect(path.join(home, SOCKET))
+            sock.sendall(json.dumps(message).encode() + b'\n')
+            with sock.makefile('rb') as f:
+                reply = f.readline()
+        except OSError:
+            # Not running, or exited while we were connecting
+            return None
+
+    if not reply:
+        return None
+    return json.loads(reply.decode())
+
+
+def register(home: str, reg: Registration) -> bool:
+    """
+    Registers a profile with a running supervisor.
+
+    Returns:
+        False if the supervisor is not running or is stopping.
+
+    Raises:
+        SupervisorError: If the supervisor rejected the registration.
+    """
+    reply = request(home, {'op': 'register', 'profile': reg.to_dict()})
+
+    if reply is None or reply.get('stopping'):
+        return False
+    if not reply['ok']:
+        raise SupervisorError(reply.get('error', 'Unknown error'))
+    return True
+
+
+def deregister(home: str, name: str) -> Optional[bool]:
+    """
+    Stops a running supervisor refreshing a profile.
+
+    Returns:
+        True if the supervisor was refreshing the profile, False if it
+        was not, or None if no supervisor answered.
+    """
+    reply = request(home, {'op': 'deregister', 'name': name})
+
+    if reply is None:
+        return None
+    return bool(reply['ok'])
+
+
+def owns(home: str, pidfile: str) -> bool:
+    """
+    Returns True if a profile's pidfile names the supervisor, rather
+    than a refresh process started by an older release.
+    """
+    try:
+        with open(pidfile) as f:
+            pid = f.read().strip()
+        with open(path.join(home, PIDFILE)) as f:
+            return f.read().strip() == pid
+    except OSError:
+        return False
+
+
+def _reply(home: str, message: Dict[str, Any],
+           timeout: float = TIMEOUT) -> Optional[Dict[str, Any]]:
+    """ Returns a successful reply, or None if nothing is refreshing. """
+    reply = request(home, message, timeout)
+
+    if reply is None or reply.get('registered') is False \
+            or reply.get('stopping'):
+        return None
+    if not reply['ok']:
+        raise SupervisorError(reply.get('error', 'Unknown error'))
+    return reply
+
+
+def switch_role(home: str, name: str, role_arn: str,
+                force: bool = False) -> Optional[bool]:
+    """
+    Switches a refreshed profile to another role, reusing the last
+    SAML assertion while it is valid.
+
+    Args:
+        home: The user's home directory.
+        name: The login profile.
+        role_arn: The ARN of the new role, or an fnmatch pattern
+            matching a single role.
+        force: True to switch even if the current role matches.
+
+    Returns:
+        True if switched, False if the current role already matches,
+        or None if the profile is not being refreshed.
+
+    Raises:
+        SupervisorError: If the switch failed.
+    """
+    message = {'op': 'switch-role', 'name': name, 'role_arn': role_arn,
+               'force': force}
+    reply = _reply(home, message, REFRESH_TIMEOUT)
+
+    return None if reply is None else reply['switched']
+
+
+def refresh_now(home: str, name: str) -> bool:
+    """
+    Refreshes a profile at once.
+
+    Returns:
+        False if the profile is not being refreshed.
+
+    Raises:
+        SupervisorError: If the refresh failed.
+    """
+    message = {'op': 'refresh-now', 'name': name}
+
+    return _reply(home, message, REFRESH_TIMEOUT) is not None
+
+
+def set_log_level(home: str, level: str) -> bool:
+    """ Returns False if the supervisor is not running. """
+    return _reply(home, {'op': 'loglevel', 'level': level}) is not None
+
+
+def stop(home: str) -> bool:
+    """ Returns False if the supervisor is not running. """
+    return _reply(home, {'op': 'stop'}) is not None
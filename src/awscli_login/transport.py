@@ -0,0 +1,238 @@
+"""
+Long lived, pooled HTTP connections to IdP ECP endpoints.
+
+saml.refresh and saml.authenticate run many times in the same
+process, every time the refresh supervisor refreshes a profile, and
+each time used to pay for a DNS lookup, a TCP connection and a full
+TLS handshake with the IdP. The Transport for an endpoint keeps its
+connections alive between calls, caches DNS lookups for a short
+time, and resumes TLS sessions when the IdP has closed an idle
+connection.
+
+Each call still gets its own requests.Session, so cookies are never
+shared between cookie jars; only the connection pool is shared.
+"""
+import logging
+import socket
+import ssl
+
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Tuple
+from urllib.parse import urlsplit
+
+from requests import Session
+from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+DNS_TTL = 300  # in seconds
+POOL_CONNECTIONS = 1
+POOL_MAXSIZE = 4
+
+logger = logging.getLogger(__name__)
+
+
+class DNSCache:
+    """
+    Caches the addresses of hosts for ttl seconds.
+
+    Args:
+        ttl: How long in seconds to trust a lookup.
+        clock: Returns the current time in seconds.
+    """
+    ttl: float
+
+    def __init__(self, ttl: float = DNS_TTL,
+                 clock: Callable[[], float] = monotonic) -> None:
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = Lock()
+        self._cache: Dict[Tuple[str, int], Tuple[float, str]] = {}
+
+    def resolve(self, host: str, port: int) -> str:
+        """ Returns an address for host, looking it up if necessary. """
+        key = (host, port)
+        now = self._clock()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        info = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        address = str(info[0][4][0])
+
+        with self._lock:
+            self._cache[key] = (now + self.ttl, address)
+
+        return address
+
+    def forget(self, host: str, port: int) -> None:
+        """ Drops a lookup, for instance after failing to connect. """
+        with self._lock:
+            self._cache.pop((host, port), None)
+
+
+dns = DNSCache()
+
+
+class _ResumingContext(ssl.SSLContext):
+    """
+    An SSLContext that offers the last session negotiated with a host
+    when it connects to it again.
+    """
+    sessions: Dict[str, ssl.SSLSession]
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__()
+        self.sessions = {}
+
+    def wrap_socket(self, sock, *args, server_hostname=None,
+                    session=None, **kwargs):
+        if session is None and server_hostname is not None:
+            session = self.sessions.get(server_hostname)
+
+        return super().wrap_socket(sock, *args,
+                                   server_hostname=server_hostname,
+                                   session=session, **kwargs)
+
+
+def new_context() -> _ResumingContext:
+    """ Returns a client SSLContext that resumes TLS sessions. """
+    context = _ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+
+    return context
+
+
+class _CachedDNSMixin:
+    """ Connects to the address in the DNS cache. """
+    _dns_host: str
+    port: int
+
+    def _new_conn(self) -> socket.socket:
+        host = self._dns_host
+        self._dns_host = dns.resolve(host, self.port)
+
+        try:
+            return super()._new_conn()  # type: ignore
+        except Exception:
+            dns.forget(host, self.port)
+            raise
+        finally:
+            self._dns_host = host
+
+
+class _HTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+
+    def close(self) -> None:
+        # The TLS session ticket is kept for the next connection
+        sock = self.sock
+        context = self.ssl_context
+        if isinstance(sock, ssl.SSLSocket) and \
+                isinstance(context, _ResumingContext):
+            try:
+                session = sock.session
+            except (OSError, ValueError):
+                session = None
+            if session is not None:
+                context.sessions[self.host] = session
+
+        super().close()
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class _Adapter(HTTPAdapter):
+    """ An HTTPAdapter using cached DNS and TLS session resumption. """
+
+    def __init__(self, pool_connections: int, pool_maxsize: int) -> None:
+        self.context = new_context()
+        super().__init__(pool_connections=pool_connections,
+                         pool_maxsize=pool_maxsize)
+
+    def init_poolmanager(self, connections, maxsize,
+                         block=DEFAULT_POOLBLOCK, **pool_kwargs) -> None:
+        pool_kwargs['ssl_context'] = self.context
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _HTTPConnectionPool,
+            'https': _HTTPSConnectionPool,
+        }
+
+
+def _prefix(url: str) -> str:
+    """ Returns the scheme://host:port/ prefix of a URL. """
+    parts = urlsplit(url)
+    return '%s://%s/' % (parts.scheme, parts.netloc)
+
+
+class Transport:
+    """
+    A pool of keep-alive connections to one IdP.
+
+    Args:
+        url: The ECP endpoint URL.
+        pool_connections: The number of hosts to keep connections to.
+        pool_maxsize: The maximum number of connections to keep open
+            to a host, which limits concurrent requests that reuse them.
+    """
+    prefix: str
+
+    def __init__(self, url: str, pool_connections: int = POOL_CONNECTIONS,
+                 pool_maxsize: int = POOL_MAXSIZE) -> None:
+        self.prefix = _prefix(url)
+        self.adapter = _Adapter(pool_connections, pool_maxsize)
+
+    def mount(self, session: Session) -> Session:
+        """ Sends a Session's requests to the IdP over this transport. """
+        session.mount(self.prefix, self.adapter)
+        return session
+
+    def close(self) -> None:
+        """ Closes every pooled connection. """
+        self.adapter.close()
+
+
+_transports: Dict[str, Transport] = {}
+_lock = Lock()
+
+
+def get_transport(url: str, **kwargs) -> Transport:
+    """
+    Returns the process wide Transport for an ECP endpoint.
+
+    Args:
+        url: The ECP endpoint URL.
+        kwargs: Passed to Transport the first time the endpoint is used.
+    """
+    prefix = _prefix(url)
+
+    with _lock:
+        transport = _transports.get(prefix)
+        if transport is None:
+            transport = _transports[prefix] = Transport(url, **kwargs)
+
+    return transport
+
+
+def close_all() -> None:
+    """ Closes every Transport, for instance before forking. """
+    with _lock:
+        transports = list(_transports.values())
+        _transports.clear()
+
+    for transport in transports:
+        transport.close()
@@ -1,5 +1,23 @@
-from typing import Dict, Tuple
+from typing import Dict, NamedTuple, Tuple
 
 Headers = Dict[str, str]
 Creds = Tuple[str, str, Dict[str, str]]
-Role = Tuple[str, str]
+
+
+class Role(NamedTuple):
+    """ A SAML provider ARN and the ARN of a role it may assume. """
+    provider: str
+    arn: str
+
+    @property
+    def partition(self) -> str:
+        return self.arn.split(':', 2)[1]
+
+    @property
+    def account_id(self) -> str:
+        return self.arn.split(':', 5)[4]
+
+    @property
+    def name(self) -> str:
+        """ The role's name, without its path. """
+        return self.arn.rsplit('/', 1)[-1]
@@ -1,17 +1,15 @@
 import logging
 
-from datetime import datetime, timezone
+from datetime import datetime
 from os import path
-from time import sleep
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from awscli.customizations.configure.set import ConfigureSetCommand
-from awscli_login.exceptions import SAML
+from awscli_login.credentials import CredentialsFile, sts_values
+from awscli_login.exceptions import SAML, RoleNotFound
+from awscli_login.roles import Roles
 from awscli_login.typing import Role
 from botocore.session import Session
 
-awsconfigfile = path.join('.aws', 'credentials')
-
 logger = logging.getLogger(__name__)
 
 TRUE = ("yes", "true", "t", "1")
@@ -20,81 +18,89 @@ FALSE = ("no", "false", "f", "0")
 
 def sort_roles(role_arns: List[Role]) \
                -> List[Tuple[str, List[Tuple[int, str]]]]:
-    """ TODO """
-    accounts: Dict[str, List[Tuple[int, str]]] = {}
-    r: List[Tuple[str, List[Tuple[int, str]]]] = []
-
-    for index, arn in enumerate(role_arns):
-        acct: str = arn[1].split(':')[4]
-        role: str = arn[1].split(':')[5].split('/')[1]
+    """
+    Groups roles by account for display.
 
-        role_list = accounts.get(acct, list())
-        role_list.append((index, role))
-        accounts[acct] = role_list
+    Returns:
+        A list of account ids, in order, each with a list of the
+        positions and names of its roles, sorted by name.
+    """
+    roles = role_arns if isinstance(role_arns, Roles) else Roles(role_arns)
 
-    for acct in sorted(accounts.keys()):
-        accounts[acct].sort(key=lambda x: x[1])
-        r.append((acct, accounts[acct]))
+    return [
+        (acct, sorted(((i, roles[i].name) for i in roles.positions(acct)),
+                      key=lambda x: x[1]))
+        for acct in sorted(roles.accounts)
+    ]
 
-    return r
 
+def get_selection(role_arns: List[Role], role_arn: Optional[str] = None,
+                  aliases: Optional[Dict[str, str]] = None,
+                  usage_file: Optional[str] = None) -> Role:
+    """
+    Selects a role, prompting the user if there is a choice.
+
+    Args:
+        role_arns: The roles returned by the IdP.
+        role_arn: The ARN of the role to select, or an fnmatch pattern
+            narrowing the choice, if known.
+        aliases: Account aliases to show and search by account id.
+        usage_file: Where roles selected are recorded, so the most
+            recently and frequently used are listed first.
+
+    Raises:
+        SAML: If no roles were returned.
+        RoleNotFound: If the IdP did not return a role matching role_arn.
+    """
+    roles = role_arns if isinstance(role_arns, Roles) else Roles(role_arns)
 
-def get_selection(role_arns: List[Role]) -> Role:
-    """ Interactively prompts the user for a role selection. """
-    i = 0
-    n = len(role_arns)
-    select: Dict[int, int] = {}
+    if role_arn:
+        matched = roles.match(role_arn)
+        if not matched:
+            raise RoleNotFound(role_arn)
 
-    if n > 1:
-        print("Please choose the role you would like to assume:")
+        roles = Roles(matched)
 
-        accounts = sort_roles(role_arns)
-        for acct, roles in accounts:
-            print(' ' * 4, "Account:", acct)
+    if len(roles) > 1:
+        from awscli_login.selector import RoleIndex, Usage, select
 
-            for index, role in roles:
-                print(' ' * 8, "[ %d ]:" % i, role)
-                select[i] = index
-                i += 1
+        usage = Usage(usage_file)
+        role = select(RoleIndex(roles, aliases, usage))
+        if usage_file:
+            usage.record(role.arn)
 
-        print("Selection:\a ", end='')
-# TODO need error checking
-        return role_arns[select[int(input())]]
-    elif n == 1:
-        return role_arns[0]
+        return role
+    elif len(roles) == 1:
+        return roles[0]
     else:
         raise SAML("No roles returned!")
 
 
-class Args:
-    """ A stub class for passing arguments to ConfigureSetCommand """
-    def __init__(self, varname: str, value: str) -> None:
-        self.varname = varname
-        self.value = value
+def get_credentials_file(session: Session) -> str:
+    """ Returns the path to the current AWS shared credentials file. """
+    return path.expanduser(session.get_config_variable('credentials_file'))
 
 
-def _aws_set(session: Session, varname: str, value: str) -> None:
+def remove_credentials(session: Session, others: Iterable[str] = ()) -> None:
     """
-    This is a helper function for save_credentials.
-
-    The function is the same as running:
+    Removes current profile's credentials from ~/.aws/credentials.
 
-    $ aws configure set varname value
+    Args:
+        session: The current botocore session.
+        others: Other profiles whose credentials to remove as well.
     """
-    set_command = ConfigureSetCommand(session)
-    set_command._run_main(Args(varname, value), parsed_globals=None)
+    profile = session.profile if session.profile else 'default'
+    profiles = [profile] + [p for p in others if p != profile]
 
+    clear_credentials(get_credentials_file(session), profiles)
 
-def remove_credentials(session: Session) -> None:
-    """
-    Removes current profile's credentials from ~/.aws/credentials.
-    """
-    profile = session.profile if session.profile else 'default'
 
-    _aws_set(session, 'aws_access_key_id', '')
-    _aws_set(session, 'aws_secret_access_key', '')
-    _aws_set(session, 'aws_session_token',  '')
-    logger.info("Removed temporary STS credentials from profile: " + profile)
+def clear_credentials(credentials_file: str, profiles: List[str]) -> None:
+    """ Removes the STS credentials of profiles from a credentials file. """
+    with CredentialsFile(credentials_file) as credentials:
+        credentials.update_many((p, sts_values(None)) for p in profiles)
+    logger.info("Removed temporary STS credentials from profile(s): " +
+                ', '.join(profiles))
 
 
 def save_credentials(session: Session, token: Dict) -> datetime:
@@ -102,13 +108,13 @@ def save_credentials(session: Session, token: Dict) -> datetime:
     creds = token['Credentials']
     profile = session.profile if session.profile else 'default'
 
-    _aws_set(session, 'aws_access_key_id', creds['AccessKeyId'])
-    _aws_set(session, 'aws_secret_access_key', creds['SecretAccessKey'])
-    _aws_set(session, 'aws_session_token',  creds['SessionToken'])
-    logger.info("Saved temporary STS credentials to profile: " + profile)
-
     assert isinstance(creds['Expiration'], datetime), \
         "Amazon returned bad Expiration!"
+
+    with CredentialsFile(get_credentials_file(session)) as credentials:
+        credentials.update(profile, sts_values(creds))
+    logger.info("Saved temporary STS credentials to profile: " + profile)
+
     return creds['Expiration']
 
 
@@ -126,13 +132,3 @@ def file2str(filename: str) -> str:
     with open(filename, 'r') as f:
         data = f.read()
     return data
-
-
-def nap(expires: datetime, percent: float) -> None:
-    """TODO. """
-    tz = timezone.utc
-    ttl = int((expires - datetime.now(tz)).total_seconds())
-    sleep_for = ttl * 0.9
-
-    logger.info('Going to sleep for %d seconds.' % sleep_for)
-    sleep(sleep_for)
@@ -1,10 +1,33 @@
 # from contextlib import redirect_stdout, redirect_stderr
 # from io import StringIO
+from os import getpid
+from os.path import isfile, join
 from unittest.mock import patch, call
 
+from awscli_login.const import CONFIG_DIR
+
 from ..base import IntegrationTests
 from ..util import fork
 
+DEAD = str(2 ** 22 + 1)  # Above the largest pid Linux allows
+
+CREDENTIALS = """
+[a]
+aws_access_key_id = abc
+aws_secret_access_key = def
+aws_session_token = ghi
+
+[b]
+aws_access_key_id = abc
+aws_secret_access_key = def
+aws_session_token = ghi
+
+[c]
+aws_access_key_id = abc
+aws_secret_access_key = def
+aws_session_token = ghi
+"""
+
 
 class TestNoProfile(IntegrationTests):
     """ Integration tests for no profile. """
@@ -49,3 +72,67 @@ aws_session_token = ghi
         mesg = 'Already logged out!\n'
         self.assertAwsCliReturns('logout', stderr=mesg, code=3)
         # TODO FIXME NO HARDCODE ERROR CODES!
+
+
+class TestLogoutAll(IntegrationTests):
+    """ Integration tests for logging out of many profiles. """
+
+    def assertLoggedOut(self, *profiles: str) -> None:
+        for name in 'abc':
+            section = self.aws_credentials.split('[%s]' % name)[1]
+            section = section.split('\n\n')[0]
+            if name in profiles:
+                self.assertNotIn('abc', section, name)
+            else:
+                self.assertIn('abc', section, name)
+
+    @fork()
+    def test_logout_all(self):
+        """ Every profile with a pidfile is logged out. """
+        self.aws_credentials = CREDENTIALS
+        for name in ('a', 'b', 'supervisor'):
+            self.write(join(CONFIG_DIR, name + '.pid'), DEAD)
+
+        self.assertAwsCliReturns('logout', '--all')
+        self.assertLoggedOut('a', 'b')
+        self.assertFalse(isfile(self._abspath(join(CONFIG_DIR, 'a.pid'))))
+
+    @fork()
+    def test_logout_profiles(self):
+        """ Listed profiles are logged out, refreshed or not. """
+        self.aws_credentials = CREDENTIALS
+
+        self.assertAwsCliReturns('logout', '--profiles', 'a, c')
+        self.assertLoggedOut('a', 'c')
+
+    @fork()
+    def test_logout_supervisor_not_answering(self):
+        """ The supervisor is never signalled on behalf of a profile. """
+        self.aws_credentials = CREDENTIALS
+        # Signalling this live process would end the test
+        for name in ('a', 'b', 'supervisor'):
+            self.write(join(CONFIG_DIR, name + '.pid'), str(getpid()))
+
+        mesg = 'Refresh supervisor error: Unable to stop refreshing a\n'
+        self.assertAwsCliReturns('logout', '--profiles', 'a', stderr=mesg,
+                                 code=12)
+        self.assertLoggedOut()
+        self.assertTrue(isfile(self._abspath(join(CONFIG_DIR, 'a.pid'))))
+
+    @fork()
+    def test_logout_profile_supervisor_not_answering(self):
+        """ aws logout reports a supervisor that does not answer. """
+        self.profile = 'b'
+        self.aws_credentials = CREDENTIALS
+        for name in ('b', 'supervisor'):
+            self.write(join(CONFIG_DIR, name + '.pid'), str(getpid()))
+
+        mesg = 'Refresh supervisor error: Unable to stop refreshing b\n'
+        self.assertAwsCliReturns('logout', stderr=mesg, code=12)
+        self.assertLoggedOut()
+
+    @fork()
+    def test_logout_all_none(self):
+        """ Logging out of every profile fails if none are logged in. """
+        mesg = 'Already logged out!\n'
+        self.assertAwsCliReturns('logout', '--all', stderr=mesg, code=3)
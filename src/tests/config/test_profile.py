@@ -7,6 +7,7 @@ from unittest import SkipTest
 from awscli_login.config import JAR_DIR
 from awscli_login.exceptions import (
     AlreadyLoggedIn,
+    InvalidCookieStore,
     ProfileNotFound,
     ProfileMissingArgs,
 )
@@ -202,6 +203,8 @@ class ReadFullProfile(ProfileBase, CookieMixin):
         "passcode": "secret_code",
         "verbose": 1,
         "refresh": 1500,
+        "refresh_lead": 600,
+        "refresh_spread": 60,
     }
 
     def setUp(self) -> None:
@@ -217,6 +220,8 @@ enable_keyring = True
 passcode = secret_code
 verbose = 1
 refresh = 1500
+refresh_lead = 600
+refresh_spread = 60
     """
         self.Profile()
 
@@ -247,6 +252,35 @@ class ReadFullProfileTestOverrides(ReadFullProfile):
         self.assertProfileHasAttrs(**self.expected_attr_vals)
 
 
+class CookieStoreProfile(ProfileBase):
+    """ Test the cookie_store option """
+
+    def test_sqlite(self) -> None:
+        """ SQLite cookie jars are named user.db. """
+        self.login_config = """
+[default]
+ecp_endpoint_url = url
+username = netid1
+cookie_store = sqlite
+    """
+        self.Profile()
+
+        self.assertEqual(path.basename(self.profile.cookies), 'netid1.db')
+
+    def test_invalid(self) -> None:
+        """ Unknown cookie stores are rejected. """
+        self.login_config = """
+[default]
+ecp_endpoint_url = url
+username = netid1
+cookie_store = bdb
+    """
+        self.Profile()
+
+        with self.assertRaises(InvalidCookieStore):
+            self.profile.cookies
+
+
 # This ensures that shared tests in mixins are not run with empty
 # data sets!
 del(CookieMixin)
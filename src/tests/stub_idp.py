@@ -0,0 +1,147 @@
+"""
+A local HTTPS server standing in for an IdP's ECP endpoint.
+
+It answers every POST with a successful SAML response and counts the
+TCP connections and TLS handshakes it has seen, including how many
+handshakes resumed an earlier TLS session.
+
+If asked to, it also rotates a session cookie on every request, one
+cookie per client named by the last part of the URL path, and counts
+the requests that did not send back the cookie last issued to them.
+"""
+import socket
+import ssl
+
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import path
+from os.path import abspath, dirname
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Any, Dict, Set
+
+from awscli_login.util import file2bytes
+
+DATA = path.join(dirname(abspath(__file__)), 'data')
+CERT = path.join(DATA, 'idp.pem')
+CA = path.join(DATA, 'idp.crt')
+SAML_SUCCESS = file2bytes(path.join(DATA, 'success.xml'))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server: 'StubIdP'
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        self.send_response(200)
+        if self.server.cookies:
+            self.rotate()
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(SAML_SUCCESS)))
+        self.end_headers()
+        self.wfile.write(SAML_SUCCESS)
+
+        with self.server.lock:
+            self.server.requests += 1
+
+    def rotate(self) -> None:
+        name = 'session_' + self.path.rsplit('/', 1)[-1]
+        sent = SimpleCookie(self.headers.get('Cookie', ''))
+
+        with self.server.lock:
+            issued = self.server.issued.get(name)
+            if issued is not None and \
+                    (name not in sent or sent[name].value != issued):
+                self.server.lost += 1
+            value = str(int(issued or 0) + 1)
+            self.server.issued[name] = value
+
+        self.send_header('Set-Cookie', '%s=%s; Path=/; Max-Age=3600; '
+                         'Secure' % (name, value))
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class StubIdP(ThreadingMixIn, HTTPServer):
+    """
+    Serves SAML responses on https://localhost:<port>/ecp.
+
+    Attributes:
+        connections: The number of TCP connections accepted.
+        handshakes: The number of completed TLS handshakes.
+        resumed: The number of handshakes that resumed a session.
+        requests: The number of requests answered.
+        issued: The session cookie last issued to each client.
+        lost: The number of requests without the last cookie issued.
+
+    Args:
+        cookies: True to rotate a session cookie on every request.
+    """
+    daemon_threads = True
+
+    def __init__(self, cookies: bool = False) -> None:
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(CERT)
+
+        self.lock = Lock()
+        self.connections = 0
+        self.handshakes = 0
+        self.resumed = 0
+        self.requests = 0
+        self.cookies = cookies
+        self.issued: Dict[str, str] = {}
+        self.lost = 0
+        self._socks: Set[ssl.SSLSocket] = set()
+
+    @property
+    def url(self) -> str:
+        return 'https://localhost:%d/ecp' % self.server_address[1]
+
+    def get_request(self):
+        sock, addr = self.socket.accept()
+        with self.lock:
+            self.connections += 1
+
+        return sock, addr
+
+    def finish_request(self, request, client_address) -> None:
+        # Handshake in the handler thread rather than in accept
+        try:
+            tls = self.context.wrap_socket(request, server_side=True)
+        except (OSError, ssl.SSLError):
+            return
+
+        with self.lock:
+            self.handshakes += 1
+            self.resumed += bool(tls.session_reused)
+            self._socks.add(tls)
+
+        try:
+            super().finish_request(tls, client_address)
+        finally:
+            with self.lock:
+                self._socks.discard(tls)
+            tls.close()
+
+    def drop_connections(self) -> None:
+        """ Closes idle keep-alive connections, as a real IdP would. """
+        with self.lock:
+            socks = list(self._socks)
+        for sock in socks:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self) -> 'StubIdP':
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,129 @@
+import unittest
+
+from datetime import datetime, timedelta, timezone
+from os import makedirs, stat
+from os.path import isfile, join
+from unittest.mock import patch
+
+from awscli_login import assertion
+from awscli_login.const import CACHE_DIR
+from awscli_login.roles import Roles
+from awscli_login.saml import SAML_SUCCESS, SamlResponse
+
+from .base import TempDir
+
+URL = 'https://idp.example.com/idp/profile/SAML2/SOAP/ECP'
+NOW = datetime(2018, 2, 20, 13, 52, 10, tzinfo=timezone.utc)
+ROLES = Roles([
+    ('arn:aws:iam::111111111111:saml-provider/idp',
+     'arn:aws:iam::111111111111:role/Admin'),
+])
+
+
+def response(ttl: float = 300) -> SamlResponse:
+    return SamlResponse(SAML_SUCCESS, 'PHNhbWxwOlJlc3BvbnNlLz4=', ROLES,
+                        NOW, NOW + timedelta(seconds=ttl))
+
+
+class AssertionTest(TempDir):
+    """ Tests for awscli_login.assertion """
+
+    def setUp(self):
+        super().setUp()
+        self.home = self.tmpd.name
+        makedirs(join(self.home, CACHE_DIR))
+        self.filename = assertion.cache_file(self.home, URL, 'user')
+
+    def load(self, after: float = 0, keyring: bool = False):
+        return assertion.load(self.home, URL, 'user', keyring,
+                              NOW + timedelta(seconds=after))
+
+    def test_roundtrip(self):
+        """ Assertions are cached privately and read back. """
+        assertion.save(self.home, URL, 'user', response())
+        cached = self.load()
+
+        self.assertEqual(stat(self.filename).st_mode & 0o777, 0o600)
+        self.assertEqual(cached.assertion, response().assertion)
+        self.assertEqual(cached.roles, ROLES)
+        self.assertEqual(cached.not_on_or_after, response().not_on_or_after)
+        self.assertTrue(cached.succeeded)
+
+    def test_per_user(self):
+        """ Assertions are cached per IdP and username. """
+        assertion.save(self.home, URL, 'user', response())
+
+        self.assertIsNone(assertion.load(self.home, URL, 'other', now=NOW))
+        self.assertIsNone(assertion.load(self.home, 'https://idp2/ecp',
+                                         'user', now=NOW))
+
+    def test_expired(self):
+        """ Assertions are evicted once about to expire. """
+        assertion.save(self.home, URL, 'user', response())
+
+        self.assertIsNotNone(self.load(300 - assertion.MARGIN - 1))
+        self.assertIsNone(self.load(300 - assertion.MARGIN))
+        self.assertFalse(isfile(self.filename))
+
+    def test_no_window(self):
+        """ Assertions without a NotOnOrAfter are not cached. """
+        assertion.save(self.home, URL, 'user',
+                       response()._replace(not_on_or_after=None))
+
+        self.assertFalse(isfile(self.filename))
+
+    @patch('keyring.delete_password')
+    @patch('keyring.get_password')
+    @patch('keyring.set_password')
+    def test_keyring(self, set_password, get_password, delete_password):
+        """ Assertions may be kept in the keyring instead of the cache. """
+        assertion.save(self.home, URL, 'user', response(), keyring=True)
+        secret = set_password.call_args[0][2]
+        get_password.return_value = secret
+
+        self.assertNotIn(response().assertion, open(self.filename).read())
+        self.assertEqual(self.load(keyring=True).assertion,
+                         response().assertion)
+
+        assertion.evict(self.home, URL, 'user', keyring=True)
+        delete_password.assert_called_once_with(assertion.KEYRING_SERVICE,
+                                                'user@idp.example.com')
+        self.assertFalse(isfile(self.filename))
+
+    @patch('keyring.set_password', side_effect=RuntimeError('too big'))
+    def test_keyring_fallback(self, set_password):
+        """ Assertions the keyring refuses are cached in a file. """
+        assertion.save(self.home, URL, 'user', response(), keyring=True)
+
+        self.assertEqual(self.load(keyring=True).assertion,
+                         response().assertion)
+
+    @patch('keyring.get_password', side_effect=RuntimeError('locked'))
+    @patch('keyring.set_password')
+    def test_unreadable(self, set_password, get_password):
+        """ Corrupt entries and keyring failures are cache misses. """
+        assertion.save(self.home, URL, 'user', response(), keyring=True)
+        self.assertIsNone(self.load(keyring=True))
+
+        for corrupt in ('[]', '{"not_on_or_after": "soon"}',
+                        '{"not_on_or_after": 1e12, "assertion": "x"}'):
+            with open(self.filename, 'w') as f:
+                f.write(corrupt)
+            self.assertIsNone(self.load())
+
+    def test_evict_all(self):
+        """ Logout evicts the assertions of every user of an IdP. """
+        assertion.save(self.home, URL, 'user', response())
+        assertion.save(self.home, URL, 'other', response())
+        assertion.save(self.home, 'https://idp2/ecp', 'user', response())
+
+        assertion.evict_all(self.home, URL)
+
+        self.assertIsNone(self.load())
+        self.assertIsNone(assertion.load(self.home, URL, 'other', now=NOW))
+        self.assertIsNotNone(assertion.load(self.home, 'https://idp2/ecp',
+                                            'user', now=NOW))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,293 @@
+import os
+import sqlite3
+import unittest
+
+from http.cookiejar import Cookie, LWPCookieJar
+from os import listdir, stat
+from os.path import join
+from threading import Thread
+from typing import Any, Dict, Optional
+from unittest.mock import patch
+
+from awscli_login.cookies import (
+    SQLiteCookieJar,
+    cookie_jar,
+    domains,
+    merge,
+)
+from awscli_login.saml import refresh
+from awscli_login.transport import close_all
+
+from .base import TempDir
+from .stub_idp import CA, StubIdP
+
+URL = 'https://idp.example.com/idp/profile/SAML2/SOAP/ECP'
+
+
+def cookie(domain: str, name: str = 'shib_idp_session',
+           value: str = 'secret', expires: Optional[int] = None) -> Cookie:
+    rest: Dict[str, Any] = {'HttpOnly': None}
+    return Cookie(0, name, value, None, False, domain, domain[0] == '.',
+                  domain[0] == '.', '/idp', True, True, expires,
+                  expires is None, None, None, rest)
+
+
+def names(jar) -> list:
+    return sorted((c.domain, c.name, c.value) for c in jar)
+
+
+class CookieStoreTest(TempDir):
+    """ Tests for awscli_login.cookies """
+
+    def setUp(self):
+        super().setUp()
+        self.db = join(self.tmpd.name, 'user.db')
+        self.txt = join(self.tmpd.name, 'user.txt')
+
+    def save(self, jar, *cookies: Cookie) -> None:
+        for c in cookies:
+            jar.set_cookie(c)
+        jar.save(ignore_discard=True)
+
+    def test_domains(self):
+        """ Only the domains of a host and its parents are searched. """
+        self.assertEqual(domains('IdP.example.com'), [
+            'idp.example.com', '.idp.example.com', '.example.com',
+        ])
+        self.assertEqual(domains('localhost'), [
+            'localhost', 'localhost.local',
+        ])
+
+    def test_cookie_jar(self):
+        """ The store is chosen by the jar's extension. """
+        self.assertIsInstance(cookie_jar(self.txt, URL), LWPCookieJar)
+        self.assertIsInstance(cookie_jar(self.db, URL), SQLiteCookieJar)
+        self.assertEqual(cookie_jar(self.db, URL).host, 'idp.example.com')
+
+    def test_roundtrip(self):
+        """ Cookies are stored privately and read back unchanged. """
+        self.save(SQLiteCookieJar(self.db),
+                  cookie('idp.example.com'),
+                  cookie('.example.com', 'JSESSIONID', 'id', 2 ** 31))
+
+        jar = SQLiteCookieJar(self.db)
+        jar.load(ignore_discard=True)
+
+        self.assertEqual(names(jar), [
+            ('.example.com', 'JSESSIONID', 'id'),
+            ('idp.example.com', 'shib_idp_session', 'secret'),
+        ])
+        loaded = next(c for c in jar if c.name == 'JSESSIONID')
+        self.assertEqual(loaded.expires, 2 ** 31)
+        self.assertTrue(loaded.domain_initial_dot)
+        self.assertTrue(loaded.has_nonstandard_attr('HttpOnly'))
+        self.assertEqual(stat(self.db).st_mode & 0o777, 0o600)
+
+        conn = sqlite3.connect(self.db)
+        mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        conn.close()
+        self.assertEqual(mode, 'wal')
+
+    def test_discard(self):
+        """ Session cookies are only loaded if asked for. """
+        self.save(SQLiteCookieJar(self.db), cookie('idp.example.com'))
+
+        jar = SQLiteCookieJar(self.db)
+        jar.load()
+
+        self.assertEqual(len(jar), 0)
+
+    def test_host(self):
+        """ Only the cookies of the IdP contacted are loaded and saved. """
+        self.save(SQLiteCookieJar(self.db),
+                  cookie('idp.example.com'),
+                  cookie('.example.com', 'JSESSIONID'),
+                  cookie('idp2.example.com', 'other'))
+
+        jar = cookie_jar(self.db, URL)
+        jar.load(ignore_discard=True)
+        self.assertEqual(len(jar), 2)
+
+        jar.clear('idp.example.com')
+        self.save(jar, cookie('idp.example.com', value='rotated'))
+
+        jar = SQLiteCookieJar(self.db)
+        jar.load(ignore_discard=True)
+        self.assertEqual(names(jar), [
+            ('.example.com', 'JSESSIONID', 'secret'),
+            ('idp.example.com', 'shib_idp_session', 'rotated'),
+            ('idp2.example.com', 'other', 'secret'),
+        ])
+
+    def test_migrate(self):
+        """ A text jar is copied into a new database once. """
+        self.save(LWPCookieJar(self.txt), cookie('idp.example.com'))
+
+        jar = cookie_jar(self.db, URL)
+        jar.load(ignore_discard=True)
+        self.assertEqual(names(jar), [
+            ('idp.example.com', 'shib_idp_session', 'secret'),
+        ])
+
+        self.save(LWPCookieJar(self.txt), cookie('idp.example.com', 'new'))
+        jar = cookie_jar(self.db, URL)
+        jar.load(ignore_discard=True)
+        self.assertEqual(len(jar), 1)
+
+    def test_dirty(self):
+        """ Jars of both stores know when their cookies changed. """
+        for filename in (self.txt, self.db):
+            jar = cookie_jar(filename, URL)
+            self.assertFalse(jar.dirty)
+            self.save(jar, cookie('idp.example.com'))
+            self.assertFalse(jar.dirty)
+
+            jar = cookie_jar(filename, URL)
+            jar.load(ignore_discard=True)
+            jar.set_cookie(cookie('idp.example.com'))
+            self.assertFalse(jar.dirty)
+            jar.set_cookie(cookie('idp.example.com', expires=2 ** 31))
+            self.assertTrue(jar.dirty)
+
+    def test_baseline(self):
+        """ A new jar may be compared to the cookies already stored. """
+        jar = cookie_jar(self.txt, URL)
+        jar.baseline()
+        self.assertTrue(jar.dirty)
+
+        self.save(jar, cookie('idp.example.com'))
+        jar = cookie_jar(self.txt, URL)
+        jar.baseline()
+        self.assertEqual(len(jar), 0)
+        jar.set_cookie(cookie('idp.example.com'))
+        self.assertFalse(jar.dirty)
+
+    def test_atomic(self):
+        """ Text jars are replaced whole and kept private. """
+        jar = cookie_jar(self.txt, URL)
+        self.save(jar, cookie('idp.example.com'))
+
+        with patch.object(jar, 'as_lwp_str', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                jar.save(ignore_discard=True)
+
+        self.assertEqual(sorted(listdir(self.tmpd.name)),
+                         ['user.txt', 'user.txt.lock'])
+        self.assertEqual(stat(self.txt).st_mode & 0o777, 0o600)
+        jar = cookie_jar(self.txt, URL)
+        jar.load(ignore_discard=True)
+        self.assertEqual(len(jar), 1)
+
+    def test_missing(self):
+        """ A missing jar is an error, as for text jars. """
+        with self.assertRaises(FileNotFoundError):
+            cookie_jar(self.db, URL).load()
+
+    def test_merge(self):
+        """ Changes by either side are kept, and the newest on conflict. """
+        new = cookie('idp.example.com', 'a', 'new', 200)
+        base = {('idp.example.com', '/idp', name): ('old', 100, True, False)
+                for name in 'abcde'}
+
+        ours = [cookie('idp.example.com', 'a', 'ours', 200),
+                cookie('idp.example.com', 'b', 'old', 100),
+                cookie('idp.example.com', 'c', 'ours', 300),
+                cookie('idp.example.com', 'd', 'ours', 300),
+                cookie('idp.example.com', 'f', 'ours')]
+        theirs = [cookie('idp.example.com', 'a', 'old', 100),
+                  cookie('idp.example.com', 'b', 'theirs', 200),
+                  cookie('idp.example.com', 'c', 'theirs', 400),
+                  cookie('idp.example.com', 'e', 'old', 100),
+                  cookie('idp.example.com', 'g', 'theirs')]
+
+        self.assertEqual(names(merge(base, ours, theirs)), [
+            ('idp.example.com', 'a', 'ours'),
+            ('idp.example.com', 'b', 'theirs'),
+            ('idp.example.com', 'c', 'theirs'),
+            ('idp.example.com', 'd', 'ours'),
+            ('idp.example.com', 'f', 'ours'),
+            ('idp.example.com', 'g', 'theirs'),
+        ])
+        self.assertEqual(merge(base, [new], []), [new])
+        self.assertEqual(merge(base, [], [new]), [new])
+
+    def test_merge_on_save(self):
+        """ Saving keeps cookies stored by others since the jar loaded. """
+        for filename in (self.txt, self.db):
+            self.save(cookie_jar(filename, URL), cookie('idp.example.com'))
+
+            first = cookie_jar(filename, URL)
+            first.load(ignore_discard=True)
+            second = cookie_jar(filename, URL)
+            second.load(ignore_discard=True)
+
+            self.save(first, cookie('idp.example.com', 'JSESSIONID'))
+            self.save(second, cookie('idp.example.com', value='rotated'))
+            self.assertEqual(len(second), 2)
+
+            jar = cookie_jar(filename, URL)
+            jar.load(ignore_discard=True)
+            self.assertEqual(names(jar), [
+                ('idp.example.com', 'JSESSIONID', 'secret'),
+                ('idp.example.com', 'shib_idp_session', 'rotated'),
+            ])
+
+
+class SharedJarTest(TempDir):
+    """ Refreshes of many profiles sharing one cookie jar at once """
+
+    CLIENTS = 8
+    REFRESHES = 10
+
+    def setUp(self):
+        super().setUp()
+        self.idp = StubIdP(cookies=True).start()
+        self.addCleanup(self.idp.stop)
+
+        close_all()
+        self.addCleanup(close_all)
+
+        patcher = patch.dict(os.environ, {'REQUESTS_CA_BUNDLE': CA})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stress(self, filename: str) -> None:
+        cookie_jar(filename).save(ignore_discard=True)
+        errors = []
+
+        def refresher(client: int) -> None:
+            try:
+                for _ in range(self.REFRESHES):
+                    refresh('%s/%d' % (self.idp.url, client), filename)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=refresher, args=(i,))
+                   for i in range(self.CLIENTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.idp.requests, self.CLIENTS * self.REFRESHES)
+        self.assertEqual(self.idp.lost, 0)
+
+        jar = cookie_jar(filename)
+        jar.load(ignore_discard=True)
+        self.assertEqual({c.name: c.value for c in jar}, {
+            'session_%d' % i: str(self.REFRESHES)
+            for i in range(self.CLIENTS)
+        })
+
+    def test_text(self):
+        """ No cookie update is lost from a shared text jar. """
+        self.stress(join(self.tmpd.name, 'user.txt'))
+
+    def test_sqlite(self):
+        """ No cookie update is lost from a shared SQLite jar. """
+        self.stress(join(self.tmpd.name, 'user.db'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import json
+import subprocess
+import sys
+import unittest
+
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from os import environ, makedirs, stat
+from os.path import dirname
+from unittest.mock import patch
+
+from awscli_login import cache
+from awscli_login.credential_process import (
+    _select_role,
+    cache_file,
+    credential_process,
+)
+from awscli_login.exceptions import NotLoggedIn
+from awscli_login.roles import Roles
+
+from .base import TempDir
+
+ROLES = Roles([
+    ('idp1', 'arn:aws:iam::224588347132:role/KalturaAdmin'),
+    ('idp2', 'arn:aws:iam::617683844790:role/BoxAdmin'),
+])
+
+HEAVY_MODULES = ['awscli', 'boto3', 'botocore', 'lxml', 'requests']
+
+SCRIPT = """
+import sys
+from awscli_login.credential_process import main
+code = main(['--profile', 'test'])
+print(' '.join(m for m in %r if m in sys.modules), file=sys.stderr)
+sys.exit(code)
+""" % HEAVY_MODULES
+
+
+def creds(ttl: int):
+    expires = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    return {
+        'AccessKeyId': 'a',
+        'SecretAccessKey': 'b',
+        'SessionToken': 'c',
+        'Expiration': expires.replace(microsecond=0),
+    }
+
+
+class CredentialProcessTest(TempDir):
+    """ Tests for aws-login-credential-process """
+
+    def setUp(self):
+        super().setUp()
+
+        patcher = patch.dict(environ, {'HOME': self.tmpd.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.filename = cache_file('test')
+        makedirs(dirname(self.filename))
+
+    def test_cache_roundtrip(self):
+        """ Saved credentials should be private and reloadable. """
+        c = creds(3600)
+        cache.save(self.filename, c, ROLES[0])
+        entry = cache.load(self.filename)
+
+        self.assertEqual(stat(self.filename).st_mode & 0o777, 0o600)
+        self.assertEqual(cache.expiration(entry), c['Expiration'])
+        self.assertEqual(entry['RoleArn'], ROLES[0][1])
+        self.assertTrue(cache.is_fresh(entry, 900))
+        self.assertFalse(cache.is_fresh(entry, 3600))
+        self.assertFalse(cache.is_fresh(None, 0))
+
+    def test_hot_path(self):
+        """ A cache hit should not import awscli, boto3 or lxml. """
+        cache.save(self.filename, creds(3600), ROLES[0])
+
+        p = subprocess.run(
+            [sys.executable, '-c', SCRIPT],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+
+        self.assertEqual(p.returncode, 0, p.stderr)
+        self.assertEqual(p.stderr.split(), [])
+        self.assertEqual(json.loads(p.stdout), json.loads(
+            cache.process_output(cache.load(self.filename))
+        ))
+
+    @patch('awscli_login.credential_process.refresh_credentials')
+    def test_refresh_near_expiry(self, mock_refresh):
+        """ Credentials about to expire should be refreshed. """
+        cache.save(self.filename, creds(300), ROLES[0])
+        mock_refresh.return_value = cache.load(self.filename)
+
+        with patch('sys.stdout', new=StringIO()) as stdout:
+            self.assertEqual(credential_process('test'), 0)
+
+        mock_refresh.assert_called_once_with('test', 900)
+        self.assertIn('"Version": 1', stdout.getvalue())
+
+    @patch('awscli_login.credential_process.refresh_credentials',
+           side_effect=OSError('boom'))
+    def test_refresh_failure(self, mock_refresh):
+        """ Failed refreshes should print an error and return an error. """
+        cache.save(self.filename, creds(300), ROLES[0])
+
+        with patch('sys.stderr', new=StringIO()) as stderr:
+            self.assertEqual(credential_process('test'), 1)
+
+        self.assertEqual(stderr.getvalue(), 'boom\n')
+
+    @patch('awscli_login.credential_process.refresh_credentials')
+    def test_logged_out(self, mock_refresh):
+        """ Profiles logged out are not logged in again. """
+        cache.save(self.filename, creds(3600), ROLES[0])
+        cache.remove(self.filename)  # As aws logout does
+
+        with patch('sys.stderr', new=StringIO()) as stderr:
+            self.assertEqual(credential_process('test'), NotLoggedIn.code)
+
+        mock_refresh.assert_not_called()
+        self.assertIn('aws --profile test login', stderr.getvalue())
+
+    def test_select_role(self):
+        """ The cached role is preferred over the profile's role_arn. """
+        entry = {'RoleArn': ROLES[1][1]}
+
+        self.assertEqual(_select_role(entry, ROLES[0][1], ROLES), ROLES[1])
+        self.assertEqual(_select_role(None, ROLES[0][1], ROLES), ROLES[0])
+        self.assertEqual(_select_role(None, None, Roles(ROLES[:1])),
+                         ROLES[0])
+        self.assertEqual(_select_role(None, None, ROLES), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+
+from datetime import datetime, timezone
+from os import listdir, stat
+from threading import Thread
+
+from awscli_login.credentials import CredentialsFile, sts_values
+
+from .base import TempDir
+
+CREDS = {
+    'AccessKeyId': 'a',
+    'SecretAccessKey': 'b',
+    'SessionToken': 'c',
+    'Expiration': datetime(2018, 4, 5, 16, 6, 50, tzinfo=timezone.utc),
+}
+
+
+class CredentialsFileTest(TempDir):
+    """ Tests for awscli_login.credentials.CredentialsFile """
+
+    def setUp(self):
+        super().setUp()
+        self.filename = self._abspath('credentials')
+
+    def test_sts_values(self):
+        """ sts_values should map STS credentials to file keys. """
+        self.assertEqual(sts_values(CREDS), {
+            'aws_access_key_id': 'a',
+            'aws_secret_access_key': 'b',
+            'aws_session_token': 'c',
+            'aws_session_expiration': '2018-04-05T16:06:50Z',
+        })
+
+    def test_update_in_place(self):
+        """ Existing keys are replaced in place, missing keys appended. """
+        self.write('credentials', "[foo]\n"
+                                  "aws_access_key_id=old\n"
+                                  "# comment\n"
+                                  "region = us-east-2\n"
+                                  "\n"
+                                  "[bar]\n"
+                                  "aws_access_key_id = 1\n")
+
+        with CredentialsFile(self.filename) as credentials:
+            credentials.update('foo', sts_values(CREDS))
+
+        self.assertEqual(self.read('credentials'), "[foo]\n"
+                         "aws_access_key_id = a\n"
+                         "# comment\n"
+                         "region = us-east-2\n"
+                         "aws_secret_access_key = b\n"
+                         "aws_session_token = c\n"
+                         "aws_session_expiration = 2018-04-05T16:06:50Z\n"
+                         "\n"
+                         "[bar]\n"
+                         "aws_access_key_id = 1\n")
+
+    def test_update_many_sections_one_write(self):
+        """ Many profiles may be updated before a single save. """
+        self.write('credentials', ''.join(
+            "[p%d]\naws_access_key_id = %d\n" % (i, i) for i in range(300)
+        ))
+        credentials = CredentialsFile(self.filename)
+
+        credentials.update_many(
+            ('p%d' % i, {'aws_access_key_id': 'new%d' % i})
+            for i in range(0, 300, 7)
+        )
+        credentials.update('new', {'aws_access_key_id': 'x'})
+        credentials.update('p0', {'aws_session_token': 'y'})
+        credentials.save()
+
+        data = self.read('credentials')
+        for i in range(300):
+            key = 'new%d' % i if i % 7 == 0 else str(i)
+            self.assertIn("[p%d]\naws_access_key_id = %s\n" % (i, key), data)
+        self.assertTrue(data.startswith("[p0]\naws_access_key_id = new0\n"
+                                        "aws_session_token = y\n"))
+        self.assertTrue(data.endswith("[new]\naws_access_key_id = x\n"))
+
+    def test_update_first_section(self):
+        """ Only the first of duplicate sections is updated. """
+        self.write('credentials', "# preamble\n"
+                                  "[foo]\n"
+                                  "aws_access_key_id = 1\n"
+                                  "[foo]\n"
+                                  "aws_access_key_id = 2")
+
+        with CredentialsFile(self.filename) as credentials:
+            credentials.update('foo', {'aws_access_key_id': 'a'})
+            credentials.update('bar', {'aws_access_key_id': 'b'})
+
+        self.assertEqual(self.read('credentials'), "# preamble\n"
+                         "[foo]\n"
+                         "aws_access_key_id = a\n"
+                         "[foo]\n"
+                         "aws_access_key_id = 2\n"
+                         "[bar]\n"
+                         "aws_access_key_id = b\n")
+
+    def test_save_is_atomic(self):
+        """ New files are private and no temporary files are left. """
+        with CredentialsFile(self.filename) as credentials:
+            credentials.update('default', sts_values(None))
+
+        self.assertEqual(sorted(listdir(self.tmpd.name)),
+                         ['credentials', 'credentials.lock'])
+        self.assertEqual(stat(self.filename).st_mode & 0o777, 0o600)
+
+    def test_no_change_no_write(self):
+        """ The file should not be rewritten if nothing was updated. """
+        with CredentialsFile(self.filename):
+            pass
+
+        self.assertEqual(listdir(self.tmpd.name), ['credentials.lock'])
+
+    def test_locked(self):
+        """ Writers hold the lock from reading until saving. """
+        import fcntl
+
+        with CredentialsFile(self.filename) as credentials:
+            credentials.update('foo', {'aws_access_key_id': 'a'})
+            with open(self.filename + '.lock') as f:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with open(self.filename + '.lock') as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_concurrent_writers(self):
+        """ Sections saved by concurrent writers are all kept. """
+        def write(i: int) -> None:
+            with CredentialsFile(self.filename) as credentials:
+                credentials.update('p%d' % i, {'aws_access_key_id': str(i)})
+
+        threads = [Thread(target=write, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        data = self.read('credentials')
+        for i in range(20):
+            self.assertIn('[p%d]\naws_access_key_id = %d\n' % (i, i), data)
+
+    def test_newlines_rejected(self):
+        """ Values containing newlines could inject new profiles. """
+        credentials = CredentialsFile(self.filename)
+
+        with self.assertRaises(ValueError):
+            credentials.update('foo', {'aws_session_token': 'a\n[bar]'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+
+from http.cookiejar import Cookie, LWPCookieJar
+from os import makedirs
+from os.path import join
+from typing import Optional
+
+from awscli_login import idp_session
+from awscli_login.const import LOG_DIR
+from awscli_login.idp_session import (
+    Decision,
+    check,
+    record,
+    session_end,
+    summarize,
+    touch,
+)
+
+from .base import TempDir
+
+URL = 'https://idp.example.com/idp/profile/SAML2/SOAP/ECP'
+NOW = 1519134730.0
+
+
+def cookie(domain: str, expires: Optional[int]) -> Cookie:
+    return Cookie(0, 'shib_idp_session', 'secret', None, False, domain,
+                  False, False, '/idp', True, True, expires, expires is None,
+                  None, None, {})
+
+
+class IdPSessionTest(TempDir):
+    """ Tests for awscli_login.idp_session """
+
+    def setUp(self):
+        super().setUp()
+        self.home = self.tmpd.name
+        self.cookies = join(self.home, 'user.txt')
+
+    def save(self, *cookies: Cookie) -> None:
+        jar = LWPCookieJar(self.cookies)
+        for c in cookies:
+            jar.set_cookie(c)
+        jar.save(ignore_discard=True, ignore_expires=True)
+
+    def check(self, after: float = 0, **kwargs) -> Decision:
+        return check(URL, self.cookies, now=NOW + after, **kwargs)
+
+    def test_no_jar(self):
+        """ Without a cookie jar there is nothing to refresh with. """
+        self.assertEqual(self.check(), (False, 'no_jar'))
+        self.assertEqual(check(URL, None), (False, 'no_jar'))
+
+    def test_no_cookies(self):
+        """ Cookies for other sites do not make an IdP session. """
+        self.save(cookie('other.example.com', None))
+
+        self.assertEqual(self.check(), (False, 'no_cookies'))
+
+    def test_cookies_expired(self):
+        """ A session ends once every IdP cookie expires. """
+        self.save(cookie('idp.example.com', int(NOW) + 60),
+                  cookie('.example.com', int(NOW) - 60))
+
+        self.assertEqual(self.check(), (True, 'ok'))
+        self.assertEqual(self.check(60), (False, 'cookies_expired'))
+
+    def test_session_cookie(self):
+        """ Session cookies are assumed to last. """
+        self.save(cookie('idp.example.com', None))
+
+        self.assertEqual(self.check(10 ** 6), (True, 'ok'))
+
+    def test_lifetime(self):
+        """ A session ends idp_session_lifetime after a password login. """
+        self.save(cookie('idp.example.com', None))
+        touch(self.cookies, authenticated=True, now=NOW)
+        touch(self.cookies, now=NOW + 3000)
+
+        self.assertEqual(self.check(3599, lifetime=3600), (True, 'ok'))
+        self.assertEqual(self.check(3600, lifetime=3600),
+                         (False, 'lifetime_exceeded'))
+
+    def test_idle_timeout(self):
+        """ A session ends idp_session_timeout after the last success. """
+        self.save(cookie('idp.example.com', None))
+        touch(self.cookies, authenticated=True, now=NOW)
+        touch(self.cookies, now=NOW + 3000)
+
+        self.assertEqual(self.check(3000 + 599, timeout=600), (True, 'ok'))
+        self.assertEqual(self.check(3000 + 600, timeout=600),
+                         (False, 'idle_timeout'))
+
+    def test_session_end(self):
+        """ Sessions end at their lifetime or after idling too long. """
+        self.assertIsNone(session_end(0, 0, NOW, NOW, NOW + 7200))
+        self.assertEqual(session_end(28800, 0, NOW, NOW, NOW + 7200),
+                         NOW + 28800)
+        self.assertEqual(session_end(28800, 3600, NOW, NOW, NOW + 7200),
+                         NOW + 3600)
+        self.assertEqual(session_end(28800, 3600, NOW, NOW, NOW + 1800),
+                         NOW + 28800)
+        self.assertIsNone(session_end(0, 3600, None, NOW, NOW + 1800))
+
+    def test_record(self):
+        """ Decisions and their outcomes are logged and counted. """
+        makedirs(join(self.home, LOG_DIR))
+        record(self.home, 'prod', Decision(True, 'ok'), 'refreshed')
+        record(self.home, 'prod', Decision(True, 'ok'), 'refresh_failed')
+        record(self.home, 'dev', Decision(True, 'ok'), 'refreshed')
+        record(self.home, 'dev', Decision(False, 'no_jar'), 'skipped')
+        with open(join(self.home, idp_session.DECISION_LOG), 'a') as f:
+            f.write('junk\n')
+
+        self.assertEqual(summarize(self.home), {
+            ('ok', 'refreshed'): 2,
+            ('ok', 'refresh_failed'): 1,
+            ('no_jar', 'skipped'): 1,
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
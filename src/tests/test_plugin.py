@@ -0,0 +1,93 @@
+""" Tests for the cost of loading the plugin into awscli """
+import subprocess
+import sys
+import unittest
+
+from typing import Dict, List
+
+# The maximum time in milliseconds the plugin may add to an unrelated
+# aws command, e.g. aws s3 ls.
+IMPORT_BUDGET_MS = 25
+
+# Modules that must only be imported by aws login/logout/configure
+HEAVY_MODULES = [
+    'awscli_login.__main__',
+    'awscli_login.config',
+    'boto3',
+    'daemoniker',
+    'keyring',
+    'lxml',
+    'requests',
+]
+
+# Simulates awscli loading the plugin and building its command tables.
+# awscli.clidriver is loaded and the driver created before the plugin
+# so that only the plugin's import time is attributed to the plugin.
+SCRIPT = """
+import sys
+from awscli.clidriver import create_clidriver
+driver = create_clidriver()
+import awscli_login
+table = {}
+awscli_login.inject_commands(table, driver.session)
+awscli_login.inject_subcommands(table, driver.session)
+print(' '.join(m for m in %r if m in sys.modules))
+""" % HEAVY_MODULES
+
+
+def run(*args: str) -> subprocess.CompletedProcess:
+    """ Runs a python script in a fresh interpreter. """
+    return subprocess.run(
+        [sys.executable, *args, '-c', SCRIPT],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """ Returns the cumulative import time in microseconds of each
+        top-level import found in the output of -X importtime. """
+    r: Dict[str, int] = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        _, cumulative, name = line.split('|')
+
+        # Nested imports are indented, and the header is not a number
+        if name.startswith('  ') or not cumulative.strip().isdigit():
+            continue
+        r[name.strip()] = int(cumulative)
+
+    return r
+
+
+class Plugin(unittest.TestCase):
+    """ Ensures the plugin does not tax unrelated aws commands. """
+
+    def test_heavy_modules_not_imported(self):
+        """ Loading the plugin should not import heavy dependencies. """
+        loaded: List[str] = run().stdout.split()
+
+        self.assertEqual(loaded, [], 'Plugin imported: %s' % loaded)
+
+    def test_import_time_budget(self):
+        """ Loading the plugin should stay within its import budget. """
+        times = parse_importtime(run('-X', 'importtime').stderr)
+        plugin = {k: v for k, v in times.items()
+                  if k.split('.')[0] == 'awscli_login'}
+        total = sum(plugin.values()) / 1000
+
+        self.assertTrue(plugin, 'No plugin imports found!')
+        self.assertLess(
+            total,
+            IMPORT_BUDGET_MS,
+            'Plugin added %.1f ms: %s' % (total, plugin)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
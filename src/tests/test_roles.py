@@ -0,0 +1,217 @@
+import unittest
+
+from datetime import datetime, timezone
+from os import makedirs
+from os.path import isfile, join
+from threading import Lock
+from time import sleep
+
+from awscli_login.exceptions import InvalidRoleProfiles, NoRolesMatched
+from awscli_login.roles import (
+    Roles,
+    assume_roles,
+    load_profiles,
+    map_roles,
+    parse_role_profiles,
+    save,
+    save_profiles,
+)
+from awscli_login.typing import Role
+
+from .base import TempDir
+
+IDP = 'arn:aws:iam::%s:saml-provider/idp'
+ROLE = 'arn:aws:iam::%s:role/%s'
+
+
+def role(account: str, name: str) -> Role:
+    return Role(IDP % account, ROLE % (account, name))
+
+
+ROLES = Roles([
+    role('111111111111', 'Admin'),
+    role('111111111111', 'ReadOnly'),
+    role('222222222222', 'ReadOnly'),
+    role('333333333333', 'Billing'),
+])
+
+CONFIG = """
+arn:aws:iam::111111111111:role/Admin = prod
+# Every account
+arn:aws:iam::*:role/ReadOnly = {account}-{role}
+"""
+
+
+def creds(key: str):
+    return {
+        'AccessKeyId': key,
+        'SecretAccessKey': 'secret',
+        'SessionToken': 'token',
+        'Expiration': datetime(2018, 4, 5, 16, 6, 50, tzinfo=timezone.utc),
+    }
+
+
+class FakeSTS:
+    """ A thread safe STS client that records its peak concurrency. """
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.lock = Lock()
+        self.active = 0
+        self.peak = 0
+        self.durations = []
+
+    def assume_role_with_saml(self, RoleArn, PrincipalArn, SAMLAssertion,
+                              DurationSeconds=None):
+        with self.lock:
+            self.durations.append(DurationSeconds)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        sleep(0.01)
+        with self.lock:
+            self.active -= 1
+
+        if RoleArn in self.fail:
+            raise RuntimeError('Throttling')
+        return {'Credentials': creds(RoleArn)}
+
+
+class RolesTest(unittest.TestCase):
+    """ Tests for awscli_login.roles.Roles """
+
+    def test_role(self):
+        """ Roles expose their account id, name and provider. """
+        role = Role(IDP % '111111111111',
+                    'arn:aws-us-gov:iam::111111111111:role/path/Admin')
+
+        self.assertEqual(role.account_id, '111111111111')
+        self.assertEqual(role.name, 'Admin')
+        self.assertEqual(role.partition, 'aws-us-gov')
+        self.assertEqual(role.provider, IDP % '111111111111')
+        self.assertEqual(role, (role.provider, role.arn))
+
+    def test_indexes(self):
+        """ Roles are found by ARN, account and name. """
+        self.assertEqual(ROLES.accounts,
+                         ['111111111111', '222222222222', '333333333333'])
+        self.assertEqual(ROLES.by_account('111111111111'), ROLES[:2])
+        self.assertEqual(ROLES.by_name('ReadOnly'), ROLES[1:3])
+        self.assertEqual(ROLES.positions('222222222222'), [2])
+        self.assertIs(ROLES.get(ROLES[3].arn), ROLES[3])
+
+        self.assertIsNone(ROLES.get(ROLE % ('333333333333', 'Admin')))
+        self.assertEqual(ROLES.by_account('444444444444'), [])
+        self.assertEqual(ROLES.by_name('Admin2'), [])
+
+    def test_match(self):
+        """ Roles are matched by ARN or fnmatch pattern. """
+        self.assertEqual(ROLES.match(ROLES[3].arn), [ROLES[3]])
+        self.assertEqual(ROLES.match('*:role/ReadOnly'), ROLES[1:3])
+        self.assertEqual(ROLES.match('arn:aws:iam::1*'), ROLES[:2])
+        self.assertEqual(ROLES.match('*:role/Nope'), [])
+
+    def test_from_tuples(self):
+        """ Plain tuples are converted to roles. """
+        roles = Roles([tuple(r) for r in ROLES])
+
+        self.assertEqual(roles, ROLES)
+        self.assertIsInstance(roles[0], Role)
+
+
+class MappingTest(unittest.TestCase):
+    """ Tests for parsing and applying role_profiles """
+
+    def test_parse(self):
+        """ Comments and blank lines are ignored. """
+        self.assertEqual(parse_role_profiles(CONFIG), [
+            ('arn:aws:iam::111111111111:role/Admin', 'prod'),
+            ('arn:aws:iam::*:role/ReadOnly', '{account}-{role}'),
+        ])
+
+    def test_parse_invalid(self):
+        """ Lines without a profile are rejected. """
+        with self.assertRaises(InvalidRoleProfiles):
+            parse_role_profiles('arn:aws:iam::*:role/Admin')
+
+    def test_map_roles(self):
+        """ Exact ARNs and patterns map roles to profiles. """
+        targets = map_roles(parse_role_profiles(CONFIG), ROLES)
+
+        self.assertEqual(targets, {
+            'prod': ROLES[0],
+            '111111111111-ReadOnly': ROLES[1],
+            '222222222222-ReadOnly': ROLES[2],
+        })
+
+    def test_no_roles_matched(self):
+        """ A mapping that matches nothing is an error. """
+        with self.assertRaises(NoRolesMatched):
+            map_roles([('arn:aws:iam::*:role/Nope', 'nope')], ROLES)
+
+    def test_duplicate_profile(self):
+        """ Two roles may not write the same profile. """
+        with self.assertRaises(InvalidRoleProfiles):
+            map_roles([('arn:aws:iam::*:role/ReadOnly', 'ro')], ROLES)
+
+
+class AssumeRolesTest(TempDir):
+    """ Tests for awscli_login.roles.assume_roles and save """
+
+    def test_bounded_fan_out(self):
+        """ Roles are assumed concurrently by a bounded pool. """
+        targets = {'p%d' % i: role('%012d' % i, 'Admin') for i in range(30)}
+        client = FakeSTS()
+
+        results, errors = assume_roles(client, 'saml', targets, 4)
+
+        self.assertEqual(len(results), 30)
+        self.assertEqual(errors, {})
+        self.assertEqual(results['p7']['AccessKeyId'], targets['p7'][1])
+        self.assertGreater(client.peak, 1)
+        self.assertLessEqual(client.peak, 4)
+
+    def test_duration(self):
+        """ Every role is requested for the same session duration. """
+        client = FakeSTS()
+
+        assume_roles(client, 'saml', {'a': ROLES[0], 'b': ROLES[1]},
+                     duration=28800)
+
+        self.assertEqual(client.durations, [28800, 28800])
+
+    def test_partial_failure(self):
+        """ One failed role does not prevent the others. """
+        targets = {'a': ROLES[0], 'b': ROLES[1]}
+        client = FakeSTS(fail=[ROLES[1][1]])
+
+        results, errors = assume_roles(client, 'saml', targets)
+
+        self.assertEqual(list(results), ['a'])
+        self.assertIsInstance(errors['b'], RuntimeError)
+
+    def test_save(self):
+        """ Every profile is written to one credentials file and cached. """
+        cache_dir = self._abspath('cache')
+        makedirs(cache_dir)
+        targets = {'a': ROLES[0], 'b': ROLES[1]}
+        results = {'a': creds('A'), 'b': creds('B')}
+
+        save(self._abspath('credentials'), cache_dir, targets, results)
+
+        credentials = self.read('credentials')
+        self.assertIn('[a]\naws_access_key_id = A\n', credentials)
+        self.assertIn('[b]\naws_access_key_id = B\n', credentials)
+        self.assertTrue(isfile(join(cache_dir, 'b.json')))
+
+    def test_profiles_roundtrip(self):
+        """ The profiles written by a login are recorded for logout. """
+        filename = self._abspath('test.profiles.json')
+        targets = {'a': ROLES[0], 'b': ROLES[1]}
+
+        self.assertIsNone(load_profiles(filename))
+        save_profiles(filename, targets)
+        self.assertEqual(load_profiles(filename), targets)
+
+
+if __name__ == '__main__':
+    unittest.main()
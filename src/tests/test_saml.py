@@ -2,20 +2,27 @@ import requests
 import tempfile
 import unittest
 
-from datetime import datetime
-from os import path
+from base64 import b64decode
+from http.cookiejar import Cookie, LWPCookieJar
+from datetime import datetime, timezone
+from os import path, stat
 from os.path import dirname, abspath
 from requests.exceptions import HTTPError
 from unittest.mock import patch, MagicMock
 
-from lxml.etree import XMLSyntaxError
+from lxml.etree import XMLSyntaxError, fromstring, tostring
 
 from awscli_login.saml import (
+    CHUNK_SIZE,
+    MAX_RESPONSE_SIZE,
     authenticate,
     authn_request,
+    parse_instant,
     parse_role_arns,
+    parse_saml_response,
     parse_soap_response,
     refresh,
+    refresh_stats,
     raise_if_saml_failed,
 )
 
@@ -44,6 +51,11 @@ SAML_AUTHNFAILED = file2bytes(path.join(DATA, 'error.xml'))
 SAML_AUTHNFAILED_HTML = file2bytes(path.join(DATA, 'error.html'))
 AUTHNREQUEST = file2bytes(path.join(DATA, 'authnrequest.xml'))
 
+# The same response with saml2p declared on the envelope
+PROTOCOL = b' xmlns:saml2p="urn:oasis:names:tc:SAML:2.0:protocol"'
+SAML_INHERITED = SAML_SUCCESS.replace(PROTOCOL, b'').replace(
+    b'<soap11:Envelope', b'<soap11:Envelope' + PROTOCOL)
+
 
 class saml(unittest.TestCase):
     """ Tests various SAML helper functions """
@@ -77,6 +89,79 @@ class saml(unittest.TestCase):
         self.assertEqual(assertion, SAML_SUCCESS_B64)
         self.assertEqual(arns, SAML_SUCCESS_ARNS)
 
+    def test_parse_saml_response(self):
+        """ A successful response is parsed into a SamlResponse. """
+        response = parse_saml_response(SAML_SUCCESS)
+
+        self.assertTrue(response.succeeded)
+        self.assertEqual(response.roles, SAML_SUCCESS_ARNS)
+        self.assertEqual(response.not_before, datetime(
+            2018, 2, 20, 13, 52, 10, 47000, tzinfo=timezone.utc))
+        self.assertEqual(response.not_on_or_after, datetime(
+            2018, 2, 20, 13, 57, 10, 47000, tzinfo=timezone.utc))
+        self.assertEqual(response.session_duration, 28800)
+
+    def test_parse_saml_response_failed(self):
+        """ A failed response has a status but no assertion or roles. """
+        response = parse_saml_response(SAML_AUTHNFAILED)
+
+        self.assertFalse(response.succeeded)
+        self.assertEqual(response.status,
+                         'urn:oasis:names:tc:SAML:2.0:status:Requester')
+        self.assertEqual((response.assertion, response.roles), ('', []))
+
+    def test_assertion_from_original_bytes(self):
+        """ The assertion is the Response exactly as the IdP sent it. """
+        assertion = b64decode(parse_saml_response(SAML_SUCCESS).assertion)
+
+        self.assertIn(assertion, SAML_SUCCESS)
+        self.assertTrue(assertion.startswith(b'<saml2p:Response '))
+        fromstring(assertion)
+
+    def test_assertion_with_inherited_namespace(self):
+        """ Responses using the envelope's namespaces are re-serialized. """
+        assertion = b64decode(parse_saml_response(SAML_INHERITED).assertion)
+        resp = fromstring(SAML_INHERITED)[1][0]
+
+        self.assertEqual(assertion, tostring(resp))
+        fromstring(assertion)
+
+    def test_dtd_forbidden(self):
+        """ Responses carrying a DTD, and so entities, are rejected. """
+        bomb = (b'<?xml version="1.0"?><!DOCTYPE S [<!ENTITY a "aaaa">'
+                b'<!ENTITY b "&a;&a;&a;&a;">]><S>&b;</S>')
+        xxe = (b'<?xml version="1.0"?><!DOCTYPE S [<!ENTITY x SYSTEM '
+               b'"file:///etc/passwd">]><S>&x;</S>')
+
+        for soap in [bomb, xxe]:
+            with self.assertRaises(XMLSyntaxError):
+                parse_saml_response(soap)
+
+    def test_parse_instant(self):
+        """ SAML instants are parsed with or without fractions. """
+        self.assertEqual(parse_instant('2018-02-20T13:52:10Z'),
+                         datetime(2018, 2, 20, 13, 52, 10,
+                                  tzinfo=timezone.utc))
+        self.assertEqual(parse_instant('2018-02-20T13:52:10.5Z').microsecond,
+                         500000)
+        self.assertIsNone(parse_instant('2018-02-20T13:52:10+01:00'))
+        self.assertIsNone(parse_instant(None))
+
+    def test_parse_role_arns_any_order(self):
+        """ Roles are parsed in either order and in every partition. """
+        class role:
+            def __init__(self, text):
+                self.text = text
+
+        provider = 'arn:aws-cn:iam::123456789012:saml-provider/idp'
+        arn = 'arn:aws-cn:iam::123456789012:role/path/Admin'
+        roles = parse_role_arns([role(provider + ',' + arn),
+                                 role(' %s , %s ' % (arn, provider))])
+
+        self.assertEqual(roles, [(provider, arn), (provider, arn)])
+        self.assertEqual(roles[0].name, 'Admin')
+        self.assertEqual(roles.by_account('123456789012'), roles)
+
     def test_parse_role_arns(self):
         """ Given bad soap PRA should throw a SAML exception. """
         class role:
@@ -93,10 +178,18 @@ class auth(unittest.TestCase):
         """ A class for mocking a requests' response. """
         status_code: int
         content: bytes
+        headers: dict = {}
 
         def raise_for_status(self):
             pass
 
+        def iter_content(self, chunk_size):
+            for i in range(0, len(self.content), chunk_size):
+                yield self.content[i:i + chunk_size]
+
+        def close(self):
+            pass
+
     class Success(MockRespone):
         status_code = 200
         content = SAML_SUCCESS
@@ -163,10 +256,10 @@ class auth(unittest.TestCase):
                 with open(cookies, 'w') as f:
                     f.write('#LWP-Cookies-2.0')
 
-            encoded, arns = test_func(cookies)
+            response = test_func(cookies)
 
-        self.assertEqual(encoded, saml)
-        self.assertEqual(arns, roles)
+        self.assertEqual(response.assertion, saml)
+        self.assertEqual(response.roles, roles)
 
     def test_authenticate_with_username_password(self):
         """ Simulates successful auth with username/password. """
@@ -222,6 +315,32 @@ class auth(unittest.TestCase):
         with self.assertRaises(InvalidSOAP):
             self.auth_test(idp, "", {}, self.refresh, create_cookies=True)
 
+    def test_authenticate_oversized(self):
+        """ Responses too large to be genuine are not read in full. """
+        read = []
+
+        class Endless(self.MockRespone):
+            status_code = 200
+
+            def iter_content(self, chunk_size):
+                while True:
+                    read.append(chunk_size)
+                    yield b' ' * chunk_size
+
+        with self.assertRaises(InvalidSOAP):
+            self.auth_test([Endless()], "", {}, self.auth)
+        self.assertLessEqual(sum(read), MAX_RESPONSE_SIZE + CHUNK_SIZE)
+
+        class Huge(self.MockRespone):
+            status_code = 200
+            headers = {'Content-Length': str(MAX_RESPONSE_SIZE + 1)}
+
+            def iter_content(self, chunk_size):
+                raise AssertionError('Read a response known to be too large')
+
+        with self.assertRaises(InvalidSOAP):
+            self.auth_test([Huge()], "", {}, self.auth)
+
     def test_refresh_no_cookie_jar(self):
         """ Simulates a no cookie jar found error on refresh. """
         idp = [self.FailureSoap()]
@@ -230,6 +349,61 @@ class auth(unittest.TestCase):
             self.auth_test(idp, "", {}, self.refresh, create_cookies=False)
 
 
+class WriteBack(unittest.TestCase):
+    """ Tests for saving the cookies the IdP sets. """
+
+    URL = 'https://idp.example.com/idp/profile/SAML2/SOAP/ECP'
+
+    def setUp(self):
+        tmpd = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpd.cleanup)
+        self.cookies = path.join(tmpd.name, 'user.txt')
+
+    def login(self, func, *args, value=None):
+        """ Logs in to an IdP that sets a session cookie, if given. """
+        def saml_login(url, jar, *args):
+            if value is not None:
+                jar.set_cookie(Cookie(
+                    0, 'shib_idp_session', value, None, False,
+                    'idp.example.com', False, False, '/idp', True, True,
+                    None, True, None, None, {}))
+            return parse_saml_response(SAML_SUCCESS)
+
+        with patch('awscli_login.saml.saml_login', side_effect=saml_login):
+            func(self.URL, self.cookies, *args)
+
+    def mtime(self):
+        # Saving replaces the jar with a new file
+        st = stat(self.cookies)
+        return st.st_ino, st.st_mtime_ns
+
+    def test_write_back(self):
+        """ Cookies are only saved when they change. """
+        creds = ('user', 'secret', {})
+        self.login(authenticate, *creds, value='a')
+        refreshes = refresh_stats['refreshes']
+        updates = refresh_stats['jar_updates']
+
+        saved = self.mtime()
+        self.login(authenticate, *creds, value='a')
+        self.login(refresh)
+        self.assertEqual(self.mtime(), saved)
+
+        self.login(refresh, value='b')
+        jar = LWPCookieJar(self.cookies)
+        jar.load(ignore_discard=True)
+        self.assertEqual([c.value for c in jar], ['b'])
+
+        self.assertEqual(refresh_stats['refreshes'] - refreshes, 2)
+        self.assertEqual(refresh_stats['jar_updates'] - updates, 1)
+
+    def test_new_jar(self):
+        """ A jar is created even if the IdP sets no cookies. """
+        self.login(authenticate, 'user', 'secret', {})
+
+        self.assertTrue(path.isfile(self.cookies))
+
+
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     unittest.main()
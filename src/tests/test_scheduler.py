@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from datetime import datetime, timezone
+from random import Random
+
+from awscli_login.scheduler import (
+    BACKOFF_CAP,
+    KEEPALIVE_DEFAULT,
+    KEEPALIVE_MIN,
+    Schedule,
+    Scheduler,
+    SimulatedClock,
+)
+
+NOW = 1500000000.0
+HOUR = 3600
+
+
+def expiration(seconds: float) -> datetime:
+    return datetime.fromtimestamp(NOW + seconds, timezone.utc)
+
+
+class SchedulerTest(unittest.TestCase):
+    """ Tests for awscli_login.scheduler.Scheduler """
+
+    def setUp(self):
+        self.clock = SimulatedClock(NOW)
+        self.scheduler = Scheduler(self.clock, Random(0))
+
+    def test_next(self):
+        """ Refreshes happen refresh_lead seconds before expiration. """
+        when = self.scheduler.next(expiration(HOUR), Schedule(lead=900))
+        self.assertEqual(when, NOW + HOUR - 900)
+
+    def test_next_short_lived(self):
+        """ Short lived credentials are refreshed half way through. """
+        when = self.scheduler.next(expiration(600), Schedule(lead=900))
+        self.assertEqual(when, NOW + 300)
+
+    def test_next_interval(self):
+        """ The refresh interval caps the time between refreshes. """
+        schedule = Schedule(lead=900, interval=1200)
+        when = self.scheduler.next(expiration(HOUR), schedule)
+
+        self.assertEqual(when, NOW + 1200)
+
+    def test_next_expired(self):
+        """ Expired credentials are refreshed immediately. """
+        self.assertEqual(self.scheduler.next(expiration(-10), Schedule()),
+                         NOW)
+
+    def test_first_spread(self):
+        """ Logins at the same time are spread over refresh_spread. """
+        schedule = Schedule(lead=900, spread=300)
+        due = NOW + HOUR - 900
+        times = [self.scheduler.first(expiration(HOUR), schedule)
+                 for _ in range(300)]
+
+        self.assertTrue(all(due - 300 <= t <= due for t in times))
+        # No more than a handful of hosts refresh in the same second
+        seconds = [int(t) for t in times]
+        self.assertLess(max(seconds.count(s) for s in seconds), 8)
+
+    def test_retry_backoff(self):
+        """ Retries back off exponentially with full jitter. """
+        for attempt in range(1, 10):
+            ceiling = min(BACKOFF_CAP, 5 * 2 ** (attempt - 1))
+            delays = [self.scheduler.retry(expiration(HOUR), attempt) - NOW
+                      for _ in range(50)]
+
+            self.assertTrue(all(0 <= d <= ceiling for d in delays))
+            self.assertGreater(max(delays), ceiling / 2)
+
+    def test_retry_bounded_by_expiration(self):
+        """ Retries never happen after the credentials expire. """
+        when = self.scheduler.retry(expiration(30), 8)
+
+        self.assertLessEqual(when, NOW + 30)
+        self.assertIsNone(self.scheduler.retry(expiration(0.5), 1))
+        self.assertIsNone(self.scheduler.retry(expiration(-10), 1))
+
+    def test_keepalive(self):
+        """ The IdP is contacted every half of its inactivity timeout. """
+        self.assertEqual(self.scheduler.keepalive(NOW, 3600), NOW + 1800)
+        self.assertEqual(self.scheduler.keepalive(NOW, 0),
+                         NOW + KEEPALIVE_DEFAULT)
+        self.assertEqual(self.scheduler.keepalive(NOW, 10),
+                         NOW + KEEPALIVE_MIN)
+        self.assertEqual(self.scheduler.keepalive(NOW - HOUR, 600), NOW)
+
+    def test_simulated_clock(self):
+        """ Waiting on a simulated clock advances it instantly. """
+        async def wait():
+            await self.clock.wait(asyncio.Event(), HOUR)
+
+        asyncio.run(wait())
+
+        self.assertEqual(self.clock.time(), NOW + HOUR)
+
+
+if __name__ == '__main__':
+    unittest.main()
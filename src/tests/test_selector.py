@@ -0,0 +1,151 @@
+import unittest
+
+from io import StringIO
+from os import stat
+from os.path import join
+from unittest.mock import patch
+
+from awscli_login import selector
+from awscli_login.exceptions import InvalidAccountAliases
+from awscli_login.roles import Roles
+from awscli_login.selector import (
+    HALF_LIFE,
+    RoleIndex,
+    Usage,
+    parse_account_aliases,
+    select,
+)
+
+from .base import TempDir
+
+ROLES = Roles([
+    ('idp', 'arn:aws:iam::222222222222:role/ReadOnly'),
+    ('idp', 'arn:aws:iam::111111111111:role/ReadOnly'),
+    ('idp', 'arn:aws:iam::111111111111:role/Admin'),
+    ('idp', 'arn:aws:iam::222222222222:role/Admin'),
+])
+ALIASES = {'111111111111': 'prod', '222222222222': 'dev'}
+
+
+class AliasesTest(unittest.TestCase):
+    """ Tests for parse_account_aliases """
+
+    def test_parse(self):
+        """ Aliases are parsed one per line, skipping comments. """
+        value = """
+            111111111111 = prod
+            # 333333333333 = test
+            222222222222 = dev
+        """
+
+        self.assertEqual(parse_account_aliases(value), ALIASES)
+        self.assertEqual(parse_account_aliases(None), {})
+
+    def test_invalid(self):
+        """ Lines without an account id and an alias are rejected. """
+        for line in ('111111111111', 'prod = 111111111111', '1111 ='):
+            with self.assertRaises(InvalidAccountAliases):
+                parse_account_aliases(line)
+
+
+class UsageTest(TempDir):
+    """ Tests for Usage """
+
+    def setUp(self):
+        super().setUp()
+        self.filename = join(self.tmpd.name, 'cache', 'usage.json')
+
+    def test_decay(self):
+        """ Scores halve every HALF_LIFE and grow with each use. """
+        usage = Usage()
+        usage.record('a', now=0)
+        usage.record('a', now=HALF_LIFE)
+
+        self.assertEqual(usage.score('a', now=HALF_LIFE), 1.5)
+        self.assertEqual(usage.score('a', now=2 * HALF_LIFE), 0.75)
+        self.assertEqual(usage.score('b'), 0)
+
+    def test_persist(self):
+        """ Usage is saved privately and read back. """
+        Usage(self.filename).record('a', now=0)
+
+        self.assertEqual(stat(self.filename).st_mode & 0o777, 0o600)
+        self.assertEqual(Usage(self.filename).score('a', now=0), 1)
+
+    @patch.object(selector, 'MAX_ENTRIES', 2)
+    def test_prune(self):
+        """ Only the MAX_ENTRIES highest scoring roles are kept. """
+        usage = Usage()
+        usage.record('a', now=0)
+        usage.record('a', now=0)
+        usage.record('b', now=0)
+        usage.record('c', now=HALF_LIFE)
+
+        self.assertEqual(sorted(usage.entries), ['a', 'c'])
+
+
+class RoleIndexTest(unittest.TestCase):
+    """ Tests for RoleIndex """
+
+    def test_order(self):
+        """ Roles are ranked by usage, then by account and name. """
+        self.assertEqual(RoleIndex(ROLES).order, [2, 1, 3, 0])
+
+        usage = Usage()
+        usage.record(ROLES[0].arn)
+        self.assertEqual(RoleIndex(ROLES, usage=usage).order, [0, 2, 1, 3])
+
+    def test_search(self):
+        """ Every word must match an account id, alias or role name. """
+        index = RoleIndex(ROLES, ALIASES)
+
+        self.assertEqual(index.search('admin'), [2, 3])
+        self.assertEqual(index.search('PROD read'), [1])
+        self.assertEqual(index.search('2222 admin'), [3])
+        self.assertEqual(index.search('nope'), [])
+
+    def test_refine(self):
+        """ Refined queries only search the last matches. """
+        index = RoleIndex(ROLES, ALIASES)
+
+        self.assertEqual(index.search('admin', within=[3]), [3])
+
+
+@patch('sys.stdout', new=StringIO())
+class SelectTest(unittest.TestCase):
+    """ Tests for select """
+
+    def select(self, *answers):
+        with patch('builtins.input', side_effect=answers) as mock_input:
+            role = select(RoleIndex(ROLES, ALIASES))
+        self.assertEqual(mock_input.call_count, len(answers))
+
+        return role
+
+    def test_number(self):
+        """ Numbers select roles in the order listed. """
+        self.assertEqual(self.select('0'), ROLES[2])
+        self.assertEqual(self.select(3), ROLES[0])
+
+    def test_filter(self):
+        """ Text narrows the list and renumbers it. """
+        self.assertEqual(self.select('dev', '0'), ROLES[3])
+        self.assertEqual(self.select('dev', 'dev read', ''), ROLES[0])
+
+    def test_account_id(self):
+        """ Numbers not listed narrow the list by account id. """
+        self.assertEqual(self.select('2222', '0'), ROLES[3])
+        self.assertEqual(self.select('222222222222', '222222222222 read',
+                                     ''), ROLES[0])
+
+    def test_invalid(self):
+        """ Unknown numbers and queries prompt again. """
+        self.assertEqual(self.select('9', 'nope', '1'), ROLES[1])
+
+    def test_reset(self):
+        """ An empty line lists every role again. """
+        self.assertEqual(self.select('dev', '', '0'), ROLES[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from os import stat
+from typing import Optional
+
+from botocore.utils import ContainerMetadataFetcher
+
+from awscli_login.server import CredentialServer, new_token, save_token
+
+from .base import TempDir
+
+CREDS = {
+    'AccessKeyId': 'a',
+    'SecretAccessKey': 'b',
+    'SessionToken': 'c',
+    'Expiration': datetime(2018, 4, 5, 16, 6, 50, tzinfo=timezone.utc),
+}
+
+
+class CredentialServerTest(unittest.TestCase):
+    """ Tests for awscli_login.server.CredentialServer """
+
+    def setUp(self):
+        self.token = new_token()
+        self.server = CredentialServer(0)
+        self.server.update('test', CREDS, self.token)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def get(self, path: str, token: Optional[str] = None):
+        conn = HTTPConnection('127.0.0.1', self.server.port, timeout=5)
+        headers = {'Authorization': token} if token else {}
+
+        conn.request('GET', path, headers=headers)
+        r = conn.getresponse()
+        body = r.read()
+        conn.close()
+
+        return r.status, body
+
+    def test_botocore_compatible(self):
+        """ botocore's container provider should accept the response. """
+        fetcher = ContainerMetadataFetcher()
+        creds = fetcher.retrieve_full_uri(
+            self.server.url('test'),
+            headers={'Authorization': self.token},
+        )
+
+        self.assertEqual(creds, {
+            'AccessKeyId': 'a',
+            'SecretAccessKey': 'b',
+            'Token': 'c',
+            'Expiration': '2018-04-05T16:06:50Z',
+        })
+
+    def test_unauthorized(self):
+        """ Requests without the token should be rejected. """
+        self.assertEqual(self.get('/test')[0], 401)
+        self.assertEqual(self.get('/test', 'bad')[0], 401)
+
+    def test_unknown_profile(self):
+        """ Unknown profiles should be indistinguishable from bad tokens. """
+        self.assertEqual(self.get('/prod', self.token)[0], 401)
+
+        self.server.remove('test')
+        self.assertEqual(self.get('/test', self.token)[0], 401)
+
+    def test_per_profile_tokens(self):
+        """ Each profile's token only grants access to that profile. """
+        token = new_token()
+        self.server.update('prod', dict(CREDS, AccessKeyId='p'), token)
+
+        self.assertEqual(self.get('/prod', self.token)[0], 401)
+        self.assertEqual(self.get('/test', token)[0], 401)
+        status, body = self.get('/prod', token)
+        self.assertEqual(json.loads(body)['AccessKeyId'], 'p')
+        self.assertEqual(self.get('/', token)[0], 401)
+
+    def test_single_profile_root(self):
+        """ / serves the only profile. """
+        status, body = self.get('/', self.token)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['AccessKeyId'], 'a')
+
+    def test_concurrent_requests_and_updates(self):
+        """ Concurrent readers always see a complete set of credentials. """
+        def update(i):
+            creds = dict(CREDS, AccessKeyId=str(i), SessionToken=str(i))
+            self.server.update('test', creds)
+
+        def read(i):
+            status, body = self.get('/test', self.token)
+            creds = json.loads(body)
+            return status, creds['AccessKeyId'] == creds['Token']
+
+        with ThreadPoolExecutor(16) as pool:
+            updates = pool.map(update, range(50))
+            results = list(pool.map(read, range(200)))
+            list(updates)
+
+        self.assertEqual(results, [(200, True)] * 200)
+
+
+class TokenTest(TempDir):
+
+    def test_save_token(self):
+        """ The token file should only be readable by its owner. """
+        filename = self._abspath('test.token')
+        save_token(filename, 'secret')
+
+        self.assertEqual(self.read('test.token'), 'secret')
+        self.assertEqual(stat(filename).st_mode & 0o777, 0o600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import json
+import subprocess
+import sys
+import unittest
+
+from io import StringIO
+from os import getpid, makedirs, stat
+from os.path import join
+from typing import Any, Dict, Optional
+from unittest.mock import patch
+
+from awscli_login.const import CONFIG_DIR
+from awscli_login.exceptions import NotLoggedIn
+from awscli_login.status import (
+    RECORD,
+    SLOT_SIZE,
+    SLOTS,
+    TABLE,
+    Status,
+    StatusTable,
+    read,
+    status,
+)
+
+from .base import TempDir
+
+NOW = 1519134730.0
+ROLE = 'arn:aws:iam::224588347132:role/KalturaAdmin'
+
+HEAVY_MODULES = ['awscli', 'awscli_login.supervisor', 'boto3', 'botocore',
+                 'lxml', 'requests']
+
+SCRIPT = """
+import sys
+from awscli_login.status import status
+code = status('test', home=%%r)
+print(' '.join(m for m in %r if m in sys.modules), file=sys.stderr)
+sys.exit(code)
+""" % HEAVY_MODULES
+
+
+def record(name: str, pid: Optional[int] = None, **kwargs) -> Status:
+    values: Dict[str, Any] = dict(
+        name=name,
+        pid=getpid() if pid is None else pid,
+        started=NOW,
+        role=ROLE,
+        profiles=[name, 'other'],
+        expiration=NOW + 3600,
+        next_refresh=NOW + 2700,
+        keepalive=False,
+        next_keepalive=None,
+        latency=0.25,
+        failures=0,
+        idp_session_end=None,
+        updated=NOW,
+    )
+    values.update(kwargs)
+    return Status(**values)
+
+
+class StatusTableTest(TempDir):
+    """ Tests for awscli_login.status """
+
+    def setUp(self):
+        super().setUp()
+        self.home = self.tmpd.name
+        makedirs(join(self.home, CONFIG_DIR))
+        self.filename = join(self.home, TABLE)
+
+    def open(self) -> StatusTable:
+        table = StatusTable(self.filename)
+        self.addCleanup(table.close)
+        return table
+
+    def status(self, profile: str, show_all: bool = False,
+               as_json: bool = False) -> str:
+        with patch('sys.stdout', new=StringIO()) as stdout:
+            self.assertEqual(status(profile, show_all, as_json,
+                                    home=self.home), 0)
+        return stdout.getvalue()
+
+    def test_roundtrip(self):
+        """ Records are read back as written, and kept private. """
+        table = self.open()
+        table.update(record('test', keepalive=True,
+                            next_keepalive=NOW + 300))
+        table.update(record('dev', failures=2))
+        table.update(record('test', failures=1))
+
+        self.assertEqual(read(self.filename), [
+            record('dev', failures=2), record('test', failures=1),
+        ])
+        self.assertEqual(stat(self.filename).st_mode & 0o777, 0o600)
+
+    def test_remove(self):
+        """ Removed records and those of dead processes are not read. """
+        table = self.open()
+        table.update(record('test'))
+        table.update(record('dead', pid=2 ** 22 + 1))
+        table.remove('test')
+        table.update(record('dev'))
+
+        self.assertEqual(read(self.filename), [record('dev')])
+
+    def test_grow(self):
+        """ The table grows when every slot is used. """
+        table = self.open()
+        for i in range(SLOTS + 1):
+            table.update(record('p%03d' % i))
+
+        self.assertEqual(len(read(self.filename)), SLOTS + 1)
+
+    def test_reopen(self):
+        """ A new supervisor clears the records of the last. """
+        table = StatusTable(self.filename)
+        table.update(record('test'))
+        table._file.close()  # As if it crashed
+
+        self.open()
+        self.assertEqual(read(self.filename), [])
+
+    def test_torn(self):
+        """ A record being written is not read. """
+        table = self.open()
+        table.update(record('test'))
+        table.update(record('dev'))
+
+        offset = table._offset(table._slots['test'])
+        table._mm[offset:offset + 4] = (3).to_bytes(4, 'little')
+
+        self.assertEqual(read(self.filename), [record('dev')])
+
+    def test_missing(self):
+        """ Without a supervisor no profile is logged in. """
+        self.assertEqual(read(self.filename), [])
+
+        with patch('sys.stderr', new=StringIO()) as stderr:
+            self.assertEqual(status('test', home=self.home),
+                             NotLoggedIn.code)
+        self.assertIn('aws --profile test login', stderr.getvalue())
+
+    def test_status(self):
+        """ A profile's status is printed as text or JSON. """
+        table = self.open()
+        table.update(record('test', failures=2))
+
+        text = self.status('test')
+        self.assertIn('Also writes:         other\n', text)
+        self.assertIn('Credentials expire:  2018-02-20T14:52:10Z\n', text)
+        self.assertIn('Next refresh:        2018-02-20T14:37:10Z '
+                      '(2 failed)\n', text)
+        self.assertIn('Last refresh took:   0.25s\n', text)
+        self.assertIn('Supervisor:          pid %d' % getpid(), text)
+
+        data = json.loads(self.status('test', False, True))
+        self.assertEqual(data['role'], ROLE)
+        self.assertEqual(data['expiration'], '2018-02-20T14:52:10Z')
+        self.assertIsNone(data['idp_session_end'])
+
+    def test_all(self):
+        """ Every profile is listed with --all. """
+        table = self.open()
+        table.update(record('test'))
+        table.update(record('dev', failures=1))
+
+        lines = self.status('test', True).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('PROFILE'))
+        self.assertTrue(lines[1].startswith('dev '))
+        self.assertTrue(lines[1].endswith('1'))
+
+        data = json.loads(self.status('test', True, True))
+        self.assertEqual([s['name'] for s in data], ['dev', 'test'])
+
+    def test_too_long(self):
+        """ Values too long for the table are never shown cut. """
+        table = self.open()
+        role = 'arn:aws:iam::224588347132:role/' + 'a' * 250
+        profiles = ['test'] + ['p%03d' % i for i in range(100)]
+        table.update(record('test', role=role, profiles=profiles))
+
+        found = read(self.filename)[0]
+        self.assertEqual(found.role, '')
+        self.assertEqual(found.truncated, ('role', 'profiles'))
+        self.assertEqual(found.profiles, profiles[:len(found.profiles)])
+        self.assertLessEqual(len(','.join(found.profiles)), 256)
+
+        text = self.status('test')
+        self.assertIn('Role:                (too long to show)\n', text)
+        self.assertIn(', p049, ...\n', text)
+
+        data = json.loads(self.status('test', False, True))
+        self.assertEqual(data['role'], '')
+        self.assertEqual(data['truncated'], ['role', 'profiles'])
+
+        with self.assertRaises(ValueError):
+            table.update(record('x' * 129))
+        self.assertEqual(len(read(self.filename)), 1)
+
+    def test_light(self):
+        """ Reading the status should not import the supervisor. """
+        self.open().update(record('test'))
+
+        p = subprocess.run(
+            [sys.executable, '-c', SCRIPT % self.home],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+
+        self.assertEqual(p.returncode, 0, p.stderr)
+        self.assertEqual(p.stderr.split(), [])
+        self.assertIn('Role:                ' + ROLE, p.stdout)
+
+    def test_record_size(self):
+        """ Records fit their slots. """
+        self.assertLessEqual(RECORD.size, SLOT_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
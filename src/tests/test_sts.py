@@ -0,0 +1,184 @@
+import unittest
+
+from datetime import datetime, timezone
+from os import makedirs
+from os.path import join
+from time import time
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from awscli_login import sts
+from awscli_login.__main__ import save_sts_token
+from awscli_login.const import CACHE_DIR
+
+from .base import TempDir
+
+ROLE = (
+    'arn:aws:iam::123456789012:saml-provider/idp',
+    'arn:aws:iam::123456789012:role/admin',
+)
+ASSERTION = 'PHNhbWxwOlJlc3BvbnNlLz4='  # Must be at least 4 characters
+CREDS = {
+    'AccessKeyId': 'ASIAEXAMPLEEXAMPLE',
+    'SecretAccessKey': 'secret',
+    'SessionToken': 'token',
+    'Expiration': datetime(2018, 4, 5, 16, 6, 50, tzinfo=timezone.utc),
+}
+
+
+class ClientTest(unittest.TestCase):
+    """ Tests for awscli_login.sts clients """
+
+    def setUp(self):
+        sts.reset()
+        self.addCleanup(sts.reset)
+
+    def test_regional_endpoint(self):
+        """ Clients for a region use that region's STS endpoint. """
+        for region in ['eu-west-1', 'us-east-1']:
+            client = sts.new_client(region)
+            self.assertEqual(client.meta.endpoint_url,
+                             'https://sts.%s.amazonaws.com' % region)
+
+    def test_tuned_config(self):
+        """ Clients have short timeouts and retry transient errors. """
+        config = sts.new_client('eu-west-1').meta.config
+
+        self.assertEqual(config.connect_timeout, sts.CONNECT_TIMEOUT)
+        self.assertEqual(config.read_timeout, sts.READ_TIMEOUT)
+        self.assertEqual(config.retries['mode'], 'adaptive')
+
+    def test_reused(self):
+        """ One client is created per region. """
+        client = sts.get_client('eu-west-1')
+
+        self.assertIs(sts.get_client('eu-west-1'), client)
+        self.assertIsNot(sts.get_client('ap-south-1'), client)
+
+    def test_stubbed_assume_role(self):
+        """ Credentials are retrieved without any AWS credentials. """
+        client = sts.get_client('eu-west-1')
+        expected = {
+            'RoleArn': ROLE[1],
+            'PrincipalArn': ROLE[0],
+            'SAMLAssertion': ASSERTION,
+        }
+        profile = MagicMock()
+
+        with Stubber(client) as stub, \
+                patch('awscli_login.__main__.save_credentials') as save, \
+                patch('awscli_login.__main__.cache') as cache:
+            stub.add_response('assume_role_with_saml',
+                              {'Credentials': CREDS}, expected)
+            creds = save_sts_token(profile, None, client, ASSERTION, ROLE)
+            stub.assert_no_pending_responses()
+
+        self.assertEqual(creds, CREDS)
+        save.assert_called_once()
+        cache.save.assert_called_once_with(profile.credential_cache,
+                                           CREDS, ROLE)
+
+
+class DurationTest(unittest.TestCase):
+    """ Tests for awscli_login.sts session durations """
+
+    def setUp(self):
+        sts.reset()
+        self.addCleanup(sts.reset)
+        self.client = sts.get_client('eu-west-1')
+        self.expected = {
+            'RoleArn': ROLE[1],
+            'PrincipalArn': ROLE[0],
+            'SAMLAssertion': ASSERTION,
+        }
+
+    def test_session_duration(self):
+        """ The shorter of the option and SessionDuration is requested. """
+        self.assertIsNone(sts.session_duration(0, None))
+        self.assertEqual(sts.session_duration(0, 28800), 28800)
+        self.assertEqual(sts.session_duration(7200, 28800), 7200)
+        self.assertEqual(sts.session_duration(7200, None), 7200)
+        self.assertEqual(sts.session_duration(60, None), sts.MIN_DURATION)
+        self.assertEqual(sts.session_duration(0, 10 ** 6), sts.MAX_DURATION)
+
+    def test_duration_requested(self):
+        """ Roles are assumed for the duration given. """
+        with Stubber(self.client) as stub:
+            stub.add_response('assume_role_with_saml', {'Credentials': CREDS},
+                              dict(self.expected, DurationSeconds=28800))
+            token = sts.assume_role_with_saml(self.client, ROLE, ASSERTION,
+                                              28800)
+            stub.assert_no_pending_responses()
+
+        self.assertEqual(token['Credentials'], CREDS)
+
+    def test_duration_fallback(self):
+        """ Roles not allowing the duration are assumed for the default. """
+        with Stubber(self.client) as stub:
+            stub.add_client_error('assume_role_with_saml', 'ValidationError',
+                                  expected_params=dict(self.expected,
+                                                       DurationSeconds=43200))
+            stub.add_response('assume_role_with_saml', {'Credentials': CREDS},
+                              self.expected)
+            token = sts.assume_role_with_saml(self.client, ROLE, ASSERTION,
+                                              43200)
+            stub.assert_no_pending_responses()
+
+        self.assertEqual(token['Credentials'], CREDS)
+
+    def test_other_errors(self):
+        """ Other errors are not retried. """
+        with Stubber(self.client) as stub:
+            stub.add_client_error('assume_role_with_saml',
+                                  'ExpiredTokenException')
+            with self.assertRaises(ClientError):
+                sts.assume_role_with_saml(self.client, ROLE, ASSERTION, 3600)
+
+
+class RegionTest(TempDir):
+    """ Tests for awscli_login.sts.resolve_region """
+
+    def setUp(self):
+        super().setUp()
+        self.home = self.tmpd.name
+        makedirs(join(self.home, CACHE_DIR))
+        self.probe = MagicMock(return_value='ap-southeast-2')
+
+    def test_explicit(self):
+        """ Explicit regions are used as is and never probed. """
+        self.assertEqual(sts.resolve_region(self.home, 'eu-west-1',
+                                            self.probe), 'eu-west-1')
+        self.assertIsNone(sts.resolve_region(self.home, None, self.probe))
+        self.assertIsNone(sts.resolve_region(self.home, '', self.probe))
+        self.probe.assert_not_called()
+
+    def test_auto_cached(self):
+        """ Probe results are cached until they are too old. """
+        for _ in range(3):
+            region = sts.resolve_region(self.home, sts.AUTO, self.probe)
+            self.assertEqual(region, 'ap-southeast-2')
+        self.assertEqual(self.probe.call_count, 1)
+
+        with patch('awscli_login.sts.time', return_value=time() + 86401):
+            sts.resolve_region(self.home, sts.AUTO, self.probe)
+        self.assertEqual(self.probe.call_count, 2)
+
+    def test_auto_unreachable(self):
+        """ Failed probes fall back to the configured region. """
+        self.probe.return_value = None
+
+        self.assertIsNone(sts.resolve_region(self.home, sts.AUTO, self.probe))
+
+    def test_probe(self):
+        """ The region with the lowest latency wins. """
+        times = {'us-east-1': 0.2, 'eu-west-1': 0.05,
+                 'ap-south-1': float('inf')}
+
+        self.assertEqual(sts.probe(list(times), times.get), 'eu-west-1')
+        self.assertIsNone(sts.probe(['ap-south-1'], times.get))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,484 @@
+import asyncio
+import logging
+import unittest
+
+from datetime import datetime, timedelta, timezone
+from os import getpid, listdir, makedirs
+from os.path import isfile, join
+from threading import Event, Thread
+from random import Random
+from time import sleep, time
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+from awscli_login.const import CACHE_DIR, CONFIG_DIR
+from awscli_login.credentials import iso8601
+from awscli_login.exceptions import SupervisorError
+from awscli_login.roles import Roles
+from awscli_login.saml import SAML_SUCCESS, SamlResponse
+from awscli_login.scheduler import Scheduler, SimulatedClock
+from awscli_login.status import TABLE, read
+from awscli_login.supervisor import (
+    PIDFILE,
+    STARTLOCK,
+    Registration,
+    StartLock,
+    Supervisor,
+    deregister,
+    is_running,
+    refresh_now,
+    register,
+    request,
+    switch_role,
+)
+from awscli_login.typing import Role
+from awscli_login.util import clear_credentials
+
+from .base import TempDir
+
+ADMIN = 'arn:aws:iam::224588347132:role/KalturaAdmin'
+READONLY = 'arn:aws:iam::224588347132:role/ReadOnly'
+
+
+def creds(ttl: float, key: str = 'a'):
+    expires = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    expires = expires.replace(microsecond=0)
+    return {
+        'AccessKeyId': key,
+        'SecretAccessKey': 'b',
+        'SessionToken': 'c',
+        'Expiration': expires,
+    }
+
+
+class SupervisorTest(TempDir):
+    """ Tests for awscli_login.supervisor """
+
+    def setUp(self):
+        super().setUp()
+        self.home = self.tmpd.name
+        makedirs(join(self.home, CACHE_DIR))
+
+        self.client = MagicMock()
+        self.client.assume_role_with_saml.side_effect = \
+            lambda **kwargs: {'Credentials': creds(3600, kwargs['RoleArn'])}
+
+        patcher = patch('awscli_login.supervisor.refresh',
+                        return_value=SamlResponse(SAML_SUCCESS,
+                                                  'assertion', []))
+        self.refresh = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def registration(self, name: str, ttl: float) -> Registration:
+        return Registration(
+            name=name,
+            ecp_endpoint_url='https://idp/' + name,
+            cookies=name + '.txt',
+            profiles={name: Role('idp', 'role/' + name)},
+            credentials_file=join(self.home, 'credentials'),
+            credential_cache=join(self.home, CACHE_DIR, name + '.json'),
+            pidfile=join(self.home, CONFIG_DIR, name + '.pid'),
+            tokenfile=join(self.home, CONFIG_DIR, name + '.token'),
+            credentials_port=0,
+            token=None,
+            creds=creds(ttl),
+            refresh_spread=0,
+        )
+
+    def start(self, reg: Optional[Registration] = None,
+              scheduler: Optional[Scheduler] = None) -> Thread:
+        self.supervisor = Supervisor(self.home, lambda region: self.client,
+                                     scheduler)
+        thread = Thread(target=self.supervisor.run, args=(reg,))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.stop)
+
+        for _ in range(100):
+            if request(self.home, {'op': 'ping'}):
+                break
+            sleep(0.01)
+
+        return thread
+
+    def stop(self) -> None:
+        for name in self.supervisor.profiles:
+            self.supervisor.deregister(name)
+
+    def test_registration_roundtrip(self):
+        """ Registrations should survive the trip over the socket. """
+        reg = self.registration('test', 60)
+        new = Registration.from_dict(reg.to_dict())
+
+        self.assertEqual(vars(new), vars(reg))
+
+        reg.response = self.response('cached', 300)
+        new = Registration.from_dict(reg.to_dict())
+        self.assertEqual(new.response, reg.response)
+
+    def response(self, assertion: str, ttl: float) -> SamlResponse:
+        expires = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        return SamlResponse(
+            SAML_SUCCESS, assertion,
+            Roles([('idp', ADMIN), ('idp', READONLY)]),
+            not_on_or_after=expires.replace(microsecond=0),
+        )
+
+    def test_not_running(self):
+        """ Requests should return None when no supervisor is running. """
+        self.assertIsNone(request(self.home, {'op': 'ping'}))
+        self.assertFalse(deregister(self.home, 'test'))
+
+    def test_is_running(self):
+        """ Stale supervisor pidfiles should be detected. """
+        pidfile = join(self.home, PIDFILE)
+        self.assertFalse(is_running(self.home))
+
+        with open(pidfile, 'w') as f:
+            f.write(str(getpid()))
+        self.assertTrue(is_running(self.home))
+
+        with open(pidfile, 'w') as f:
+            f.write('garbage')
+        self.assertFalse(is_running(self.home))
+
+    def test_refresh_in_deadline_order(self):
+        """ Many profiles are refreshed by one process in deadline order. """
+        thread = self.start(self.registration('slow', 2))
+        self.assertTrue(register(self.home, self.registration('fast', 0.5)))
+
+        reply = request(self.home, {'op': 'list'})
+        self.assertEqual(reply['profiles'], ['fast', 'slow'])
+        self.assertTrue(isfile(join(self.home, CONFIG_DIR, 'fast.pid')))
+
+        # The cache is saved after the credentials file
+        for _ in range(300):
+            if isfile(join(self.home, CACHE_DIR, 'slow.json')):
+                break
+            sleep(0.01)
+
+        roles = [c[1]['RoleArn']
+                 for c in self.client.assume_role_with_saml.call_args_list]
+        self.assertEqual(roles, ['role/fast', 'role/slow'])
+
+        credentials = self.read('credentials')
+        self.assertIn('[fast]\naws_access_key_id = role/fast\n', credentials)
+        self.assertIn('[slow]\naws_access_key_id = role/slow\n', credentials)
+
+        # The supervisor exits once every profile has logged out
+        self.assertTrue(deregister(self.home, 'fast'))
+        self.assertFalse(deregister(self.home, 'fast'))
+        self.assertTrue(thread.is_alive())
+        self.assertTrue(deregister(self.home, 'slow'))
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(isfile(join(self.home, CONFIG_DIR, 'fast.pid')))
+        self.assertIsNone(request(self.home, {'op': 'ping'}))
+
+    def test_refresh_many_profiles(self):
+        """ Every profile of a login profile is refreshed together. """
+        reg = self.registration('admin', 0.5)
+        reg.profiles['prod'] = Role('idp', 'role/prod')
+        self.start(reg)
+
+        for _ in range(300):
+            if isfile(join(self.home, CACHE_DIR, 'prod.json')):
+                break
+            sleep(0.01)
+
+        credentials = self.read('credentials')
+        self.assertIn('[admin]\naws_access_key_id = role/admin\n',
+                      credentials)
+        self.assertIn('[prod]\naws_access_key_id = role/prod\n', credentials)
+
+    def test_give_up_at_expiration(self):
+        """ Failed refreshes are retried until the credentials expire. """
+        self.refresh.side_effect = OSError('IdP is down')
+        clock = SimulatedClock(time())
+        scheduler = Scheduler(clock, Random(0))
+
+        reg = self.registration('test', 3600)
+        thread = self.start(reg, scheduler)
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertGreater(self.refresh.call_count, 10)
+        self.assertLess(clock.time(), reg.creds['Expiration'].timestamp())
+        self.client.assume_role_with_saml.assert_not_called()
+
+    def test_keepalive(self):
+        """ IdP sessions are kept alive between refreshes until their
+            lifetime ends. """
+        clock = SimulatedClock(time())
+        supervisor = Supervisor(self.home, lambda region: self.client,
+                                Scheduler(clock, Random(0)))
+        reg = self.registration('test', 3600)
+        reg.keepalive = True
+        reg.idp_session_timeout = 600
+        reg.idp_session_lifetime = 1800
+        reg.authenticated = clock.time()
+        supervisor.register(reg)
+        self.addCleanup(supervisor.deregister, 'test')
+
+        pings = []
+
+        async def keepalive():
+            while reg.deadline < reg.refresh_at:
+                self.assertIs(await supervisor._next(), reg)
+                await supervisor._keepalive(reg)
+                pings.append(round(clock.time() - reg.authenticated))
+
+        asyncio.run(keepalive())
+
+        self.assertEqual(pings, [300, 600, 900, 1200, 1500])
+        self.assertEqual(self.refresh.call_count, 5)
+        self.client.assume_role_with_saml.assert_not_called()
+
+        status = supervisor.dispatch({'op': 'status', 'name': 'test'})
+        end = datetime.fromtimestamp(reg.authenticated + 1800, timezone.utc)
+        self.assertTrue(status['ok'])
+        self.assertIsNone(status['status']['next_keepalive'])
+        self.assertEqual(status['status']['idp_session_end'], iso8601(end))
+
+    def test_status(self):
+        """ Only registered profiles have a status. """
+        self.start(self.registration('test', 3600))
+
+        status = request(self.home, {'op': 'status', 'name': 'test'})
+        self.assertTrue(status['ok'])
+        self.assertEqual(status['status']['role'], 'role/test')
+        self.assertFalse(status['status']['keepalive'])
+        self.assertIsNone(status['status']['idp_session_end'])
+
+        status = request(self.home, {'op': 'status', 'name': 'other'})
+        self.assertFalse(status['ok'])
+
+        # The status table is kept without asking the supervisor
+        table = join(self.home, TABLE)
+        [status] = read(table)
+        self.assertEqual(status.name, 'test')
+        self.assertEqual(status.pid, getpid())
+        self.assertEqual(status.role, 'role/test')
+
+        self.assertTrue(deregister(self.home, 'test'))
+        self.assertEqual(read(table), [])
+
+    def test_concurrent_refreshes(self):
+        """ A slow IdP delays neither other profiles nor the socket. """
+        idp = Event()
+        self.refresh.side_effect = lambda url, cookies: (
+            idp.wait(5), SamlResponse(SAML_SUCCESS, 'assertion', []))[1]
+
+        self.start(self.registration('p0', 0.1))
+        for i in range(1, 100):
+            self.supervisor.register(self.registration('p%d' % i, 0.1))
+
+        for _ in range(300):
+            if self.refresh.call_count == 16:
+                break
+            sleep(0.01)
+        self.assertEqual(self.refresh.call_count, 16)
+        self.assertTrue(request(self.home, {'op': 'ping'})['ok'])
+
+        # The cache is saved after the credentials file
+        idp.set()
+        for _ in range(500):
+            if len(listdir(join(self.home, CACHE_DIR))) == 100:
+                break
+            sleep(0.01)
+
+        self.assertEqual(self.client.assume_role_with_saml.call_count, 100)
+        self.assertIn('[p99]\naws_access_key_id = role/p99\n',
+                      self.read('credentials'))
+
+    def test_stop(self):
+        """ Stopping removes the credentials of logout_on_exit profiles. """
+        reg = self.registration('test', 0.5)
+        reg.logout_on_exit = True
+        reg.profiles['prod'] = Role('idp', 'role/prod')
+        thread = self.start(reg)
+        self.supervisor.register(self.registration('other', 0.5))
+
+        # Credentials are saved after every role has been assumed
+        for _ in range(300):
+            if len(listdir(join(self.home, CACHE_DIR))) == 3:
+                break
+            sleep(0.01)
+        self.assertTrue(isfile(join(self.home, CACHE_DIR, 'prod.json')))
+
+        self.supervisor.stop()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(request(self.home, {'op': 'ping'}))
+        self.assertFalse(isfile(join(self.home, CONFIG_DIR, 'test.pid')))
+        self.assertFalse(isfile(join(self.home, CACHE_DIR, 'prod.json')))
+        self.assertTrue(isfile(join(self.home, CACHE_DIR, 'other.json')))
+
+        credentials = self.read('credentials')
+        self.assertNotIn('role/test', credentials)
+        self.assertNotIn('role/prod', credentials)
+        self.assertIn('[other]\naws_access_key_id = role/other\n',
+                      credentials)
+
+    def test_deregister_during_refresh(self):
+        """ A refresh finishing after logout does not write credentials. """
+        assume = Event()
+        blocked = Event()
+
+        def assume_roles(*args, **kwargs):
+            blocked.set()
+            assume.wait(5)
+            return {'test': creds(3600, 'fresh')}, {}
+
+        patcher = patch('awscli_login.supervisor.assume_roles',
+                        side_effect=assume_roles)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.start(self.registration('test', 0.1))
+        self.supervisor.register(self.registration('other', 3600))
+        self.assertTrue(blocked.wait(5))
+
+        # As aws logout does
+        self.assertTrue(deregister(self.home, 'test'))
+        clear_credentials(join(self.home, 'credentials'), ['test'])
+
+        assume.set()
+        for _ in range(300):
+            if not self.supervisor._tasks:
+                break
+            sleep(0.01)
+
+        self.assertEqual(self.supervisor._tasks, {})
+        self.assertNotIn('fresh', self.read('credentials'))
+        self.assertFalse(isfile(join(self.home, CACHE_DIR, 'test.json')))
+
+    def test_register_while_stopping(self):
+        """ Profiles are not registered once shutdown has started. """
+        self.start(self.registration('test', 3600))
+        self.supervisor._stopping = True  # As _stop sets before awaiting
+        reg = self.registration('late', 3600)
+
+        reply = request(self.home, {'op': 'register',
+                                    'profile': reg.to_dict()})
+        self.assertFalse(reply['ok'])
+        self.assertTrue(reply['stopping'])
+        self.assertFalse(register(self.home, reg))
+        self.assertFalse(refresh_now(self.home, 'test'))
+        self.assertNotIn('late', self.supervisor._profiles)
+
+    def test_second_supervisor(self):
+        """ A second supervisor leaves the running one alone. """
+        self.start(self.registration('test', 3600))
+
+        Supervisor(self.home).run(self.registration('other', 3600))
+
+        self.assertEqual(request(self.home, {'op': 'list'})['profiles'],
+                         ['test'])
+        self.assertEqual([s.name for s in read(join(self.home, TABLE))],
+                         ['test'])
+
+    def test_start_lock(self):
+        """ Only one login at a time may start the supervisor. """
+        import fcntl
+
+        makedirs(join(self.home, CONFIG_DIR), exist_ok=True)
+        with StartLock(self.home):
+            with open(join(self.home, STARTLOCK)) as f:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with open(join(self.home, STARTLOCK)) as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_switch_role(self):
+        """ Roles are switched with the last assertion while valid. """
+        reg = self.registration('test', 3600)
+        reg.profiles['test'] = Role('idp', ADMIN)
+        reg.response = self.response('cached', 300)
+        self.start(reg)
+
+        self.assertTrue(switch_role(self.home, 'test', '*/ReadOnly'))
+        self.refresh.assert_not_called()
+        self.client.assume_role_with_saml.assert_called_once_with(
+            RoleArn=READONLY, PrincipalArn='idp', SAMLAssertion='cached')
+        self.assertIn('[test]\naws_access_key_id = %s\n' % READONLY,
+                      self.read('credentials'))
+        self.assertEqual(read(join(self.home, TABLE))[0].role, READONLY)
+
+        # Only a forced switch assumes the current role again
+        self.assertFalse(switch_role(self.home, 'test', READONLY))
+        self.assertTrue(switch_role(self.home, 'test', READONLY, True))
+        self.assertEqual(self.client.assume_role_with_saml.call_count, 2)
+
+        with self.assertRaises(SupervisorError):
+            switch_role(self.home, 'test', '*', True)
+        self.assertIsNone(switch_role(self.home, 'other', ADMIN))
+
+    def test_switch_role_expired(self):
+        """ An expired assertion is refreshed before switching. """
+        reg = self.registration('test', 3600)
+        reg.profiles['test'] = Role('idp', ADMIN)
+        reg.response = self.response('cached', 10)
+        self.refresh.return_value = self.response('fresh', 300)
+        self.start(reg)
+
+        self.assertTrue(switch_role(self.home, 'test', READONLY))
+        self.assertEqual(self.refresh.call_count, 1)
+        self.client.assume_role_with_saml.assert_called_once_with(
+            RoleArn=READONLY, PrincipalArn='idp', SAMLAssertion='fresh')
+
+        # A failed switch keeps the role and its schedule
+        refresh_at = reg.refresh_at
+        self.client.assume_role_with_saml.side_effect = OSError('denied')
+        with self.assertRaises(SupervisorError):
+            switch_role(self.home, 'test', ADMIN)
+        self.assertEqual(reg.role.arn, READONLY)
+        self.assertEqual(reg.refresh_at, refresh_at)
+        self.assertEqual(reg.retries, 0)
+
+    def test_refresh_now(self):
+        """ Profiles may be refreshed without waiting for the schedule. """
+        reg = self.registration('test', 3600)
+        self.start(reg)
+
+        self.assertTrue(refresh_now(self.home, 'test'))
+        self.assertEqual(self.refresh.call_count, 1)
+        self.assertIn('[test]\naws_access_key_id = role/test\n',
+                      self.read('credentials'))
+        self.assertFalse(refresh_now(self.home, 'other'))
+
+        self.refresh.side_effect = OSError('IdP is down')
+        with self.assertRaises(SupervisorError):
+            refresh_now(self.home, 'test')
+        self.assertEqual(reg.retries, 1)
+
+    def test_control(self):
+        """ The log level may be changed and the supervisor stopped. """
+        thread = self.start(self.registration('test', 3600))
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+
+        self.assertTrue(request(self.home, {'op': 'loglevel',
+                                            'level': 'debug'})['ok'])
+        self.assertEqual(root.level, logging.DEBUG)
+        self.assertFalse(request(self.home, {'op': 'loglevel',
+                                             'level': 'bogus'})['ok'])
+
+        self.assertTrue(request(self.home, {'op': 'stop'})['ok'])
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(isfile(join(self.home, CONFIG_DIR, 'test.pid')))
+
+    def test_unknown_operation(self):
+        """ Unknown requests should be rejected. """
+        supervisor = Supervisor(self.home, lambda region: self.client)
+
+        self.assertFalse(supervisor.dispatch({'op': 'bogus'})['ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import socket
+import unittest
+
+from http.cookiejar import LWPCookieJar
+from time import sleep
+from unittest.mock import patch
+
+from awscli_login.saml import saml_login
+from awscli_login.transport import DNSCache, close_all, get_transport
+
+from .stub_idp import CA, StubIdP
+
+
+class TransportTest(unittest.TestCase):
+    """ Tests for awscli_login.transport against a local IdP """
+
+    def setUp(self):
+        self.idp = StubIdP().start()
+        self.addCleanup(self.idp.stop)
+
+        close_all()
+        self.addCleanup(close_all)
+
+        patcher = patch.dict(os.environ, {'REQUESTS_CA_BUNDLE': CA})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, times: int) -> None:
+        jar = LWPCookieJar()
+        for _ in range(times):
+            saml_login(self.idp.url, jar)
+
+    def test_keep_alive(self):
+        """ Repeated logins reuse one connection and TLS handshake. """
+        self.login(5)
+
+        self.assertEqual(self.idp.requests, 5)
+        self.assertEqual(self.idp.connections, 1)
+        self.assertEqual(self.idp.handshakes, 1)
+
+    def test_tls_resumption(self):
+        """ Reconnecting after the IdP drops a connection resumes TLS. """
+        self.login(1)
+        self.idp.drop_connections()
+        sleep(0.1)
+        self.login(1)
+
+        self.assertEqual(self.idp.connections, 2)
+        self.assertEqual(self.idp.resumed, 1)
+
+    def test_get_transport(self):
+        """ Endpoints on the same host share a Transport. """
+        url = self.idp.url
+
+        self.assertIs(get_transport(url), get_transport(url + '/other'))
+        self.assertIsNot(get_transport(url),
+                         get_transport('https://example.com/ecp'))
+
+
+class DNSCacheTest(unittest.TestCase):
+    """ Tests for awscli_login.transport.DNSCache """
+
+    def setUp(self):
+        self.now = 0.0
+        self.dns = DNSCache(ttl=60, clock=lambda: self.now)
+
+        info = [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                 ('192.0.2.1', 443))]
+        patcher = patch('socket.getaddrinfo', return_value=info)
+        self.getaddrinfo = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ttl(self):
+        """ Lookups are cached until the TTL expires. """
+        for _ in range(3):
+            self.assertEqual(self.dns.resolve('idp', 443), '192.0.2.1')
+        self.assertEqual(self.getaddrinfo.call_count, 1)
+
+        self.now = 61
+        self.dns.resolve('idp', 443)
+        self.assertEqual(self.getaddrinfo.call_count, 2)
+
+    def test_forget(self):
+        """ Forgotten lookups are repeated. """
+        self.dns.resolve('idp', 443)
+        self.dns.forget('idp', 443)
+        self.dns.resolve('idp', 443)
+
+        self.assertEqual(self.getaddrinfo.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@ from unittest.mock import patch
 
 from botocore.session import Session
 
-from awscli_login.exceptions import SAML
+from awscli_login.exceptions import SAML, RoleNotFound
 from awscli_login.util import (
     get_selection,
     remove_credentials,
@@ -17,6 +17,8 @@ from awscli_login.util import (
 
 from .base import CleanAWSEnvironment
 
+EXPIRATION = datetime(2018, 4, 5, 16, 6, 50, tzinfo=timezone.utc)
+
 
 def token(akey: str, skey: str, stoken: str) -> Dict[str, Dict[str, Any]]:
     return {
@@ -24,7 +26,7 @@ def token(akey: str, skey: str, stoken: str) -> Dict[str, Dict[str, Any]]:
                                   'AccessKeyId': akey,
                                   'SecretAccessKey': skey,
                                   'SessionToken': stoken,
-                                  'Expiration': datetime.now(timezone.utc)
+                                  'Expiration': EXPIRATION
                               }
            }
 
@@ -67,6 +69,38 @@ class util(unittest.TestCase):
 
         self.assertEqual(get_selection(roles), roles[1])
 
+    @patch('builtins.input')
+    def test_get_selection_by_arn(self, mock_input):
+        """ A known role ARN is selected without prompting. """
+        roles = [
+            ('idp1', 'arn:aws:iam::224588347132:role/KalturaAdmin'),
+            ('idp2', 'arn:aws:iam::617683844790:role/BoxAdmin'),
+        ]
+
+        self.assertEqual(get_selection(roles, roles[1][1]), roles[1])
+        with self.assertRaises(RoleNotFound):
+            get_selection(roles, 'arn:aws:iam::617683844790:role/Nope')
+        mock_input.assert_not_called()
+
+    @patch('builtins.input', return_value=0)
+    @patch('sys.stdout', new=StringIO())
+    def test_get_selection_by_pattern(self, mock_input):
+        """ A pattern narrows the roles to choose from. """
+        roles = [
+            ('idp1', 'arn:aws:iam::224588347132:role/KalturaAdmin'),
+            ('idp2', 'arn:aws:iam::617683844790:role/BoxAdmin'),
+            ('idp2', 'arn:aws:iam::617683844790:role/ReadOnly'),
+        ]
+
+        self.assertEqual(get_selection(roles, '*:role/Read*'), roles[2])
+        mock_input.assert_not_called()
+
+        self.assertEqual(get_selection(roles, '*:617683844790:*'), roles[1])
+        mock_input.assert_called_once()
+
+        with self.assertRaises(RoleNotFound):
+            get_selection(roles, '*:role/Nope')
+
     def test_get_empty_selection(self, *args):
         """ Attempt to select from an empty role set """
         with self.assertRaises(SAML):
@@ -104,6 +138,7 @@ class SaveDefaultCreds(CleanAWSEnvironment):
 aws_access_key_id = foo
 aws_secret_access_key = bar
 aws_session_token = yep
+aws_session_expiration = 2018-04-05T16:06:50Z
 """
 
         session = Session()
@@ -117,6 +152,7 @@ aws_session_token = yep
 aws_access_key_id = a
 aws_secret_access_key = b
 aws_session_token = c
+aws_session_expiration = 2018-04-05T16:06:50Z
 """
 
         session = Session()
@@ -136,7 +172,8 @@ aws_session_token = yep
         credentials = "\n[default]\n" \
                       "aws_access_key_id = \n" \
                       "aws_secret_access_key = \n" \
-                      "aws_session_token = \n"
+                      "aws_session_token = \n" \
+                      "aws_session_expiration = \n"
 
         session = Session()
         remove_credentials(session)
@@ -175,6 +212,7 @@ aws_session_token = 789
 aws_access_key_id = a
 aws_secret_access_key = b
 aws_session_token = c
+aws_session_expiration = 2018-04-05T16:06:50Z
 """
         session = Session()
         save_credentials(session, token('a', 'b', 'c'))
@@ -188,7 +226,8 @@ aws_session_token = c
         credentials += "\n[foo]\n" \
                        "aws_access_key_id = \n" \
                        "aws_secret_access_key = \n" \
-                       "aws_session_token = \n"
+                       "aws_session_token = \n" \
+                       "aws_session_expiration = \n"
 
         self.aws_credentials += """
 [foo]